@@ -2,11 +2,10 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
-import json
+import logging
 import os
 import random
 from datetime import datetime
-from pathlib import Path
 from typing import Dict
 
 import pytz
@@ -17,6 +16,20 @@ from telegram.ext import (
     CallbackQueryHandler, MessageHandler, filters
 )
 
+import file_io
+from chat_cache import ChatCache
+from chat_state import ChatState
+from loop_monitor import LoopMonitor
+from notifications import (
+    ChatUnavailable, NotificationLedger, NotificationState, deliver_pending, is_chat_unavailable, late_prefix
+)
+from outbound import create_rate_limiter, create_request
+from scheduler import DailyScheduler
+from structured_log import setup_logging
+from tracing import trace_handlers
+
+logger = logging.getLogger(__name__)
+
 # Загружаем переменные окружения
 load_dotenv()
 
@@ -26,19 +39,33 @@ class BirthdayBot:
         self.timezone = pytz.timezone(os.getenv('TIMEZONE', 'Europe/Moscow'))
         self.birthdays_file = 'birthdays.json'
         self.weddings_file = 'weddings.json'
-        self.admin_chats = set()
+        # Чаты с уведомлениями и отслеживанием сохраняются между перезапусками
+        self.chat_state = ChatState('chat_state.json')
+        self.admin_chats = self.chat_state.admin_chats
         self.application = None
-        self.scheduler_running = False
+        # Отметки отправленных уведомлений для догоняющего прохода
+        self.notification_state = NotificationState('notifications_state.json')
+        # Журнал отправок: одно поздравление не уходит дважды даже при нескольких экземплярах
+        self.notification_ledger = NotificationLedger('notifications_ledger.db')
+        # Ежедневные уведомления в полночь в цикле событий бота, при запуске - догоняющий проход
+        self.scheduler = DailyScheduler(self.timezone)
+        self.scheduler.add_daily_job(self.check_and_send_notifications, '00:00', name='notifications', run_on_start=True)
+        # Контроль задержек цикла событий (метрики, в отладке - стек блокирующего вызова)
+        self.loop_monitor = LoopMonitor()
         
         # ID группы "Красавчики 2.0" для автоматической настройки
-        self.target_group_id = None  # Будет определен автоматически
+        # chat_state.target_group_id определяется автоматически
         self.target_group_name = "Красавчики 2.0"
         
         # Пользователь с правами администратора для удаления сообщений бота
         self.admin_username = "dmitru_pv"  # Пользователь dmitru_pv может удалять сообщения бота
         
         # Кэш для хранения ID сообщений бота для возможности удаления
-        self.bot_messages_cache = {}  # {chat_id: [message_ids...]}
+        # {chat_id: message_id}, ограничен по чатам и в целом
+        self.bot_messages_cache = ChatCache(
+            per_chat=int(os.getenv('BOT_MESSAGES_PER_CHAT', '100')),
+            max_items=int(os.getenv('BOT_MESSAGES_MAX', '5000'))
+        )
         
         # Шаблоны поздравлений с днем рождения
         self.congratulations = [
@@ -58,43 +85,35 @@ class BirthdayBot:
             "✨ Поздравляем {names} с годовщиной свадьбы! {years} лет счастья позади, впереди еще больше прекрасных моментов! 🎉"
         ]
     
-    def load_birthdays(self) -> Dict:
-        """Загружает дни рождения из файла"""
+    async def load_birthdays(self) -> Dict:
+        """Загружает дни рождения из файла (в пуле ввода-вывода)"""
         try:
-            if Path(self.birthdays_file).exists():
-                with open(self.birthdays_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return {}
+            return await file_io.read_json(self.birthdays_file)
         except Exception as e:
-            print(f"Ошибка загрузки файла дней рождения: {e}")
+            logger.error("Ошибка загрузки файла дней рождения: %s", e)
             return {}
     
     def save_birthdays(self, birthdays: Dict):
-        """Сохраняет дни рождения в файл"""
+        """Сохраняет дни рождения в файл (запись в фоне, по порядку)"""
         try:
-            with open(self.birthdays_file, 'w', encoding='utf-8') as f:
-                json.dump(birthdays, f, ensure_ascii=False, indent=2)
+            file_io.write_json(self.birthdays_file, birthdays)
         except Exception as e:
-            print(f"Ошибка сохранения файла дней рождения: {e}")
+            logger.error("Ошибка сохранения файла дней рождения: %s", e)
     
-    def load_weddings(self) -> Dict:
-        """Загружает даты свадеб из файла"""
+    async def load_weddings(self) -> Dict:
+        """Загружает даты свадеб из файла (в пуле ввода-вывода)"""
         try:
-            if Path(self.weddings_file).exists():
-                with open(self.weddings_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return {}
+            return await file_io.read_json(self.weddings_file)
         except Exception as e:
-            print(f"Ошибка загрузки файла свадеб: {e}")
+            logger.error("Ошибка загрузки файла свадеб: %s", e)
             return {}
     
     def save_weddings(self, weddings: Dict):
-        """Сохраняет даты свадеб в файл"""
+        """Сохраняет даты свадеб в файл (запись в фоне, по порядку)"""
         try:
-            with open(self.weddings_file, 'w', encoding='utf-8') as f:
-                json.dump(weddings, f, ensure_ascii=False, indent=2)
+            file_io.write_json(self.weddings_file, weddings)
         except Exception as e:
-            print(f"Ошибка сохранения файла свадеб: {e}")
+            logger.error("Ошибка сохранения файла свадеб: %s", e)
     
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /start"""
@@ -138,14 +157,14 @@ class BirthdayBot:
             self.target_group_name.lower() in chat.title.lower()):
             
             chat_id = chat.id
-            self.target_group_id = chat_id
+            self.chat_state.target_group_id = chat_id
             
             # Автоматически включаем все функции
             self.admin_chats.add(chat_id)
             
             # Подсчитываем реальное количество записей в базе
-            birthdays = self.load_birthdays()
-            weddings = self.load_weddings()
+            birthdays = await self.load_birthdays()
+            weddings = await self.load_weddings()
             
             birthdays_count = sum(len(chat_birthdays) for chat_birthdays in birthdays.values())
             weddings_count = sum(len(chat_weddings) for chat_weddings in weddings.values())
@@ -180,9 +199,9 @@ class BirthdayBot:
             
             try:
                 await context.bot.send_message(chat_id=chat_id, text=welcome_message)
-                print(f"🎯 Автонастройка группы '{chat.title}' (ID: {chat_id}) завершена")
+                logger.info("🎯 Автонастройка группы '%s' (ID: %s) завершена", chat.title, chat_id)
             except Exception as e:
-                print(f"Ошибка отправки приветствия в группу: {e}")
+                logger.error("Ошибка отправки приветствия в группу: %s", e)
             
             return True
         
@@ -212,7 +231,7 @@ class BirthdayBot:
             if not (1 <= day <= 31 and 1 <= month <= 12):
                 raise ValueError("Некорректная дата")
             
-            birthdays = self.load_birthdays()
+            birthdays = await self.load_birthdays()
             chat_id = str(update.effective_chat.id)
             
             if chat_id not in birthdays:
@@ -233,7 +252,7 @@ class BirthdayBot:
     
     async def list_birthdays(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /list для показа всех дней рождения"""
-        birthdays = self.load_birthdays()
+        birthdays = await self.load_birthdays()
         chat_id = str(update.effective_chat.id)
         
         if chat_id not in birthdays or not birthdays[chat_id]:
@@ -258,7 +277,7 @@ class BirthdayBot:
     async def today_birthdays(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /today для проверки именинников сегодня"""
         today = datetime.now(self.timezone)
-        birthdays = self.load_birthdays()
+        birthdays = await self.load_birthdays()
         chat_id = str(update.effective_chat.id)
         
         if chat_id not in birthdays:
@@ -349,7 +368,7 @@ class BirthdayBot:
             message = await update.message.reply_text(info_text)
             self.cache_bot_message(chat_id, message.message_id)
         except Exception as e:
-            print(f"Ошибка отправки информации о чате: {e}")
+            logger.error("Ошибка отправки информации о чате: %s", e)
     
     def is_admin_user(self, user) -> bool:
         """Проверяет, является ли пользователь администратором"""
@@ -359,14 +378,8 @@ class BirthdayBot:
     
     def cache_bot_message(self, chat_id: int, message_id: int):
         """Кэширует ID сообщения бота для возможности удаления"""
-        if chat_id not in self.bot_messages_cache:
-            self.bot_messages_cache[chat_id] = []
-        
-        self.bot_messages_cache[chat_id].append(message_id)
-        
-        # Ограничиваем размер кэша (храним только последние 100 сообщений на чат)
-        if len(self.bot_messages_cache[chat_id]) > 100:
-            self.bot_messages_cache[chat_id] = self.bot_messages_cache[chat_id][-100:]
+        # Кэш сам ограничивает размер (последние BOT_MESSAGES_PER_CHAT сообщений на чат)
+        self.bot_messages_cache.add(chat_id, message_id)
     
     async def send_cached_message(self, chat_id: int, text: str, **kwargs):
         """Отправляет сообщение и кэширует его ID"""
@@ -376,7 +389,7 @@ class BirthdayBot:
                 self.cache_bot_message(chat_id, message.message_id)
                 return message
         except Exception as e:
-            print(f"Ошибка отправки кэшированного сообщения: {e}")
+            logger.error("Ошибка отправки кэшированного сообщения: %s", e)
             return None
     
     async def delete_bot_messages(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -387,44 +400,42 @@ class BirthdayBot:
         
         chat_id = update.effective_chat.id
         
-        if chat_id not in self.bot_messages_cache or not self.bot_messages_cache[chat_id]:
+        cached_ids = self.bot_messages_cache.last(chat_id, self.bot_messages_cache.count(chat_id))
+        if not cached_ids:
             await update.message.reply_text("📝 Нет сообщений бота для удаления в этом чате!")
             return
         
-        deleted_count = 0
-        failed_count = 0
-        
-        # Пытаемся удалить все кэшированные сообщения бота
-        for message_id in self.bot_messages_cache[chat_id][:]:  # Копируем список для итерации
+        async def delete(message_id: int) -> bool:
             try:
                 await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
-                deleted_count += 1
                 # Удаляем из кэша успешно удаленные сообщения
-                self.bot_messages_cache[chat_id].remove(message_id)
-                
-                # Небольшая задержка чтобы избежать лимитов API
-                await asyncio.sleep(0.1)
-                
+                self.bot_messages_cache.discard(chat_id, message_id)
+                return True
             except Exception as e:
-                failed_count += 1
                 # Если сообщение не найдено, удаляем его из кэша
                 if "message to delete not found" in str(e).lower():
-                    if message_id in self.bot_messages_cache[chat_id]:
-                        self.bot_messages_cache[chat_id].remove(message_id)
+                    self.bot_messages_cache.discard(chat_id, message_id)
+                return False
+        
+        # Удаляем все кэшированные сообщения бота параллельно,
+        # скорость запросов ограничивает лимитер бота (outbound.py)
+        results = await asyncio.gather(*(delete(message_id) for message_id in cached_ids))
+        deleted_count = sum(results)
+        failed_count = len(results) - deleted_count
         
         # Отправляем отчет о результатах
         result_text = f"🗑️ **Операция завершена!**\n\n"
         result_text += f"✅ Удалено сообщений: {deleted_count}\n"
         if failed_count > 0:
             result_text += f"❌ Не удалось удалить: {failed_count}\n"
-        result_text += f"📊 Осталось в кэше: {len(self.bot_messages_cache.get(chat_id, []))}"
+        result_text += f"📊 Осталось в кэше: {self.bot_messages_cache.count(chat_id)}"
         
         # Это сообщение тоже нужно кэшировать
         try:
             message = await update.message.reply_text(result_text)
             self.cache_bot_message(chat_id, message.message_id)
         except Exception as e:
-            print(f"Ошибка отправки отчета об удалении: {e}")
+            logger.error("Ошибка отправки отчета об удалении: %s", e)
     
     async def handle_reply_to_bot(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик реплаев на сообщения бота для их удаления"""
@@ -454,13 +465,12 @@ class BirthdayBot:
             await context.bot.delete_message(chat_id=chat_id, message_id=user_message_id)
             
             # Убираем из кэша
-            if chat_id in self.bot_messages_cache and message_id_to_delete in self.bot_messages_cache[chat_id]:
-                self.bot_messages_cache[chat_id].remove(message_id_to_delete)
+            self.bot_messages_cache.discard(chat_id, message_id_to_delete)
             
-            print(f"🗑️ Администратор удалил сообщение бота {message_id_to_delete} в чате {chat_id}")
+            logger.info("🗑️ Администратор удалил сообщение бота %s в чате %s", message_id_to_delete, chat_id)
             
         except Exception as e:
-            print(f"❌ Ошибка удаления сообщения по реплаю: {e}")
+            logger.error("❌ Ошибка удаления сообщения по реплаю: %s", e)
             # Если не удалось удалить - отправляем сообщение об ошибке
             try:
                 error_message = await update.message.reply_text(
@@ -472,107 +482,87 @@ class BirthdayBot:
                 pass
     
     async def check_and_send_notifications(self):
-        """Проверяет и отправляет уведомления о днях рождения и годовщинах"""
-        today = datetime.now(self.timezone)
-        
-        # Загружаем данные
-        birthdays = self.load_birthdays()
-        weddings = self.load_weddings()
-        
-        # Определяем чаты для отправки уведомлений
-        target_chats = list(self.admin_chats)
+        """Отправляет уведомления за сегодня и за пропущенные дни (догоняющий проход)"""
+        if not self.application:
+            return
         
-        for chat_id in target_chats:
-            # Проверяем дни рождения
-            chat_birthdays = birthdays.get(str(chat_id), {})
-            today_celebrants = []
-            for name, data in chat_birthdays.items():
-                if data['day'] == today.day and data['month'] == today.month:
-                    today_celebrants.append(name)
-            
-            # Отправляем поздравления с днями рождения
-            if today_celebrants:
-                for name in today_celebrants:
-                    congratulation = random.choice(self.congratulations).format(name=name)
-                    try:
-                        await self.send_cached_message(
-                            chat_id,
-                            f"🎉 Напоминание о дне рождения!\n\n{congratulation}"
-                        )
-                        await asyncio.sleep(1)  # Небольшая задержка между сообщениями
-                    except Exception as e:
-                        print(f"Ошибка отправки уведомления о ДР в чат {chat_id}: {e}")
-                        # Удаляем недоступный чат из списка
-                        if chat_id in self.admin_chats:
-                            self.admin_chats.discard(chat_id)
-            
-            # Проверяем годовщины свадеб  
-            chat_weddings = weddings.get(str(chat_id), {})
-            today_anniversaries = []
-            for couple, data in chat_weddings.items():
-                if data['day'] == today.day and data['month'] == today.month:
-                    years_together = today.year - data['year']
-                    today_anniversaries.append((couple, years_together))
-            
-            # Отправляем поздравления с годовщинами
-            if today_anniversaries:
-                for couple, years in today_anniversaries:
-                    congratulation = random.choice(self.wedding_congratulations).format(
-                        names=couple, years=years
-                    )
-                    try:
-                        await self.send_cached_message(
-                            chat_id,
-                            f"💒 Напоминание о годовщине свадьбы!\n\n{congratulation}"
-                        )
-                        await asyncio.sleep(1)  # Небольшая задержка между сообщениями
-                    except Exception as e:
-                        print(f"Ошибка отправки уведомления о годовщине в чат {chat_id}: {e}")
-                        # Удаляем недоступный чат из списка
-                        if chat_id in self.admin_chats:
-                            self.admin_chats.discard(chat_id)
+        today = datetime.now(self.timezone).date()
+        await deliver_pending(self.notification_state, self.admin_chats, today, self.send_day_notifications,
+                              on_unavailable=self.admin_chats.discard)
     
-    async def notification_scheduler(self):
-        """Планировщик уведомлений"""
-        last_notification_check = 0  # Время последней проверки уведомлений
+    async def send_day_notifications(self, chat_id: int, day, delay: int) -> bool:
+        """Отправляет поздравления чата с днями рождения и годовщинами за указанный день; True - все отправлены"""
+        prefix = late_prefix(delay, day)
+        
+        async def send(text: str):
+            # Ошибка Telegram нужна целиком: по ней видно, доступен ли еще чат
+            message = await self.application.bot.send_message(chat_id=chat_id, text=text)
+            self.cache_bot_message(chat_id, message.message_id)
         
-        while self.scheduler_running:
+        # Проверяем дни рождения
+        event_ids = []
+        chat_birthdays = (await self.load_birthdays()).get(str(chat_id), {})
+        for name, data in chat_birthdays.items():
+            if data['day'] != day.day or data['month'] != day.month:
+                continue
+            event_id = NotificationLedger.event_id('birthdays', name)
+            event_ids.append(event_id)
+            congratulation = random.choice(self.congratulations).format(name=name)
+            text = f"{prefix}🎉 Напоминание о дне рождения!\n\n{congratulation}"
             try:
-                now = datetime.now(self.timezone)
-                current_timestamp = now.timestamp()
-                
-                # Проверяем, если сейчас 00:00 (полночь) и не проверяли в последнюю минуту
-                if now.hour == 0 and now.minute == 0 and (current_timestamp - last_notification_check) > 60:
-                    print(f"🔔 Отправка уведомлений в полночь: {now.strftime('%H:%M:%S')}")
-                    await self.check_and_send_notifications()
-                    last_notification_check = current_timestamp
-                
-                # Ждем 30 секунд до следующей проверки
-                await asyncio.sleep(30)
-                    
+                # Ledger не даст отправить то же поздравление повторно
+                await self.notification_ledger.send_once(
+                    chat_id, event_id, day,
+                    lambda: send(text)
+                )
             except Exception as e:
-                print(f"❌ Ошибка в планировщике: {e}")
-                await asyncio.sleep(30)
-
-    def start_scheduler(self):
-        """Запускает планировщик в отдельном потоке"""
-        if not self.scheduler_running:
-            self.scheduler_running = True
-            import threading
-            scheduler_thread = threading.Thread(target=self.run_scheduler)
-            scheduler_thread.daemon = True
-            scheduler_thread.start()
-            print("🔔 Планировщик уведомлений запущен (00:00)")
+                if is_chat_unavailable(e):
+                    # Бот удален из чата или чат не найден - deliver_pending уберет чат из списка
+                    raise ChatUnavailable(chat_id) from e
+                # Временная ошибка: чат остается, день повторится при следующем проходе
+                logger.error("Ошибка отправки уведомления о ДР в чат %s: %s", chat_id, e)
+        
+        # Проверяем годовщины свадеб
+        chat_weddings = (await self.load_weddings()).get(str(chat_id), {})
+        for couple, data in chat_weddings.items():
+            if data['day'] != day.day or data['month'] != day.month:
+                continue
+            event_id = NotificationLedger.event_id('weddings', couple)
+            event_ids.append(event_id)
+            congratulation = random.choice(self.wedding_congratulations).format(
+                names=couple, years=day.year - data['year']
+            )
+            text = f"{prefix}💒 Напоминание о годовщине свадьбы!\n\n{congratulation}"
+            try:
+                await self.notification_ledger.send_once(
+                    chat_id, event_id, day,
+                    lambda: send(text)
+                )
+            except Exception as e:
+                if is_chat_unavailable(e):
+                    # Бот удален из чата или чат не найден - deliver_pending уберет чат из списка
+                    raise ChatUnavailable(chat_id) from e
+                # Временная ошибка: чат остается, день повторится при следующем проходе
+                logger.error("Ошибка отправки уведомления о годовщине в чат %s: %s", chat_id, e)
+        
+        # День обработан, только если все поздравления подтверждены в журнале отправок
+        return self.notification_ledger.all_sent(chat_id, event_ids, day)
+    
+    async def post_init(self, application: Application):
+        """Запускает планировщик уведомлений в цикле событий приложения"""
+        self.scheduler.start()
+        self.loop_monitor.start()
     
-    def run_scheduler(self):
-        """Запускает асинхронный планировщик в отдельном потоке"""
-        import asyncio
-        asyncio.run(self.notification_scheduler())
+    async def post_shutdown(self, application: Application):
+        """Останавливает планировщик и дописывает файлы данных при завершении"""
+        await self.scheduler.stop()
+        await self.loop_monitor.stop()
+        await file_io.drain()
     
     def run(self):
         """Запускает бота"""
         if not self.bot_token:
-            print("❌ Ошибка: BOT_TOKEN не найден!")
+            logger.error("❌ Ошибка: BOT_TOKEN не найден!")
             return
         
         # Настраиваем Application
@@ -580,6 +570,10 @@ class BirthdayBot:
         
         builder = ApplicationBuilder()
         builder.token(self.bot_token)
+        builder.request(create_request())
+        builder.rate_limiter(create_rate_limiter())
+        builder.post_init(self.post_init)
+        builder.post_shutdown(self.post_shutdown)
         self.application = builder.build()
         
         # Основные команды
@@ -602,14 +596,13 @@ class BirthdayBot:
         
         # Обработчик для реплаев на сообщения бота (для удаления)
         self.application.add_handler(MessageHandler(filters.REPLY & filters.TEXT, self.handle_reply_to_bot))
+        # Замер времени обработчиков (метрики и журнал медленных обработчиков)
+        trace_handlers(self.application)
         
-        print("🤖 Бот для дней рождения и свадеб запущен!")
-        print("🕛 Уведомления о днях рождения: каждый день в 00:00")
-        print("💒 Поддержка свадеб: ВКЛ")
-        print(f"🗑️ Управление сообщениями: доступно для @{self.admin_username}")
-        
-        # Запускаем планировщик в отдельном потоке
-        self.start_scheduler()
+        logger.info("🤖 Бот для дней рождения и свадеб запущен!")
+        logger.info("🕛 Уведомления о днях рождения: каждый день в 00:00")
+        logger.info("💒 Поддержка свадеб: ВКЛ")
+        logger.info("🗑️ Управление сообщениями: доступно для @%s", self.admin_username)
         
         self.application.run_polling()
 
@@ -633,7 +626,7 @@ class BirthdayBot:
             if not (1 <= day <= 31 and 1 <= month <= 12 and year >= 1900):
                 raise ValueError("Некорректная дата")
             
-            weddings = self.load_weddings()
+            weddings = await self.load_weddings()
             chat_id = str(update.effective_chat.id)
             
             if chat_id not in weddings:
@@ -660,7 +653,7 @@ class BirthdayBot:
 
     async def list_weddings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /list_weddings для показа всех свадеб"""
-        weddings = self.load_weddings()
+        weddings = await self.load_weddings()
         chat_id = str(update.effective_chat.id)
         
         if chat_id not in weddings or not weddings[chat_id]:
@@ -683,7 +676,7 @@ class BirthdayBot:
     async def today_weddings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /today_weddings для проверки годовщин сегодня"""
         today = datetime.now(self.timezone)
-        weddings = self.load_weddings()
+        weddings = await self.load_weddings()
         chat_id = str(update.effective_chat.id)
         
         if chat_id not in weddings:
@@ -711,7 +704,7 @@ class BirthdayBot:
     async def upcoming_weddings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /upcoming_weddings для показа ближайших годовщин"""
         today = datetime.now(self.timezone)
-        weddings = self.load_weddings()
+        weddings = await self.load_weddings()
         chat_id = str(update.effective_chat.id)
         
         if chat_id not in weddings or not weddings[chat_id]:
@@ -760,5 +753,6 @@ class BirthdayBot:
         await update.message.reply_text(text)
 
 if __name__ == "__main__":
+    setup_logging()
     bot = BirthdayBot()
     bot.run() 
\ No newline at end of file
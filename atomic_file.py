@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Атомарная запись файлов данных с проверкой целостности.
+
+Запись: данные пишутся во временный файл, сбрасываются на диск (fsync)
+и переименовываются поверх старого файла, поэтому сбой посреди записи
+не оставляет обрезанный файл. Рядом лежит контрольная сумма
+(birthdays.json.sha256, формат sha256sum), а предыдущая проверенная
+версия сохраняется как birthdays.json.bak.
+
+Чтение: если файл не совпадает с контрольной суммой или не разбирается,
+данные берутся из .bak и файл восстанавливается из него. Если целой
+копии нет, испорченный файл переименовывается в *.corrupt-ГГГГММДД_ЧЧММСС
+(а не перезаписывается пустым) и выбрасывается CorruptFileError.
+"""
+
+import hashlib
+import logging
+import os
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CorruptFileError(ValueError):
+    """Файл поврежден и целой резервной копии нет"""
+
+
+def checksum_path(path) -> str:
+    return f"{path}.sha256"
+
+
+def backup_path(path) -> str:
+    return f"{path}.bak"
+
+
+def _fsync_dir(path):
+    """Сбрасывает на диск запись каталога (переименование файла)"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return  # Windows не умеет открывать каталоги
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def replace_file(path: str, data: bytes):
+    """Пишет файл через временный файл и fsync, затем переименовывает"""
+    tmp = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _read_checksum(path) -> Optional[str]:
+    try:
+        with open(checksum_path(path), 'r', encoding='utf-8') as f:
+            return f.read().split()[0]
+    except (OSError, IndexError):
+        return None
+
+
+def _verified_bytes(path) -> Optional[bytes]:
+    """Содержимое файла, если оно совпадает с контрольной суммой (или суммы нет)"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    expected = _read_checksum(path)
+    if expected is not None and hashlib.sha256(data).hexdigest() != expected:
+        return None
+    return data
+
+
+def write_atomic(path, data: bytes, keep_backup: bool = True):
+    """Атомарно заменяет файл; предыдущая целая версия остается в .bak"""
+    path = os.fspath(path)
+    checksum = checksum_path(path)
+
+    if keep_backup and os.path.exists(path) and _verified_bytes(path) is not None:
+        os.replace(path, backup_path(path))
+        if os.path.exists(checksum):
+            os.replace(checksum, checksum_path(backup_path(path)))
+    elif os.path.exists(checksum):
+        # Старая сумма не должна оказаться рядом с новым файлом
+        os.remove(checksum)
+
+    replace_file(path, data)
+    digest = hashlib.sha256(data).hexdigest()
+    replace_file(checksum, f"{digest}  {os.path.basename(path)}\n".encode('utf-8'))
+    _fsync_dir(path)
+
+
+def read_verified(path, parse: Callable[[bytes], Any]) -> Any:
+    """Читает и разбирает файл, при повреждении - из резервной копии.
+
+    FileNotFoundError - нет ни файла, ни копии; CorruptFileError - целой копии нет.
+    """
+    path = os.fspath(path)
+    backup = backup_path(path)
+    if not os.path.exists(path) and not os.path.exists(backup):
+        raise FileNotFoundError(path)
+
+    for candidate in (path, backup):
+        data = _verified_bytes(candidate)
+        if data is None:
+            continue
+        try:
+            result = parse(data)
+        except ValueError:
+            continue
+
+        if candidate == backup:
+            logger.warning("⚠️ Файл %s поврежден или отсутствует, данные восстановлены из %s", path, backup)
+            _set_aside(path)
+            write_atomic(path, data, keep_backup=False)
+        return result
+
+    corrupt = _set_aside(path)
+    raise CorruptFileError(f"файл {path} поврежден, целой копии нет" + (f" (сохранен как {corrupt})" if corrupt else ""))
+
+
+def _set_aside(path: str) -> Optional[str]:
+    """Переименовывает испорченный файл, чтобы его не перезаписали"""
+    if not os.path.exists(path):
+        return None
+    corrupt = f"{path}.corrupt-{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    os.replace(path, corrupt)
+    if os.path.exists(checksum_path(path)):
+        os.remove(checksum_path(path))
+    return corrupt
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сравнение скорости JSON: прежняя запись (стандартный json, indent=2)
+и кодек codec.py (orjson, если установлен, компактный вывод).
+
+Запуск:
+    python benchmark_codec.py
+    python benchmark_codec.py --repeat 500 messages_log.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import timeit
+
+import codec
+
+
+def measure(func, repeat: int) -> float:
+    """Лучшее время одного вызова в микросекундах"""
+    return min(timeit.repeat(func, number=1, repeat=repeat)) * 1e6
+
+
+def benchmark(path: str, repeat: int):
+    with open(path, 'rb') as f:
+        raw = f.read()
+    data = json.loads(raw)
+    compact = codec.dumps(data)
+    pretty = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+    rows = [
+        ('чтение', measure(lambda: json.loads(pretty), repeat), measure(lambda: codec.loads(compact), repeat)),
+        ('запись', measure(lambda: json.dumps(data, ensure_ascii=False, indent=2), repeat),
+         measure(lambda: codec.dumps(data), repeat)),
+    ]
+
+    print(f"\n📄 {os.path.basename(path)}: {len(pretty)} байт с отступами, {len(compact)} компактно")
+    for name, before, after in rows:
+        print(f"  {name:8} json+indent {before:9.1f} мкс | {codec.BACKEND:6} {after:9.1f} мкс | x{before / after:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение скорости JSON-кодеков на файлах бота')
+    parser.add_argument('files', nargs='*', help='Файлы JSON (по умолчанию messages_log.json и birthdays_backup_*.json)')
+    parser.add_argument('--repeat', type=int, default=200, help='Количество повторов (берется лучшее время)')
+    args = parser.parse_args()
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    files = args.files or (
+        [os.path.join(current_dir, 'messages_log.json')]
+        + sorted(glob.glob(os.path.join(current_dir, 'birthdays_backup_*.json')))
+    )
+
+    print(f"🔧 Кодек: {codec.BACKEND}")
+    for path in files:
+        if os.path.exists(path):
+            benchmark(path, args.repeat)
+        else:
+            print(f"\n⚠️ Файл не найден: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,12 +14,10 @@
 """
 
 import asyncio
-import json
+import logging
 import os
 import random
 from datetime import datetime
-from pathlib import Path
-from typing import Dict
 
 import pytz
 from dotenv import load_dotenv
@@ -30,6 +28,24 @@ from telegram.ext import (
     ChatMemberHandler
 )
 
+from chat_cache import ChatCache
+from chat_state import ChatState
+from loop_monitor import LoopMonitor
+from notifications import (
+    DIGEST, INDIVIDUAL, NOTIFY_MODES, ChatUnavailable, NotificationLedger, NotificationModes, NotificationState,
+    deliver_pending, is_chat_unavailable, late_prefix, send_digest
+)
+from outbound import create_rate_limiter, create_request
+from records import MessageRecord
+from scheduler import DailyScheduler
+from snapshots import SnapshotManager
+from store import BIRTHDAYS, WEDDINGS, create_storage
+from structured_log import setup_logging
+from tracing import trace_handlers
+from webhook_server import serve_webhook
+
+logger = logging.getLogger(__name__)
+
 # Загружаем переменные окружения
 load_dotenv()
 
@@ -42,15 +58,37 @@ class UniversalBot:
         self.birthdays_file = 'birthdays.json'
         self.weddings_file = 'weddings.json'
         self.messages_log_file = 'messages_log.json'
+        self.messages_log_dir = 'messages_log'
+        
+        # Хранилище данных (JSON в памяти или SQLite, см. STORAGE_BACKEND)
+        self.storage = create_storage(
+            self.birthdays_file,
+            self.weddings_file,
+            messages_log_file=self.messages_log_file,
+            messages_log_dir=self.messages_log_dir
+        )
+        # Автоматические снимки данных (восстановление - /restore)
+        self.snapshots = SnapshotManager(self.storage, 'snapshots')
         
         # Настройки системы
-        self.admin_chats = set()
-        self.alarm_enabled_chats = set()
+        # Чаты с уведомлениями и отслеживанием сохраняются между перезапусками
+        self.chat_state = ChatState('chat_state.json')
+        self.admin_chats = self.chat_state.admin_chats
+        self.alarm_enabled_chats = self.chat_state.alarm_enabled_chats
         self.application = None
-        self.scheduler_running = False
-        
-        # Группа "Красавчики 2.0" для автонастройки
-        self.target_group_id = None
+        # Отметки отправленных уведомлений для догоняющего прохода
+        self.notification_state = NotificationState('notifications_state.json')
+        # Журнал отправок: одно поздравление не уходит дважды даже при нескольких экземплярах
+        self.notification_ledger = NotificationLedger('notifications_ledger.db')
+        # Режим уведомлений чатов: дайджест или отдельные сообщения
+        self.notification_modes = NotificationModes('notification_modes.json')
+        # Ежедневные уведомления в полночь в цикле событий бота, при запуске - догоняющий проход
+        self.scheduler = DailyScheduler(self.timezone)
+        self.scheduler.add_daily_job(self.check_and_send_notifications, '00:00', name='notifications', run_on_start=True)
+        # Контроль задержек цикла событий (метрики, в отладке - стек блокирующего вызова)
+        self.loop_monitor = LoopMonitor()
+        
+        # Группа "Красавчики 2.0" для автонастройки (chat_state.target_group_id)
         self.target_group_name = "Красавчики 2.0"
         
         # Личный чат пользователя для автонастройки
@@ -60,8 +98,16 @@ class UniversalBot:
         self.admin_username = "dmitru_pv"
         
         # Кэш для управления сообщениями
-        self.bot_messages_cache = {}  # {chat_id: [message_ids...]}
-        self.message_cache = {}  # Для отслеживания удалений
+        # Кэши ограничены по чатам и в целом: старые записи вытесняются
+        self.bot_messages_cache = ChatCache(  # {chat_id: message_id}
+            per_chat=int(os.getenv('BOT_MESSAGES_PER_CHAT', '50')),
+            max_items=int(os.getenv('BOT_MESSAGES_MAX', '5000'))
+        )
+        self.message_cache = ChatCache(  # Для отслеживания удалений {chat_id: {message_id: данные}}
+            per_chat=int(os.getenv('MESSAGE_CACHE_PER_CHAT', '200')),
+            max_items=int(os.getenv('MESSAGE_CACHE_MAX', '10000'))
+        )
+        self.cached_messages_count = 0
         
         # Шаблоны поздравлений с днем рождения
         self.congratulations = [
@@ -81,65 +127,6 @@ class UniversalBot:
             "✨ Поздравляем {names} с годовщиной свадьбы! {years} лет счастья позади, впереди еще больше прекрасных моментов! 🎉"
         ]
 
-    # === РАБОТА С ФАЙЛАМИ ===
-    
-    def load_birthdays(self) -> Dict:
-        """Загружает дни рождения из файла"""
-        try:
-            if Path(self.birthdays_file).exists():
-                with open(self.birthdays_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return {}
-        except Exception as e:
-            print(f"Ошибка загрузки файла дней рождения: {e}")
-            return {}
-    
-    def save_birthdays(self, birthdays: Dict):
-        """Сохраняет дни рождения в файл"""
-        try:
-            with open(self.birthdays_file, 'w', encoding='utf-8') as f:
-                json.dump(birthdays, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Ошибка сохранения файла дней рождения: {e}")
-    
-    def load_weddings(self) -> Dict:
-        """Загружает даты свадеб из файла"""
-        try:
-            if Path(self.weddings_file).exists():
-                with open(self.weddings_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return {}
-        except Exception as e:
-            print(f"Ошибка загрузки файла свадеб: {e}")
-            return {}
-    
-    def save_weddings(self, weddings: Dict):
-        """Сохраняет даты свадеб в файл"""
-        try:
-            with open(self.weddings_file, 'w', encoding='utf-8') as f:
-                json.dump(weddings, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Ошибка сохранения файла свадеб: {e}")
-
-    def load_messages_log(self) -> Dict:
-        """Загружает лог сообщений"""
-        try:
-            if Path(self.messages_log_file).exists():
-                with open(self.messages_log_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return {}
-        except Exception as e:
-            print(f"Ошибка загрузки лога сообщений: {e}")
-            return {}
-    
-    def save_messages_log(self, messages_log: Dict):
-        """Сохраняет лог сообщений"""
-        try:
-            with open(self.messages_log_file, 'w', encoding='utf-8') as f:
-                json.dump(messages_log, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Ошибка сохранения лога сообщений: {e}")
-
     # === ОСНОВНЫЕ КОМАНДЫ ===
     
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -164,6 +151,7 @@ class UniversalBot:
 
 🔔 **Уведомления:**
 /enable_notifications - Включить уведомления в 00:00
+/notify_mode - Дайджест или отдельные сообщения
 
 🛡️ **Система отслеживания:**
 /enable_alarm - включить отслеживание
@@ -197,6 +185,7 @@ class UniversalBot:
 
 🔔 **Уведомления:**
 /enable_notifications - включить уведомления в 00:00
+/notify_mode digest|individual - дайджест или отдельные сообщения
 
 🛡️ **Система отслеживания:**
 /enable_alarm - включить отслеживание
@@ -209,6 +198,7 @@ class UniversalBot:
 
 🗑️ **Управление сообщениями бота** (только для @dmitru_pv):
 /delete_bot [N] - удалить последние N сообщений бота
+/restore [ID] - снимки данных и восстановление из снимка
 📝 Удаление по реплаю: ответьте на сообщение бота текстом "удалить"
         """
         response = await update.message.reply_text(help_text)
@@ -224,15 +214,8 @@ class UniversalBot:
     
     def cache_bot_message(self, chat_id: int, message_id: int):
         """Кэширует ID сообщения бота для возможности удаления"""
-        chat_id_str = str(chat_id)
-        if chat_id_str not in self.bot_messages_cache:
-            self.bot_messages_cache[chat_id_str] = []
-        
-        self.bot_messages_cache[chat_id_str].append(message_id)
-        
-        # Ограничиваем кэш (последние 50 сообщений)
-        if len(self.bot_messages_cache[chat_id_str]) > 50:
-            self.bot_messages_cache[chat_id_str] = self.bot_messages_cache[chat_id_str][-50:]
+        # Кэш сам ограничивает число сообщений (последние BOT_MESSAGES_PER_CHAT)
+        self.bot_messages_cache.add(str(chat_id), message_id)
 
     async def delete_bot_messages(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /delete_bot для удаления сообщений бота"""
@@ -259,23 +242,24 @@ class UniversalBot:
                 return
         
         chat_id_str = str(chat_id)
-        if chat_id_str not in self.bot_messages_cache or not self.bot_messages_cache[chat_id_str]:
+        messages_to_delete = self.bot_messages_cache.last(chat_id_str, count)
+        if not messages_to_delete:
             await update.message.reply_text("❌ Нет сообщений бота для удаления!")
             return
         
-        deleted_count = 0
-        messages_to_delete = self.bot_messages_cache[chat_id_str][-count:]
-        
-        for message_id in reversed(messages_to_delete):
+        async def delete(message_id: int) -> bool:
             try:
                 await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
-                self.bot_messages_cache[chat_id_str].remove(message_id)
-                deleted_count += 1
-                await asyncio.sleep(0.1)
+                return True
             except Exception as e:
-                print(f"Не удалось удалить сообщение {message_id}: {e}")
-                if message_id in self.bot_messages_cache[chat_id_str]:
-                    self.bot_messages_cache[chat_id_str].remove(message_id)
+                logger.warning("Не удалось удалить сообщение %s: %s", message_id, e)
+                return False
+            finally:
+                self.bot_messages_cache.discard(chat_id_str, message_id)
+        
+        # Удаляем параллельно, скорость запросов ограничивает лимитер бота (outbound.py)
+        results = await asyncio.gather(*(delete(message_id) for message_id in reversed(messages_to_delete)))
+        deleted_count = sum(results)
         
         if deleted_count > 0:
             response = await update.message.reply_text(
@@ -309,9 +293,7 @@ class UniversalBot:
                 await context.bot.delete_message(chat_id=chat_id, message_id=replied_message.message_id)
                 
                 # Удаляем из кэша
-                chat_id_str = str(chat_id)
-                if chat_id_str in self.bot_messages_cache and replied_message.message_id in self.bot_messages_cache[chat_id_str]:
-                    self.bot_messages_cache[chat_id_str].remove(replied_message.message_id)
+                self.bot_messages_cache.discard(str(chat_id), replied_message.message_id)
                 
                 # Подтверждение
                 response = await update.message.reply_text("✅ Сообщение бота удалено!")
@@ -335,18 +317,15 @@ class UniversalBot:
             self.target_group_name.lower() in chat.title.lower()):
             
             chat_id = chat.id
-            self.target_group_id = chat_id
+            self.chat_state.target_group_id = chat_id
             
             # Автоматически включаем все функции
             self.admin_chats.add(chat_id)
             self.alarm_enabled_chats.add(chat_id)
             
             # Подсчитываем записи
-            birthdays = self.load_birthdays()
-            weddings = self.load_weddings()
-            
-            chat_birthdays = birthdays.get(str(chat_id), {})
-            chat_weddings = weddings.get(str(chat_id), {})
+            birthdays_count = self.storage.count_events(BIRTHDAYS, chat_id)
+            weddings_count = self.storage.count_events(WEDDINGS, chat_id)
             
             # Приветственное сообщение
             welcome_message = f"""
@@ -354,8 +333,8 @@ class UniversalBot:
 
 ✅ **Все функции автоматически включены:**
 
-🎂 **Дни рождения:** {len(chat_birthdays)} записей
-💒 **Свадьбы:** {len(chat_weddings)} записей
+🎂 **Дни рождения:** {birthdays_count} записей
+💒 **Свадьбы:** {weddings_count} записей
 🔔 **Автоматические поздравления в 00:00**
 🛡️ **Система отслеживания активна**
 🗑️ **Управление сообщениями для @{self.admin_username}**
@@ -365,9 +344,9 @@ class UniversalBot:
             
             try:
                 await context.bot.send_message(chat_id=chat_id, text=welcome_message)
-                print(f"🎯 Автонастройка группы '{chat.title}' (ID: {chat_id}) завершена")
+                logger.info("🎯 Автонастройка группы '%s' (ID: %s) завершена", chat.title, chat_id)
             except Exception as e:
-                print(f"Ошибка отправки приветствия в группу: {e}")
+                logger.error("Ошибка отправки приветствия в группу: %s", e, extra={'chat_id': chat_id})
             
             return True
         
@@ -383,11 +362,8 @@ class UniversalBot:
             self.alarm_enabled_chats.add(chat_id)
             
             # Подсчитываем записи
-            birthdays = self.load_birthdays()
-            weddings = self.load_weddings()
-            
-            chat_birthdays = birthdays.get(str(chat_id), {})
-            chat_weddings = weddings.get(str(chat_id), {})
+            birthdays_count = self.storage.count_events(BIRTHDAYS, chat_id)
+            weddings_count = self.storage.count_events(WEDDINGS, chat_id)
             
             # Приветственное сообщение
             welcome_message = f"""
@@ -395,8 +371,8 @@ class UniversalBot:
 
 ✅ **Все функции автоматически включены:**
 
-🎂 **Дни рождения:** {len(chat_birthdays)} записей
-💒 **Свадьбы:** {len(chat_weddings)} записей
+🎂 **Дни рождения:** {birthdays_count} записей
+💒 **Свадьбы:** {weddings_count} записей
 🔔 **Автоматические поздравления в 00:00**
 🛡️ **Система отслеживания активна**
 🗑️ **Управление сообщениями доступно**
@@ -406,9 +382,9 @@ class UniversalBot:
             
             try:
                 await context.bot.send_message(chat_id=chat_id, text=welcome_message)
-                print(f"🎯 Автонастройка личного чата (ID: {chat_id}) завершена")
+                logger.info("🎯 Автонастройка личного чата (ID: %s) завершена", chat_id)
             except Exception as e:
-                print(f"Ошибка отправки приветствия в личный чат: {e}")
+                logger.error("Ошибка отправки приветствия в личный чат: %s", e, extra={'chat_id': chat_id})
             
             return True
         
@@ -445,19 +421,11 @@ class UniversalBot:
             if not (1 <= day <= 31 and 1 <= month <= 12):
                 raise ValueError("Некорректная дата")
             
-            birthdays = self.load_birthdays()
-            chat_id = str(update.effective_chat.id)
-            
-            if chat_id not in birthdays:
-                birthdays[chat_id] = {}
-            
-            birthdays[chat_id][name] = {
+            self.storage.add_event(BIRTHDAYS, update.effective_chat.id, name, {
                 'day': day,
                 'month': month,
                 'year': year
-            }
-            
-            self.save_birthdays(birthdays)
+            })
             
             age_info = f" ({datetime.now().year - year} лет)" if year else ""
             response = await update.message.reply_text(
@@ -475,10 +443,9 @@ class UniversalBot:
 
     async def list_birthdays(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /list для показа всех дней рождения"""
-        birthdays = self.load_birthdays()
-        chat_id = str(update.effective_chat.id)
+        chat_birthdays = self.storage.get_events(BIRTHDAYS, update.effective_chat.id)
         
-        if chat_id not in birthdays or not birthdays[chat_id]:
+        if not chat_birthdays:
             response = await update.message.reply_text("📝 Список дней рождения пуст!")
             self.cache_bot_message(update.effective_chat.id, response.message_id)
             return
@@ -487,7 +454,7 @@ class UniversalBot:
         
         # Сортируем по дате
         sorted_birthdays = sorted(
-            birthdays[chat_id].items(),
+            chat_birthdays.items(),
             key=lambda x: (x[1]['month'], x[1]['day'])
         )
         
@@ -507,18 +474,14 @@ class UniversalBot:
     async def today_birthdays(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /today для проверки именинников сегодня"""
         today = datetime.now(self.timezone)
-        birthdays = self.load_birthdays()
-        chat_id = str(update.effective_chat.id)
+        chat_id = update.effective_chat.id
         
-        if chat_id not in birthdays:
+        if not self.storage.count_events(BIRTHDAYS, chat_id):
             response = await update.message.reply_text("📝 Список дней рождения пуст!")
             self.cache_bot_message(update.effective_chat.id, response.message_id)
             return
         
-        today_celebrants = []
-        for name, data in birthdays[chat_id].items():
-            if data['day'] == today.day and data['month'] == today.month:
-                today_celebrants.append(name)
+        today_celebrants = list(self.storage.events_on(BIRTHDAYS, chat_id, today.month, today.day))
         
         if today_celebrants:
             text = "🎉 **Сегодня день рождения у:**\n\n"
@@ -555,19 +518,12 @@ class UniversalBot:
             if not (1 <= day <= 31 and 1 <= month <= 12 and year >= 1900):
                 raise ValueError("Некорректная дата")
             
-            weddings = self.load_weddings()
-            chat_id = str(update.effective_chat.id)
-            
-            if chat_id not in weddings:
-                weddings[chat_id] = {}
-            
-            weddings[chat_id][names] = {
+            self.storage.add_event(WEDDINGS, update.effective_chat.id, names, {
                 'day': day, 
                 'month': month, 
                 'year': year,
                 'names': names
-            }
-            self.save_weddings(weddings)
+            })
             
             years_together = datetime.now().year - year
             response = await update.message.reply_text(
@@ -584,16 +540,15 @@ class UniversalBot:
 
     async def list_weddings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /list_weddings для показа всех свадеб"""
-        weddings = self.load_weddings()
-        chat_id = str(update.effective_chat.id)
+        chat_weddings = self.storage.get_events(WEDDINGS, update.effective_chat.id)
         
-        if chat_id not in weddings or not weddings[chat_id]:
+        if not chat_weddings:
             response = await update.message.reply_text("💒 Список свадеб пуст!")
             self.cache_bot_message(update.effective_chat.id, response.message_id)
             return
         
         text = "💒 **Список свадеб:**\n\n"
-        sorted_weddings = sorted(weddings[chat_id].items(), key=lambda x: (x[1]['month'], x[1]['day']))
+        sorted_weddings = sorted(chat_weddings.items(), key=lambda x: (x[1]['month'], x[1]['day']))
         
         for couple, data in sorted_weddings:
             day, month, year = data['day'], data['month'], data['year']
@@ -609,19 +564,17 @@ class UniversalBot:
     async def today_weddings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /today_weddings для проверки годовщин сегодня"""
         today = datetime.now(self.timezone)
-        weddings = self.load_weddings()
-        chat_id = str(update.effective_chat.id)
+        chat_id = update.effective_chat.id
         
-        if chat_id not in weddings:
+        if not self.storage.count_events(WEDDINGS, chat_id):
             response = await update.message.reply_text("💒 Список свадеб пуст!")
             self.cache_bot_message(update.effective_chat.id, response.message_id)
             return
         
         today_anniversaries = []
-        for couple, data in weddings[chat_id].items():
-            if data['day'] == today.day and data['month'] == today.month:
-                years_together = today.year - data['year']
-                today_anniversaries.append((couple, years_together))
+        for couple, data in self.storage.events_on(WEDDINGS, chat_id, today.month, today.day).items():
+            years_together = today.year - data['year']
+            today_anniversaries.append((couple, years_together))
         
         if today_anniversaries:
             text = "💒 **Сегодня годовщина свадьбы у:**\n\n"
@@ -649,6 +602,61 @@ class UniversalBot:
         )
         self.cache_bot_message(chat_id, response.message_id)
 
+    async def notify_mode(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /notify_mode: дайджест или отдельные сообщения"""
+        chat_id = update.effective_chat.id
+        modes_text = {
+            DIGEST: "📋 дайджест - все поздравления дня одним сообщением",
+            INDIVIDUAL: "✉️ отдельные сообщения - по одному на каждое событие",
+        }
+        
+        if not context.args:
+            response = await update.message.reply_text(
+                f"🔔 Режим уведомлений: {modes_text[self.notification_modes.get(chat_id)]}\n\n"
+                "Изменить: /notify_mode digest или /notify_mode individual"
+            )
+        elif context.args[0].lower() not in NOTIFY_MODES:
+            response = await update.message.reply_text("❌ Используйте: /notify_mode digest или /notify_mode individual")
+        else:
+            mode = context.args[0].lower()
+            self.notification_modes.set(chat_id, mode)
+            response = await update.message.reply_text(f"✅ Режим уведомлений: {modes_text[mode]}")
+        self.cache_bot_message(chat_id, response.message_id)
+
+    async def restore_snapshot(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /restore: список снимков или восстановление данных из снимка"""
+        chat_id = update.effective_chat.id
+        if not self.is_admin_user(update.effective_user):
+            response = await update.message.reply_text(f"❌ Только @{self.admin_username} может восстанавливать данные!")
+            self.cache_bot_message(chat_id, response.message_id)
+            return
+        
+        if not context.args:
+            snapshots = self.snapshots.list()[:10]
+            if not snapshots:
+                response = await update.message.reply_text("📦 Снимков пока нет.")
+            else:
+                lines = [f"• {manifest['id']} ({manifest['reason']})" for manifest in snapshots]
+                response = await update.message.reply_text(
+                    "📦 Последние снимки:\n\n" + "\n".join(lines) + "\n\nВосстановить: /restore ID"
+                )
+            self.cache_bot_message(chat_id, response.message_id)
+            return
+        
+        snapshot_id = context.args[0]
+        try:
+            counts = await self.snapshots.restore(snapshot_id)
+            response = await update.message.reply_text(
+                f"✅ Данные восстановлены из снимка {snapshot_id}: "
+                f"{counts.get(BIRTHDAYS, 0)} дней рождения, {counts.get(WEDDINGS, 0)} свадеб.\n"
+                "Состояние до восстановления сохранено отдельным снимком."
+            )
+        except KeyError:
+            response = await update.message.reply_text(f"❌ Снимок {snapshot_id} не найден. Список: /restore")
+        except Exception as e:
+            response = await update.message.reply_text(f"❌ Ошибка восстановления: {e}")
+        self.cache_bot_message(chat_id, response.message_id)
+
     async def enable_alarm(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /enable_alarm для включения системы отслеживания"""
         chat_id = update.effective_chat.id
@@ -679,13 +687,10 @@ class UniversalBot:
         """Команда /alarm_status для показа статистики"""
         chat_id = update.effective_chat.id
         
-        # Загружаем статистику
-        messages_log = self.load_messages_log()
-        chat_stats = messages_log.get(str(chat_id), {})
-        
-        # Считаем статистику
-        total_messages = len(chat_stats.get('messages', []))
-        edited_messages = len(chat_stats.get('edited', []))
+        # Считаем статистику по журналу
+        chat_stats = await self.storage.load_message_stats(chat_id)
+        total_messages = chat_stats['messages']
+        edited_messages = chat_stats['edited']
         
         status_text = f"📊 **СТАТИСТИКА ЧАТА**\n\n"
         status_text += f"🛡️ **Система отслеживания:** {'✅ ВКЛ' if chat_id in self.alarm_enabled_chats else '❌ ВЫКЛ'}\n"
@@ -693,10 +698,13 @@ class UniversalBot:
         status_text += f"✏️ **Отредактировано:** {edited_messages}\n"
         status_text += f"🔔 **Уведомления:** {'✅ ВКЛ' if chat_id in self.admin_chats else '❌ ВЫКЛ'}\n\n"
         
-        if chat_id == self.target_group_id:
+        if chat_id == self.chat_state.target_group_id:
             status_text += f"🎯 **Автонастройка группы '{self.target_group_name}': ✅ АКТИВНА**\n"
         
-        status_text += f"🗑️ **Управление сообщениями:** доступно для @{self.admin_username}"
+        status_text += f"🗑️ **Управление сообщениями:** доступно для @{self.admin_username}\n"
+        cache_stats = self.message_cache.stats()
+        status_text += (f"💾 **Кэш сообщений:** {cache_stats['items']} в {cache_stats['chats']} чатах, "
+                        f"~{cache_stats['bytes'] // 1024} КБ")
         
         response = await update.message.reply_text(status_text)
         self.cache_bot_message(chat_id, response.message_id)
@@ -711,7 +719,7 @@ class UniversalBot:
         chat_id = update.effective_chat.id
         
         # Автоматически включаем отслеживание для целевых чатов
-        if (chat_id == self.target_group_id or chat_id == self.admin_user_id):
+        if (chat_id == self.chat_state.target_group_id or chat_id == self.admin_user_id):
             self.alarm_enabled_chats.add(chat_id)
         
         # Отслеживаем только если включено
@@ -725,8 +733,6 @@ class UniversalBot:
         if user and user.is_bot:
             return
         
-        username = f"@{user.username}" if user.username else user.first_name
-        
         # Определяем тип контента
         content_type = "💬 Текст"
         message_text = message.text or ""
@@ -751,38 +757,28 @@ class UniversalBot:
         elif message.contact:
             content_type = "👤 Контакт"
         
+        # Одна запись и для кэша удалений, и для журнала
+        record = MessageRecord(
+            message_id=message.message_id,
+            user_id=user.id if user else None,
+            username=user.username if user else None,
+            first_name=user.first_name if user else None,
+            date=message.date.isoformat(),
+            text=message_text,
+            content_type=content_type,
+            logged_at=datetime.now(self.timezone).isoformat()
+        )
+        
         # Сохраняем в кэш для отслеживания удалений
-        self.message_cache[message.message_id] = {
-            'chat_id': chat_id,
-            'user_id': user.id if user else None,
-            'username': username,
-            'timestamp': message.date.isoformat(),
-            'text': message_text,
-            'message_type': content_type
-        }
+        self.message_cache.add(chat_id, message.message_id, record)
         
         # Логируем сообщение
-        messages_log = self.load_messages_log()
-        chat_id_str = str(chat_id)
+        self.storage.log_message(chat_id, record)
         
-        if chat_id_str not in messages_log:
-            messages_log[chat_id_str] = {}
-        
-        messages_log[chat_id_str][str(message.message_id)] = {
-            'message_id': message.message_id,
-            'user_id': user.id if user else None,
-            'username': user.username if user else None,
-            'first_name': user.first_name if user else None,
-            'date': message.date.isoformat(),
-            'text': message_text,
-            'content_type': content_type,
-            'logged_at': datetime.now(self.timezone).isoformat()
-        }
-        
-        self.save_messages_log(messages_log)
-        
-        # Периодически проверяем удаленные сообщения (каждые 100 сообщений)
-        if len(self.message_cache) % 100 == 0:
+        # Периодически проверяем удаленные сообщения (каждые 100 сообщений);
+        # размер кэша для этого не годится - заполненный кэш не растет
+        self.cached_messages_count += 1
+        if self.cached_messages_count % 100 == 0:
             await self.check_deleted_messages(context)
 
     async def handle_edited_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -793,7 +789,7 @@ class UniversalBot:
         chat_id = update.effective_chat.id
         
         # Автоматически включаем отслеживание для целевых чатов
-        if (chat_id == self.target_group_id or chat_id == self.admin_user_id):
+        if (chat_id == self.chat_state.target_group_id or chat_id == self.admin_user_id):
             self.alarm_enabled_chats.add(chat_id)
         
         # Отслеживаем только если включено
@@ -809,21 +805,11 @@ class UniversalBot:
         
         username = f"@{user.username}" if user.username else user.first_name
         
-        # Логируем редактирование
-        messages_log = self.load_messages_log()
-        chat_id_str = str(chat_id)
-        
-        if chat_id_str not in messages_log:
-            messages_log[chat_id_str] = {}
-        
-        if 'edited' not in messages_log[chat_id_str]:
-            messages_log[chat_id_str]['edited'] = []
-        
-        # Получаем оригинальный текст из лога
+        # Получаем оригинальный текст из журнала
         original_text = ""
-        message_id_str = str(edited_message.message_id)
-        if message_id_str in messages_log[chat_id_str]:
-            original_text = messages_log[chat_id_str][message_id_str].get('text', '')
+        logged_message = await self.storage.load_logged_message(chat_id, edited_message.message_id)
+        if logged_message:
+            original_text = logged_message.get('text', '')
         
         edit_data = {
             'message_id': edited_message.message_id,
@@ -834,8 +820,8 @@ class UniversalBot:
             'new_text': edited_message.text or edited_message.caption or ""
         }
         
-        messages_log[chat_id_str]['edited'].append(edit_data)
-        self.save_messages_log(messages_log)
+        # Логируем редактирование
+        self.storage.log_edit(chat_id, edit_data)
         
         # Отправляем уведомление о редактировании
         if original_text != edit_data['new_text']:
@@ -849,66 +835,138 @@ class UniversalBot:
                 response = await context.bot.send_message(chat_id=chat_id, text=notification)
                 self.cache_bot_message(chat_id, response.message_id)
             except Exception as e:
-                print(f"Ошибка отправки уведомления о редактировании: {e}")
+                logger.error("Ошибка отправки уведомления о редактировании: %s", e, extra={'chat_id': chat_id})
 
     async def check_deleted_messages(self, context):
         """Проверяет удаленные сообщения"""
         current_time = datetime.now(self.timezone)
         messages_to_remove = []
         
-        for message_id, msg_info in list(self.message_cache.items()):
+        for chat_id, message_id, msg_info in self.message_cache.items():
             try:
                 # Парсим timestamp
-                message_time = datetime.fromisoformat(msg_info['timestamp'].replace('Z', '+00:00'))
+                message_time = datetime.fromisoformat(msg_info.date.replace('Z', '+00:00'))
                 time_diff = (current_time - message_time).total_seconds()
                 
                 # Проверяем сообщения возрастом от 2 минут до 10 минут
                 if 120 <= time_diff <= 600:
-                    chat_id = msg_info['chat_id']
-                    
                     # Проверяем только если отслеживание включено
                     if (chat_id not in self.alarm_enabled_chats and 
-                        chat_id != self.target_group_id and 
+                        chat_id != self.chat_state.target_group_id and 
                         chat_id != self.admin_user_id):
-                        messages_to_remove.append(message_id)
+                        messages_to_remove.append((chat_id, message_id))
                         continue
                     
                     try:
                         # Пытаемся получить сообщение
                         await context.bot.get_chat_member(chat_id=chat_id, user_id=context.bot.id)
-                        await asyncio.sleep(0.1)  # Небольшая задержка между проверками
                     except Exception:
                         # Если не можем получить информацию о чате, удаляем из кэша
-                        messages_to_remove.append(message_id)
+                        messages_to_remove.append((chat_id, message_id))
                         continue
                     
                     # Если сообщение старше 10 минут, удаляем из кэша
                 elif time_diff > 600:
-                    messages_to_remove.append(message_id)
+                    messages_to_remove.append((chat_id, message_id))
                     
             except Exception as e:
-                print(f"Ошибка при проверке сообщения {message_id}: {e}")
-                messages_to_remove.append(message_id)
+                logger.warning("Ошибка при проверке сообщения %s: %s", message_id, e)
+                messages_to_remove.append((chat_id, message_id))
         
         # Удаляем старые сообщения из кэша
-        for message_id in messages_to_remove:
-            if message_id in self.message_cache:
-                del self.message_cache[message_id]
+        for chat_id, message_id in messages_to_remove:
+            self.message_cache.discard(chat_id, message_id)
+
+    # === ЕЖЕДНЕВНЫЕ УВЕДОМЛЕНИЯ ===
+
+    async def check_and_send_notifications(self):
+        """Отправляет уведомления за сегодня и за пропущенные дни (догоняющий проход)"""
+        if not self.application:
+            return
+        
+        today = datetime.now(self.timezone).date()
+        await deliver_pending(self.notification_state, self.admin_chats, today, self.send_day_notifications,
+                              on_unavailable=self.admin_chats.discard)
+
+    async def send_day_notifications(self, chat_id: int, day, delay: int) -> bool:
+        """Отправляет поздравления чата за указанный день; True - все поздравления дня отправлены"""
+        prefix = late_prefix(delay, day)
+        items = []  # [(событие, поздравление)]
+        for name in self.storage.events_on(BIRTHDAYS, chat_id, day.month, day.day):
+            congratulation = random.choice(self.congratulations).format(name=name)
+            items.append((NotificationLedger.event_id(BIRTHDAYS, name), congratulation))
+        for names, data in self.storage.events_on(WEDDINGS, chat_id, day.month, day.day).items():
+            congratulation = random.choice(self.wedding_congratulations).format(names=names, years=day.year - data['year'])
+            items.append((NotificationLedger.event_id(WEDDINGS, names), congratulation))
+        if not items:
+            return True
+        
+        async def send(text: str):
+            response = await self.application.bot.send_message(chat_id=chat_id, text=text)
+            self.cache_bot_message(chat_id, response.message_id)
+        
+        if self.notification_modes.get(chat_id) == DIGEST:
+            # Все поздравления дня одним сообщением
+            try:
+                await send_digest(self.notification_ledger, chat_id, day,
+                                  f"{prefix}📅 Праздники {day.strftime('%d.%m.%Y')}:", items, send)
+            except Exception as e:
+                if is_chat_unavailable(e):
+                    # Бот удален из чата или чат не найден - deliver_pending уберет чат из списка
+                    raise ChatUnavailable(chat_id) from e
+                logger.error("Ошибка отправки дайджеста в чат %s: %s", chat_id, e, extra={'chat_id': chat_id})
+            return self.notification_ledger.all_sent(chat_id, [event_id for event_id, _ in items], day)
+        
+        for event_id, congratulation in items:
+            if event_id.startswith(BIRTHDAYS):
+                text = f"{prefix}🎉 Напоминание о дне рождения!\n\n{congratulation}"
+            else:
+                text = f"{prefix}💒 Напоминание о годовщине свадьбы!\n\n{congratulation}"
+            try:
+                # Ledger не даст отправить то же поздравление повторно
+                await self.notification_ledger.send_once(chat_id, event_id, day, lambda: send(text))
+            except Exception as e:
+                if is_chat_unavailable(e):
+                    raise ChatUnavailable(chat_id) from e
+                # Временная ошибка: чат остается, день повторится при следующем проходе
+                logger.error("Ошибка отправки уведомления в чат %s: %s", chat_id, e, extra={'chat_id': chat_id})
+        # День обработан, только если все поздравления подтверждены в журнале отправок
+        return self.notification_ledger.all_sent(chat_id, [event_id for event_id, _ in items], day)
+
+    async def post_init(self, application: Application):
+        """Запускает планировщик уведомлений и снимков в цикле событий приложения"""
+        self.scheduler.start()
+        self.loop_monitor.start()
+        self.snapshots.start()
+    
+    async def post_shutdown(self, application: Application):
+        """Останавливает планировщик и сохраняет последний снимок при завершении"""
+        await self.scheduler.stop()
+        await self.loop_monitor.stop()
+        await self.snapshots.stop()
 
     # === ЗАПУСК БОТА ===
     
     def run(self):
         """Запуск бота"""
-        print("🤖 Универсальный бот с полным функционалом запущен!")
-        print("🎂 Дни рождения: ВКЛ")
-        print("💒 Свадьбы: ВКЛ") 
-        print("🛡️ Система отслеживания: ВКЛ")
-        print("🗑️ Управление сообщениями: доступно для @dmitru_pv")
-        print("🔔 Планировщик уведомлений: каждый день в 00:00")
-        print("🎯 Автонастройка для группы 'Красавчики 2.0': ВКЛ")
+        logger.info("🤖 Универсальный бот с полным функционалом запущен!")
+        logger.info("🎂 Дни рождения: ВКЛ")
+        logger.info("💒 Свадьбы: ВКЛ")
+        logger.info("🛡️ Система отслеживания: ВКЛ")
+        logger.info("🗑️ Управление сообщениями: доступно для @dmitru_pv")
+        logger.info("🔔 Планировщик уведомлений: каждый день в 00:00")
+        logger.info("🎯 Автонастройка для группы 'Красавчики 2.0': ВКЛ")
         
         # Создаем приложение
-        self.application = Application.builder().token(self.bot_token).build()
+        self.application = (
+            Application.builder()
+            .token(self.bot_token)
+            .request(create_request())
+            .rate_limiter(create_rate_limiter())
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+            .build()
+        )
         
         # Регистрируем обработчики команд
         self.application.add_handler(CommandHandler("start", self.start))
@@ -926,12 +984,14 @@ class UniversalBot:
         
         # Уведомления и система отслеживания
         self.application.add_handler(CommandHandler("enable_notifications", self.enable_notifications))
+        self.application.add_handler(CommandHandler("notify_mode", self.notify_mode))
         self.application.add_handler(CommandHandler("enable_alarm", self.enable_alarm))
         self.application.add_handler(CommandHandler("disable_alarm", self.disable_alarm))
         self.application.add_handler(CommandHandler("alarm_status", self.alarm_status))
         
         # Управление сообщениями бота
         self.application.add_handler(CommandHandler("delete_bot", self.delete_bot_messages))
+        self.application.add_handler(CommandHandler("restore", self.restore_snapshot))
         
         # Система отслеживания сообщений (ПЕРВЫМ! до остальных обработчиков)
         self.application.add_handler(MessageHandler(filters.ALL & ~filters.COMMAND, self.handle_message))
@@ -950,10 +1010,21 @@ class UniversalBot:
         
         # Обработчик сообщений для реплаев (ПОСЛЕДНИМ!)
         self.application.add_handler(MessageHandler(filters.TEXT & filters.REPLY, self.handle_reply_to_bot))
-        
-        # Запускаем бота
-        self.application.run_polling()
+        # Замер времени обработчиков (метрики и журнал медленных обработчиков)
+        trace_handlers(self.application)
+        
+        # Запускаем бота: при заданном WEBHOOK_URL (Render) - на веб-хуке, иначе polling
+        webhook_url = os.getenv('WEBHOOK_URL')
+        if webhook_url:
+            port = int(os.getenv('PORT', '10000'))
+            state_dir = os.path.dirname(os.path.abspath(__file__))
+            # Система отслеживания работает с новыми и отредактированными сообщениями
+            asyncio.run(serve_webhook(self.application, webhook_url, port, state_dir,
+                                      allowed_updates=['message', 'edited_message', 'callback_query']))
+        else:
+            self.application.run_polling()
 
 if __name__ == "__main__":
+    setup_logging()
     bot = UniversalBot()
     bot.run() 
\ No newline at end of file
@@ -2,11 +2,10 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
-import json
+import logging
 import os
 import random
 from datetime import datetime
-from pathlib import Path
 from typing import Dict
 
 import pytz
@@ -18,6 +17,20 @@ from telegram.ext import (
     ChatMemberHandler
 )
 
+from message_log import open_message_log
+import file_io
+from chat_state import ChatState
+from loop_monitor import LoopMonitor
+from notifications import (
+    ChatUnavailable, NotificationLedger, NotificationState, deliver_pending, is_chat_unavailable, late_prefix
+)
+from outbound import create_rate_limiter, create_request
+from scheduler import DailyScheduler
+from structured_log import setup_logging
+from tracing import trace_handlers
+
+logger = logging.getLogger(__name__)
+
 # Загружаем переменные окружения
 load_dotenv()
 
@@ -27,10 +40,22 @@ class BirthdayBotWithAlarm:
         self.timezone = pytz.timezone(os.getenv('TIMEZONE', 'Europe/Moscow'))
         self.birthdays_file = 'birthdays.json'
         self.messages_log_file = 'messages_log.json'
-        self.admin_chats = set()
+        # Журнал сообщений: дозапись в сегменты вместо перезаписи всего файла
+        self.messages_log = open_message_log('messages_log', legacy_file=self.messages_log_file)
+        # Чаты с уведомлениями и отслеживанием сохраняются между перезапусками
+        self.chat_state = ChatState('chat_state.json')
+        self.admin_chats = self.chat_state.admin_chats
         self.application = None
-        self.scheduler_running = False
-        self.alarm_enabled_chats = set()  # Чаты с включенным алармом
+        # Отметки отправленных уведомлений для догоняющего прохода
+        self.notification_state = NotificationState('notifications_state.json')
+        # Журнал отправок: одно поздравление не уходит дважды даже при нескольких экземплярах
+        self.notification_ledger = NotificationLedger('notifications_ledger.db')
+        # Ежедневные уведомления в полночь в цикле событий бота, при запуске - догоняющий проход
+        self.scheduler = DailyScheduler(self.timezone)
+        self.scheduler.add_daily_job(self.check_and_send_notifications, '00:00', name='notifications', run_on_start=True)
+        # Контроль задержек цикла событий (метрики, в отладке - стек блокирующего вызова)
+        self.loop_monitor = LoopMonitor()
+        self.alarm_enabled_chats = self.chat_state.alarm_enabled_chats  # Чаты с включенным алармом
         
         # Шаблоны поздравлений
         self.congratulations = [
@@ -41,43 +66,20 @@ class BirthdayBotWithAlarm:
             "🎂 Поздравляем {name} с днём рождения! Желаем крепкого здоровья и море позитива! 🎊"
         ]
     
-    def load_birthdays(self) -> Dict:
-        """Загружает дни рождения из файла"""
+    async def load_birthdays(self) -> Dict:
+        """Загружает дни рождения из файла (в пуле ввода-вывода)"""
         try:
-            if Path(self.birthdays_file).exists():
-                with open(self.birthdays_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return {}
+            return await file_io.read_json(self.birthdays_file)
         except Exception as e:
-            print(f"Ошибка загрузки файла дней рождения: {e}")
+            logger.error("Ошибка загрузки файла дней рождения: %s", e)
             return {}
     
     def save_birthdays(self, birthdays: Dict):
-        """Сохраняет дни рождения в файл"""
+        """Сохраняет дни рождения в файл (запись в фоне, по порядку)"""
         try:
-            with open(self.birthdays_file, 'w', encoding='utf-8') as f:
-                json.dump(birthdays, f, ensure_ascii=False, indent=2)
+            file_io.write_json(self.birthdays_file, birthdays)
         except Exception as e:
-            print(f"Ошибка сохранения файла дней рождения: {e}")
-    
-    def load_messages_log(self) -> Dict:
-        """Загружает лог сообщений"""
-        try:
-            if Path(self.messages_log_file).exists():
-                with open(self.messages_log_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return {}
-        except Exception as e:
-            print(f"Ошибка загрузки лога сообщений: {e}")
-            return {}
-    
-    def save_messages_log(self, messages_log: Dict):
-        """Сохраняет лог сообщений"""
-        try:
-            with open(self.messages_log_file, 'w', encoding='utf-8') as f:
-                json.dump(messages_log, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Ошибка сохранения лога сообщений: {e}")
+            logger.error("Ошибка сохранения файла дней рождения: %s", e)
     
     def get_message_type(self, message: Message) -> str:
         """Определяет тип сообщения"""
@@ -107,14 +109,6 @@ class BirthdayBotWithAlarm:
         if not message or not message.chat:
             return
             
-        chat_id = str(message.chat.id)
-        message_id = str(message.message_id)
-        
-        messages_log = self.load_messages_log()
-        
-        if chat_id not in messages_log:
-            messages_log[chat_id] = {}
-        
         message_data = {
             'message_id': message.message_id,
             'user_id': message.from_user.id if message.from_user else None,
@@ -126,16 +120,7 @@ class BirthdayBotWithAlarm:
             'logged_at': datetime.now(self.timezone).isoformat()
         }
         
-        messages_log[chat_id][message_id] = message_data
-        
-        # Ограничиваем размер лога (храним только последние 1000 сообщений на чат)
-        if len(messages_log[chat_id]) > 1000:
-            oldest_messages = sorted(messages_log[chat_id].items(), 
-                                   key=lambda x: x[1].get('logged_at', ''))
-            for old_msg_id, _ in oldest_messages[:-1000]:
-                del messages_log[chat_id][old_msg_id]
-        
-        self.save_messages_log(messages_log)
+        self.messages_log.append_message(message.chat.id, message_data)
     
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /start"""
@@ -216,8 +201,7 @@ class BirthdayBotWithAlarm:
             return
         
         # Загружаем статистику
-        messages_log = self.load_messages_log()
-        chat_messages = messages_log.get(chat_id, {})
+        chat_messages = await self.messages_log.load_chat_messages(chat_id, limit=1000)
         
         if not chat_messages:
             await update.message.reply_text(
@@ -296,7 +280,7 @@ class BirthdayBotWithAlarm:
                         reply_to_message_id=update.message.message_id
                     )
                 except Exception as e:
-                    print(f"Ошибка отправки уведомления о медиа: {e}")
+                    logger.error("Ошибка отправки уведомления о медиа: %s", e)
     
     async def handle_edited_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик отредактированных сообщений"""
@@ -330,7 +314,7 @@ class BirthdayBotWithAlarm:
                 reply_to_message_id=edited_message.message_id
             )
         except Exception as e:
-            print(f"Ошибка отправки уведомления о редактировании: {e}")
+            logger.error("Ошибка отправки уведомления о редактировании: %s", e)
     
     async def handle_chat_member(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик изменений участников чата"""
@@ -370,7 +354,7 @@ class BirthdayBotWithAlarm:
             try:
                 await context.bot.send_message(chat_id=chat_id, text=alarm_text)
             except Exception as e:
-                print(f"Ошибка отправки уведомления об изменении участника: {e}")
+                logger.error("Ошибка отправки уведомления об изменении участника: %s", e)
     
     # Остальные методы для дней рождения (сокращенные версии)
     async def add_birthday(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -397,7 +381,7 @@ class BirthdayBotWithAlarm:
             if not (1 <= day <= 31 and 1 <= month <= 12):
                 raise ValueError("Некорректная дата")
             
-            birthdays = self.load_birthdays()
+            birthdays = await self.load_birthdays()
             chat_id = str(update.effective_chat.id)
             
             if chat_id not in birthdays:
@@ -418,7 +402,7 @@ class BirthdayBotWithAlarm:
     
     async def list_birthdays(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /list для показа всех дней рождения"""
-        birthdays = self.load_birthdays()
+        birthdays = await self.load_birthdays()
         chat_id = str(update.effective_chat.id)
         
         if chat_id not in birthdays or not birthdays[chat_id]:
@@ -443,7 +427,7 @@ class BirthdayBotWithAlarm:
     async def today_birthdays(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /today для проверки именинников сегодня"""
         today = datetime.now(self.timezone)
-        birthdays = self.load_birthdays()
+        birthdays = await self.load_birthdays()
         chat_id = str(update.effective_chat.id)
         
         if chat_id not in birthdays:
@@ -504,13 +488,69 @@ class BirthdayBotWithAlarm:
         """
         await update.message.reply_text(help_text)
     
+    async def check_and_send_notifications(self):
+        """Отправляет уведомления за сегодня и за пропущенные дни (догоняющий проход)"""
+        if not self.application:
+            return
+        
+        today = datetime.now(self.timezone).date()
+        await deliver_pending(self.notification_state, self.admin_chats, today, self.send_day_notifications,
+                              on_unavailable=self.admin_chats.discard)
+    
+    async def send_day_notifications(self, chat_id: int, day, delay: int) -> bool:
+        """Отправляет поздравления чата за указанный день; True - все поздравления дня отправлены"""
+        birthdays = await self.load_birthdays()
+        chat_birthdays = birthdays.get(str(chat_id), {})
+        
+        event_ids = []
+        for name, data in chat_birthdays.items():
+            if data['day'] != day.day or data['month'] != day.month:
+                continue
+            event_id = NotificationLedger.event_id('birthdays', name)
+            event_ids.append(event_id)
+            congratulation = random.choice(self.congratulations).format(name=name)
+            text = f"{late_prefix(delay, day)}🎉 Напоминание о дне рождения!\n\n{congratulation}"
+            try:
+                # Ledger не даст отправить то же поздравление повторно
+                await self.notification_ledger.send_once(
+                    chat_id, event_id, day,
+                    lambda: self.application.bot.send_message(chat_id=chat_id, text=text)
+                )
+            except Exception as e:
+                if is_chat_unavailable(e):
+                    # Бот удален из чата или чат не найден - deliver_pending уберет чат из списка
+                    raise ChatUnavailable(chat_id) from e
+                # Временная ошибка: чат остается, день повторится при следующем проходе
+                logger.error("Ошибка отправки уведомления в чат %s: %s", chat_id, e)
+        # День обработан, только если все поздравления подтверждены в журнале отправок
+        return self.notification_ledger.all_sent(chat_id, event_ids, day)
+    
+    async def post_init(self, application: Application):
+        """Запускает планировщик уведомлений в цикле событий приложения"""
+        self.scheduler.start()
+        self.loop_monitor.start()
+    
+    async def post_shutdown(self, application: Application):
+        """Останавливает планировщик и дописывает файлы данных при завершении"""
+        await self.scheduler.stop()
+        await self.loop_monitor.stop()
+        await file_io.drain()
+    
     def run(self):
         """Запускает бота"""
         if not self.bot_token:
-            print("❌ Ошибка: BOT_TOKEN не найден!")
+            logger.error("❌ Ошибка: BOT_TOKEN не найден!")
             return
         
-        self.application = Application.builder().token(self.bot_token).build()
+        self.application = (
+            Application.builder()
+            .token(self.bot_token)
+            .request(create_request())
+            .rate_limiter(create_rate_limiter())
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+            .build()
+        )
         
         # Основные команды
         self.application.add_handler(CommandHandler("start", self.start))
@@ -529,12 +569,15 @@ class BirthdayBotWithAlarm:
         self.application.add_handler(MessageHandler(filters.ALL & ~filters.COMMAND, self.handle_message))
         self.application.add_handler(MessageHandler(filters.UpdateType.EDITED_MESSAGE, self.handle_edited_message))
         self.application.add_handler(ChatMemberHandler(self.handle_chat_member))
+        # Замер времени обработчиков (метрики и журнал медленных обработчиков)
+        trace_handlers(self.application)
         
-        print("🤖 Бот с системой отслеживания запущен!")
-        print("🛡️ Новые команды: /enable_alarm, /disable_alarm, /alarm_status")
+        logger.info("🤖 Бот с системой отслеживания запущен!")
+        logger.info("🛡️ Новые команды: /enable_alarm, /disable_alarm, /alarm_status")
         
         self.application.run_polling()
 
 if __name__ == "__main__":
+    setup_logging()
     bot = BirthdayBotWithAlarm()
     bot.run() 
\ No newline at end of file
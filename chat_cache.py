@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ограниченный кэш сообщений по чатам.
+
+Для каждого чата хранится упорядоченный словарь {message_id: данные}:
+добавление, поиск и удаление - O(1), при переполнении чата (per_chat
+записей) вытесняется самая старая запись. Общий предел max_items
+действует на все чаты сразу: вытесняются старые записи чата, к которому
+дольше всего не обращались (LRU по чатам).
+
+    cache = ChatCache(per_chat=50, max_items=5000)
+    cache.add(chat_id, message_id)
+    cache.last(chat_id, 5)          # последние 5 id, от старых к новым
+    cache.discard(chat_id, message_id)
+"""
+
+import sys
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterator, List, Tuple
+
+
+def _deep_size(value: Any) -> int:
+    """Размер значения вместе с содержимым словарей, списков, кортежей и полей __slots__"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_size(key) + _deep_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_deep_size(item) for item in value)
+    elif hasattr(type(value), '__slots__'):
+        size += sum(_deep_size(getattr(value, slot, None)) for slot in type(value).__slots__)
+    return size
+
+
+class ChatCache:
+    """Записи по чатам с ограничением на чат, общим пределом и LRU-вытеснением чатов"""
+
+    def __init__(self, per_chat: int, max_items: int):
+        self.per_chat = max(1, per_chat)
+        self.max_items = max(1, max_items)
+        self._chats: "OrderedDict[Hashable, OrderedDict]" = OrderedDict()  # давно не использованные первыми
+        self._size = 0
+        self.evicted = 0
+
+    def add(self, chat_id: Hashable, key: Hashable, value: Any = None):
+        """Добавляет (или обновляет) запись и делает ее самой новой в чате"""
+        entries = self._chats.get(chat_id)
+        if entries is None:
+            entries = self._chats[chat_id] = OrderedDict()
+        else:
+            self._chats.move_to_end(chat_id)
+
+        if key in entries:
+            entries.move_to_end(key)
+        else:
+            self._size += 1
+        entries[key] = value
+
+        if len(entries) > self.per_chat:
+            entries.popitem(last=False)
+            self._size -= 1
+            self.evicted += 1
+        while self._size > self.max_items:
+            self._evict_oldest()
+
+    def _evict_oldest(self):
+        chat_id, entries = next(iter(self._chats.items()))
+        entries.popitem(last=False)
+        self._size -= 1
+        self.evicted += 1
+        if not entries:
+            del self._chats[chat_id]
+
+    def get(self, chat_id: Hashable, key: Hashable, default: Any = None) -> Any:
+        entries = self._chats.get(chat_id)
+        if entries is None:
+            return default
+        return entries.get(key, default)
+
+    def __contains__(self, item: Tuple[Hashable, Hashable]) -> bool:
+        chat_id, key = item
+        entries = self._chats.get(chat_id)
+        return entries is not None and key in entries
+
+    def discard(self, chat_id: Hashable, key: Hashable) -> bool:
+        """Удаляет запись; False - ее не было"""
+        entries = self._chats.get(chat_id)
+        if entries is None or key not in entries:
+            return False
+        del entries[key]
+        self._size -= 1
+        if not entries:
+            del self._chats[chat_id]
+        return True
+
+    def last(self, chat_id: Hashable, count: int) -> List[Hashable]:
+        """Ключи последних count записей чата, от старых к новым"""
+        entries = self._chats.get(chat_id)
+        if not entries or count <= 0:
+            return []
+        keys = []
+        for key in reversed(entries):
+            keys.append(key)
+            if len(keys) == count:
+                break
+        keys.reverse()
+        return keys
+
+    def count(self, chat_id: Hashable) -> int:
+        entries = self._chats.get(chat_id)
+        return len(entries) if entries else 0
+
+    def items(self) -> Iterator[Tuple[Hashable, Hashable, Any]]:
+        """Все записи (chat_id, ключ, значение); кэш можно менять во время обхода"""
+        for chat_id, entries in list(self._chats.items()):
+            for key, value in list(entries.items()):
+                yield chat_id, key, value
+
+    def __len__(self) -> int:
+        return self._size
+
+    def memory_usage(self) -> int:
+        """Примерный объем памяти кэша в байтах"""
+        size = sys.getsizeof(self._chats)
+        for chat_id, entries in self._chats.items():
+            size += sys.getsizeof(chat_id) + sys.getsizeof(entries)
+            for key, value in entries.items():
+                size += sys.getsizeof(key) + (_deep_size(value) if value is not None else 0)
+        return size
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'chats': len(self._chats),
+            'items': self._size,
+            'evicted': self.evicted,
+            'bytes': self.memory_usage(),
+        }
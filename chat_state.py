@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Состояние чатов, которое должно пережить перезапуск бота.
+
+Чаты с уведомлениями (admin_chats), чаты с отслеживанием сообщений
+(alarm_enabled_chats) и найденная группа для автонастройки
+(target_group_id) хранятся в chat_state.json. Файл читается при запуске,
+а каждое изменение сразу передается на запись, поэтому после деплоя или
+сна хостинга поздравления и отслеживание работают без повторных /start
+и /enable_notifications.
+
+    state = ChatState('chat_state.json')
+    self.admin_chats = state.admin_chats      # обычное множество chat_id
+    state.admin_chats.add(chat_id)            # сразу уходит на запись
+    state.target_group_id = chat_id
+"""
+
+import logging
+from typing import Callable, Iterable, Optional
+
+from store import JsonStore
+
+logger = logging.getLogger(__name__)
+
+
+class ChatSet(set):
+    """Множество chat_id, которое сохраняет каждое изменение"""
+
+    __slots__ = ('_on_change',)
+
+    def __init__(self, chat_ids: Iterable[int], on_change: Callable[[], None]):
+        super().__init__(chat_ids)
+        self._on_change = on_change
+
+    def add(self, chat_id: int):
+        if chat_id not in self:
+            super().add(chat_id)
+            self._on_change()
+
+    def discard(self, chat_id: int):
+        if chat_id in self:
+            super().discard(chat_id)
+            self._on_change()
+
+    def remove(self, chat_id: int):
+        super().remove(chat_id)
+        self._on_change()
+
+    def update(self, *others: Iterable[int]):
+        size = len(self)
+        super().update(*others)
+        if len(self) != size:
+            self._on_change()
+
+    def clear(self):
+        if self:
+            super().clear()
+            self._on_change()
+
+    def pop(self) -> int:
+        chat_id = super().pop()
+        self._on_change()
+        return chat_id
+
+    def difference_update(self, *others: Iterable[int]):
+        size = len(self)
+        super().difference_update(*others)
+        if len(self) != size:
+            self._on_change()
+
+    def intersection_update(self, *others: Iterable[int]):
+        size = len(self)
+        super().intersection_update(*others)
+        if len(self) != size:
+            self._on_change()
+
+    def symmetric_difference_update(self, other: Iterable[int]):
+        # Каждый элемент other добавляется или удаляется - изменение есть, если other не пуст
+        other = set(other)
+        super().symmetric_difference_update(other)
+        if other:
+            self._on_change()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __isub__(self, other):
+        self.difference_update(other)
+        return self
+
+    def __iand__(self, other):
+        self.intersection_update(other)
+        return self
+
+    def __ixor__(self, other):
+        self.symmetric_difference_update(other)
+        return self
+
+
+class ChatState:
+    """admin_chats, alarm_enabled_chats и target_group_id с записью на диск при изменении"""
+
+    def __init__(self, path: str = 'chat_state.json'):
+        self.store = JsonStore(path)
+        data = self.store.data
+        self.admin_chats = ChatSet(data.get('admin_chats', []), self._save)
+        self.alarm_enabled_chats = ChatSet(data.get('alarm_enabled_chats', []), self._save)
+        self._target_group_id: Optional[int] = data.get('target_group_id')
+
+        if data:
+            logger.info("📂 Состояние чатов восстановлено: уведомления - %s, отслеживание - %s",
+                        len(self.admin_chats), len(self.alarm_enabled_chats))
+
+    @property
+    def target_group_id(self) -> Optional[int]:
+        return self._target_group_id
+
+    @target_group_id.setter
+    def target_group_id(self, chat_id: Optional[int]):
+        if chat_id != self._target_group_id:
+            self._target_group_id = chat_id
+            self._save()
+
+    def _save(self):
+        """Сразу передает состояние на запись (изменения редкие, терять их нельзя)"""
+        self.store.data = {
+            'admin_chats': sorted(self.admin_chats),
+            'alarm_enabled_chats': sorted(self.alarm_enabled_chats),
+            'target_group_id': self._target_group_id,
+        }
+        self.store.mark_dirty()
+        self.store.save_now()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Кодирование JSON для хранилищ и веб-хука.
+
+Если установлен orjson, используется он (в разы быстрее), иначе -
+стандартный json. Данные пишутся компактно, без отступов: форматированный
+JSON (pretty=True) нужен только для явного экспорта, который читает человек.
+Файлы пишутся атомарно и проверяются при чтении (atomic_file.py).
+Записи records.py (и любые Mapping) записываются как обычные словари.
+
+    data = codec.read_file('birthdays.json')
+    codec.write_file('birthdays.json', data)
+    line = codec.dumps(entry) + b'\n'
+"""
+
+import json
+import os
+from collections.abc import Mapping
+from typing import Any, Union
+
+import metrics
+import tracing
+from atomic_file import read_verified, write_atomic
+
+try:
+    import orjson
+except ImportError:  # orjson не установлен - работаем на стандартной библиотеке
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+if orjson is not None:
+    _COMPACT = orjson.OPT_NON_STR_KEYS
+    _PRETTY = orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2
+
+
+def _default(obj: Any) -> Any:
+    """Типы, которые кодировщик не знает: записи records.py -> словари"""
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any, pretty: bool = False) -> bytes:
+    """JSON в UTF-8 (кириллица без \\u-экранирования)"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=_PRETTY if pretty else _COMPACT)
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2, default=_default).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Разбирает JSON; при ошибке - ValueError (как json.loads)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def read_file(path) -> Any:
+    """Читает JSON-файл; при повреждении - из резервной копии (.bak)"""
+    with metrics.STORE_IO_SECONDS.time('read', os.path.basename(os.fspath(path))), tracing.span(tracing.STORAGE):
+        return read_verified(path, loads)
+
+
+def write_file(path, obj: Any, pretty: bool = False):
+    """Атомарно записывает JSON-файл"""
+    write_bytes(path, dumps(obj, pretty))
+
+
+def write_bytes(path, data: bytes):
+    """Атомарно записывает уже сериализованный JSON (file_io.FileWriter пишет так в пуле потоков)"""
+    with metrics.STORE_IO_SECONDS.time('write', os.path.basename(os.fspath(path))), tracing.span(tracing.STORAGE):
+        write_atomic(path, data)
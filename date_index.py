@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Индекс дней рождения и свадеб по дате (месяц, день).
+
+Записи хранятся в отсортированных списках - общем и по каждому чату,
+поэтому запросы "сегодня", "ближайшие N дней" и "диапазон дат"
+выполняются бинарным поиском и затрагивают только подходящие записи.
+Индекс обновляется при каждом добавлении и удалении.
+"""
+
+import bisect
+from typing import Dict, List, Tuple
+
+MonthDay = Tuple[int, int]
+
+
+class DateIndex:
+    """Отсортированный индекс записей по (месяц, день): общий и по чатам"""
+
+    def __init__(self):
+        self._global: List[Tuple[int, int, str, str]] = []  # (месяц, день, chat_id, имя)
+        self._chats: Dict[str, List[Tuple[int, int, str]]] = {}  # {chat_id: [(месяц, день, имя)]}
+        self._dates: Dict[Tuple[str, str], MonthDay] = {}  # {(chat_id, имя): (месяц, день)}
+
+    @classmethod
+    def build(cls, data: Dict) -> 'DateIndex':
+        """Строит индекс по данным формата birthdays.json / weddings.json"""
+        index = cls()
+        for chat_id, chat_events in data.items():
+            chat_id = str(chat_id)
+            chat_list = index._chats.setdefault(chat_id, [])
+            for name, record in chat_events.items():
+                month, day = record['month'], record['day']
+                index._global.append((month, day, chat_id, name))
+                chat_list.append((month, day, name))
+                index._dates[(chat_id, name)] = (month, day)
+        index._global.sort()
+        for chat_list in index._chats.values():
+            chat_list.sort()
+        return index
+
+    def __len__(self) -> int:
+        return len(self._global)
+
+    def add(self, chat_id, name: str, month: int, day: int):
+        """Добавляет запись (или переносит ее на новую дату)"""
+        chat_id = str(chat_id)
+        if (chat_id, name) in self._dates:
+            self.remove(chat_id, name)
+
+        bisect.insort(self._global, (month, day, chat_id, name))
+        bisect.insort(self._chats.setdefault(chat_id, []), (month, day, name))
+        self._dates[(chat_id, name)] = (month, day)
+
+    def remove(self, chat_id, name: str) -> bool:
+        """Удаляет запись, возвращает False, если ее не было"""
+        chat_id = str(chat_id)
+        month_day = self._dates.pop((chat_id, name), None)
+        if month_day is None:
+            return False
+
+        month, day = month_day
+        self._remove_item(self._global, (month, day, chat_id, name))
+        chat_list = self._chats[chat_id]
+        self._remove_item(chat_list, (month, day, name))
+        if not chat_list:
+            del self._chats[chat_id]
+        return True
+
+    @staticmethod
+    def _remove_item(items: List, item: Tuple):
+        position = bisect.bisect_left(items, item)
+        if position < len(items) and items[position] == item:
+            del items[position]
+
+    @staticmethod
+    def _slice(items: List, start: MonthDay, end: MonthDay) -> List:
+        """Элементы с датой в диапазоне [start, end] включительно"""
+        lo = bisect.bisect_left(items, start)
+        # (месяц, день + 1) больше любой записи с датой end
+        hi = bisect.bisect_left(items, (end[0], end[1] + 1))
+        return items[lo:hi]
+
+    def between(self, start: MonthDay, end: MonthDay) -> List[Tuple[str, str]]:
+        """Записи всех чатов в диапазоне дат: [(chat_id, имя)]"""
+        return [(chat_id, name) for _, _, chat_id, name in self._slice(self._global, start, end)]
+
+    def chat_between(self, chat_id, start: MonthDay, end: MonthDay) -> List[str]:
+        """Имена записей чата в диапазоне дат"""
+        chat_list = self._chats.get(str(chat_id))
+        if not chat_list:
+            return []
+        return [name for _, _, name in self._slice(chat_list, start, end)]
+
+    def on(self, month: int, day: int) -> List[Tuple[str, str]]:
+        """Записи всех чатов на указанный день"""
+        return self.between((month, day), (month, day))
+
+    def chat_on(self, chat_id, month: int, day: int) -> List[str]:
+        """Имена записей чата на указанный день"""
+        return self.chat_between(chat_id, (month, day), (month, day))
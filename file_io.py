@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Файловый ввод-вывод вне цикла событий.
+
+Чтение и запись файлов данных выполняются в отдельном пуле потоков
+(IO_WORKERS потоков), поэтому запись большого файла не останавливает
+обработку обновлений.
+
+У каждого файла свой FileWriter: записи одного файла идут строго по
+очереди, а если пока идет запись пришло несколько новых версий, на диск
+попадает только последняя (промежуточные объединяются). Пока версия не
+записана, read_json возвращает именно ее - данные, только что
+переданные на запись, не теряются при следующем чтении. Если запись не
+удалась, версия остается в памяти и записывается повторно через
+RETRY_DELAY секунд (интервал удваивается до RETRY_MAX_DELAY), а при
+выходе из процесса - в flush_all.
+
+Журналы в формате JSON Lines дописываются через append_json - тоже
+в пуле, без открытия файла в потоке цикла событий.
+
+    data = await file_io.read_json('birthdays.json')
+    file_io.write_json('birthdays.json', data)   # не ждет диска
+    file_io.append_json('slow_handlers.jsonl', record)
+    await file_io.drain()                          # при остановке
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Set
+
+import codec
+
+logger = logging.getLogger(__name__)
+
+IO_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv('IO_WORKERS', '2')), thread_name_prefix='file-io')
+
+# Повтор неудачной записи: первая пауза и ее предел, секунды
+RETRY_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+
+class FileWriter:
+    """Последовательная запись одного файла в пуле ввода-вывода с объединением очереди"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._latest: Optional[bytes] = None  # Последняя версия, еще не записанная на диск
+        self._seq = 0                         # Номер последней переданной версии
+        self._written_seq = 0                 # Номер последней записанной версии
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._retry: Optional[asyncio.TimerHandle] = None  # Отложенный повтор после ошибки
+        self._failures = 0                    # Неудачных записей подряд
+        self.submitted = 0
+        self.written = 0
+
+    def pending(self) -> Optional[bytes]:
+        """Версия, которая еще ждет записи (или None)"""
+        return self._latest
+
+    def submit(self, data: bytes):
+        """Передает версию на запись; без цикла событий пишет сразу"""
+        self._seq += 1
+        self._latest = data
+        self.submitted += 1
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        if self._retry is not None and self._task.get_loop() is loop:
+            return  # Пауза после ошибки: новая версия запишется при повторе
+        if self._task is None or self._task.done():
+            self._retry = None
+            self._task = loop.create_task(self._drain())
+
+    async def _drain(self):
+        loop = asyncio.get_running_loop()
+        while self._latest is not None:
+            data, seq = self._latest, self._seq
+            try:
+                await loop.run_in_executor(IO_EXECUTOR, self._write, data, seq)
+            except Exception as e:
+                # Версия остается в памяти: запись повторится позже
+                self._failures += 1
+                delay = min(RETRY_MAX_DELAY, RETRY_DELAY * 2 ** (self._failures - 1))
+                logger.error("Ошибка сохранения файла %s: %s (повтор через %.0f с)", self.path, e, delay)
+                self._retry = loop.call_later(delay, self._restart)
+                return
+            if self._seq == seq:
+                self._latest = None
+
+    def _restart(self):
+        self._retry = None
+        if self._latest is not None and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._drain())
+
+    def _write(self, data: bytes, seq: int):
+        with self._lock:
+            # Более новая версия уже записана (flush при остановке) - старую не пишем
+            if seq <= self._written_seq:
+                return
+            codec.write_bytes(self.path, data)
+            self._written_seq = seq
+            self._failures = 0
+            self.written += 1
+
+    def flush(self):
+        """Синхронно записывает ожидающую версию (выход из процесса, скрипты)"""
+        data, seq = self._latest, self._seq
+        if data is None:
+            return
+        self._write(data, seq)
+        if self._seq == seq:
+            self._latest = None
+
+    async def wait(self):
+        """Дожидается записи всех переданных версий (или неудачной попытки - повтор не ждется)"""
+        while self._task is not None and not self._task.done():
+            await asyncio.shield(self._task)
+
+
+_writers: Dict[str, FileWriter] = {}
+
+
+def writer_for(path: str) -> FileWriter:
+    """Общий FileWriter файла (один на путь в процессе)"""
+    key = os.path.abspath(path)
+    writer = _writers.get(key)
+    if writer is None:
+        writer = _writers[key] = FileWriter(path)
+    return writer
+
+
+def write_json(path: str, obj: Any):
+    """Сериализует obj сейчас и передает на запись в фоне"""
+    writer_for(path).submit(codec.dumps(obj))
+
+
+async def read_json(path: str, default: Any = None) -> Any:
+    """Читает JSON-файл в пуле ввода-вывода; версия, ждущая записи, важнее диска"""
+    writer = _writers.get(os.path.abspath(path))
+    pending = writer.pending() if writer is not None else None
+    if pending is not None:
+        return codec.loads(pending)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(IO_EXECUTOR, codec.read_file, path)
+    except FileNotFoundError:
+        return {} if default is None else default
+
+
+_append_lock = threading.Lock()
+_appends: Set[asyncio.Future] = set()
+
+
+def _append(path: str, data: bytes):
+    try:
+        with _append_lock, open(path, 'ab') as f:
+            f.write(data)
+    except OSError as e:
+        logger.error("Ошибка дозаписи файла %s: %s", path, e)
+
+
+def append_json(path: str, obj: Any):
+    """Сериализует obj сейчас и дописывает строкой в конец файла; без цикла событий пишет сразу"""
+    data = codec.dumps(obj) + b'\n'
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _append(path, data)
+        return
+    future = loop.run_in_executor(IO_EXECUTOR, _append, path, data)
+    _appends.add(future)
+    future.add_done_callback(_appends.discard)
+
+
+async def drain():
+    """Дожидается записи всех файлов (перед остановкой бота)"""
+    for writer in list(_writers.values()):
+        await writer.wait()
+    if _appends:
+        await asyncio.gather(*list(_appends))
+
+
+def flush_all():
+    """Синхронно дописывает все ожидающие версии"""
+    for writer in list(_writers.values()):
+        writer.flush()
+
+
+atexit.register(flush_all)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Контроль задержек цикла событий.
+
+Задача в цикле бота каждые LOOP_MONITOR_INTERVAL секунд засыпает и
+сравнивает фактическое время пробуждения с ожидаемым: разница - сколько
+цикл был занят другими обработчиками (синхронное чтение файлов, тяжелые
+вычисления). Задержка попадает в метрики event_loop_lag_seconds.
+
+В режиме отладки (LOOP_MONITOR_DEBUG=1) работает еще и сторожевой поток:
+если цикл не отвечает дольше LOOP_BLOCK_MS миллисекунд, поток снимает
+стек потока цикла прямо во время блокировки и выводит его - видно, какой
+синхронный вызов останавливает обработку обновлений.
+
+    monitor = LoopMonitor()
+    monitor.start()       # в post_init
+    await monitor.stop()  # в post_shutdown
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG = metrics.REGISTRY.register(metrics.Histogram(
+    'event_loop_lag_seconds', 'Задержка пробуждения задачи контроля цикла событий',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)))
+LOOP_LAG_LAST = metrics.REGISTRY.register(metrics.Gauge(
+    'event_loop_lag_last_seconds', 'Последняя измеренная задержка цикла событий'))
+LOOP_BLOCKED = metrics.REGISTRY.register(metrics.Counter(
+    'event_loop_blocked_total', 'Блокировки цикла событий дольше LOOP_BLOCK_MS'))
+
+
+class LoopMonitor:
+    """Измеряет задержку цикла событий и (в режиме отладки) ловит блокирующие вызовы"""
+
+    def __init__(self, interval: Optional[float] = None, block_ms: Optional[float] = None,
+                 debug: Optional[bool] = None):
+        self.interval = interval or float(os.getenv('LOOP_MONITOR_INTERVAL', '0.5'))
+        self.block_threshold = (block_ms or float(os.getenv('LOOP_BLOCK_MS', '100'))) / 1000
+        if debug is None:
+            debug = os.getenv('LOOP_MONITOR_DEBUG', '').lower() in ('1', 'true', 'yes')
+        self.debug = debug
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = time.monotonic()
+
+    def start(self):
+        """Запускает контроль в текущем цикле событий"""
+        if self._task is not None and not self._task.done():
+            return
+        self._stopped.clear()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        if self.debug:
+            self._loop_thread_id = threading.get_ident()
+            self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+            self._watchdog.start()
+            logger.info("🩺 Контроль цикла событий: отладка, стек при блокировке дольше %.0f мс", self.block_threshold * 1000)
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - expected)
+            LOOP_LAG.observe(lag)
+            LOOP_LAG_LAST.set(lag)
+            if lag >= self.block_threshold:
+                LOOP_BLOCKED.inc()
+                if not self.debug:
+                    logger.warning("🧊 Цикл событий был занят %.0f мс", lag * 1000, extra={'lag_ms': round(lag * 1000, 1)})
+
+    # === СТОРОЖЕВОЙ ПОТОК (режим отладки) ===
+
+    def _watch(self):
+        """Проверяет пульс цикла; при блокировке снимает стек потока цикла один раз"""
+        reported = None
+        check = min(self.block_threshold / 2, 0.05)
+        while not self._stopped.wait(check):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.block_threshold or reported == heartbeat:
+                continue
+            reported = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = ''.join(traceback.format_list(_callback_frames(frame)))
+            logger.warning("🧊 Цикл событий заблокирован дольше %.0f мс, текущий стек:\n%s", blocked * 1000, stack)
+
+
+def _callback_frames(frame) -> traceback.StackSummary:
+    """Стек без кадров самого цикла asyncio: начиная с выполняемого обратного вызова"""
+    frames = traceback.extract_stack(frame)
+    loop_frames = [index for index, entry in enumerate(frames)
+                   if entry.filename.endswith(os.path.join('asyncio', 'events.py'))]
+    if loop_frames and loop_frames[-1] + 1 < len(frames):
+        return traceback.StackSummary.from_list(frames[loop_frames[-1] + 1:])
+    return frames
@@ -1,17 +1,13 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import asyncio
-import json
+import logging
 import os
 import random
 from datetime import datetime, timedelta
-from pathlib import Path
 from typing import Dict, List
 
 import pytz
-import schedule
-import time
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
@@ -19,6 +15,19 @@ from telegram.ext import (
     CallbackQueryHandler, MessageHandler, filters
 )
 
+import file_io
+from chat_state import ChatState
+from loop_monitor import LoopMonitor
+from notifications import (
+    ChatUnavailable, NotificationLedger, NotificationState, deliver_pending, is_chat_unavailable, late_prefix
+)
+from outbound import create_rate_limiter, create_request
+from scheduler import DailyScheduler
+from structured_log import setup_logging
+from tracing import trace_handlers
+
+logger = logging.getLogger(__name__)
+
 # Загружаем переменные окружения
 load_dotenv()
 
@@ -27,7 +36,19 @@ class BirthdayBot:
         self.bot_token = os.getenv('BOT_TOKEN')
         self.timezone = pytz.timezone(os.getenv('TIMEZONE', 'Europe/Moscow'))
         self.birthdays_file = 'birthdays.json'
-        self.admin_chats = set()  # Чаты где бот может отправлять уведомления
+        # Чаты с уведомлениями и отслеживанием сохраняются между перезапусками
+        self.chat_state = ChatState('chat_state.json')
+        self.admin_chats = self.chat_state.admin_chats  # Чаты где бот может отправлять уведомления
+        self.application = None
+        # Отметки отправленных уведомлений для догоняющего прохода
+        self.notification_state = NotificationState('notifications_state.json')
+        # Журнал отправок: одно поздравление не уходит дважды даже при нескольких экземплярах
+        self.notification_ledger = NotificationLedger('notifications_ledger.db')
+        # Ежедневные уведомления в полночь в цикле событий бота, при запуске - догоняющий проход
+        self.scheduler = DailyScheduler(self.timezone)
+        self.scheduler.add_daily_job(self.check_and_send_notifications, '00:00', name='notifications', run_on_start=True)
+        # Контроль задержек цикла событий (метрики, в отладке - стек блокирующего вызова)
+        self.loop_monitor = LoopMonitor()
         
         # Шаблоны поздравлений
         self.congratulations = [
@@ -38,24 +59,20 @@ class BirthdayBot:
             "🎂 Поздравляем {name} с днём рождения! Желаем крепкого здоровья и море позитива! 🎊"
         ]
     
-    def load_birthdays(self) -> Dict:
-        """Загружает дни рождения из файла"""
+    async def load_birthdays(self) -> Dict:
+        """Загружает дни рождения из файла (в пуле ввода-вывода)"""
         try:
-            if Path(self.birthdays_file).exists():
-                with open(self.birthdays_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return {}
+            return await file_io.read_json(self.birthdays_file)
         except Exception as e:
-            print(f"Ошибка загрузки файла дней рождения: {e}")
+            logger.error("Ошибка загрузки файла дней рождения: %s", e)
             return {}
     
     def save_birthdays(self, birthdays: Dict):
-        """Сохраняет дни рождения в файл"""
+        """Сохраняет дни рождения в файл (запись в фоне, по порядку)"""
         try:
-            with open(self.birthdays_file, 'w', encoding='utf-8') as f:
-                json.dump(birthdays, f, ensure_ascii=False, indent=2)
+            file_io.write_json(self.birthdays_file, birthdays)
         except Exception as e:
-            print(f"Ошибка сохранения файла дней рождения: {e}")
+            logger.error("Ошибка сохранения файла дней рождения: %s", e)
     
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /start"""
@@ -132,7 +149,7 @@ class BirthdayBot:
             if not (1 <= day <= 31 and 1 <= month <= 12):
                 raise ValueError("Некорректная дата")
             
-            birthdays = self.load_birthdays()
+            birthdays = await self.load_birthdays()
             chat_id = str(update.effective_chat.id)
             
             if chat_id not in birthdays:
@@ -160,7 +177,7 @@ class BirthdayBot:
     
     async def list_birthdays(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /list для показа всех дней рождения"""
-        birthdays = self.load_birthdays()
+        birthdays = await self.load_birthdays()
         chat_id = str(update.effective_chat.id)
         
         if chat_id not in birthdays or not birthdays[chat_id]:
@@ -189,7 +206,7 @@ class BirthdayBot:
     
     async def delete_birthday(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /delete для удаления дня рождения"""
-        birthdays = self.load_birthdays()
+        birthdays = await self.load_birthdays()
         chat_id = str(update.effective_chat.id)
         
         if chat_id not in birthdays or not birthdays[chat_id]:
@@ -212,7 +229,7 @@ class BirthdayBot:
     async def today_birthdays(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /today для проверки именинников сегодня"""
         today = datetime.now(self.timezone)
-        birthdays = self.load_birthdays()
+        birthdays = await self.load_birthdays()
         chat_id = str(update.effective_chat.id)
         
         if chat_id not in birthdays:
@@ -237,7 +254,7 @@ class BirthdayBot:
     async def upcoming_birthdays(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /upcoming для показа ближайших дней рождения"""
         today = datetime.now(self.timezone)
-        birthdays = self.load_birthdays()
+        birthdays = await self.load_birthdays()
         chat_id = str(update.effective_chat.id)
         
         if chat_id not in birthdays:
@@ -300,7 +317,7 @@ class BirthdayBot:
         if query.data.startswith("delete_"):
             name = query.data[7:]  # Убираем "delete_"
             
-            birthdays = self.load_birthdays()
+            birthdays = await self.load_birthdays()
             chat_id = str(update.effective_chat.id)
             
             if chat_id in birthdays and name in birthdays[chat_id]:
@@ -311,56 +328,71 @@ class BirthdayBot:
                 await query.edit_message_text("❌ Ошибка при удалении!")
     
     async def check_and_send_notifications(self):
-        """Проверяет и отправляет уведомления о днях рождения"""
-        if not self.admin_chats:
+        """Отправляет уведомления за сегодня и за пропущенные дни (догоняющий проход)"""
+        if not self.application:
             return
         
-        today = datetime.now(self.timezone)
-        birthdays = self.load_birthdays()
-        
-        application = Application.builder().token(self.bot_token).build()
-        
-        for chat_id in self.admin_chats:
-            chat_birthdays = birthdays.get(str(chat_id), {})
-            
-            today_celebrants = []
-            for name, data in chat_birthdays.items():
-                if data['day'] == today.day and data['month'] == today.month:
-                    today_celebrants.append(name)
-            
-            if today_celebrants:
-                for name in today_celebrants:
-                    congratulation = random.choice(self.congratulations).format(name=name)
-                    try:
-                        await application.bot.send_message(
-                            chat_id=chat_id,
-                            text=f"🎉 Напоминание о дне рождения!\n\n{congratulation}"
-                        )
-                    except Exception as e:
-                        print(f"Ошибка отправки уведомления в чат {chat_id}: {e}")
+        today = datetime.now(self.timezone).date()
+        await deliver_pending(self.notification_state, self.admin_chats, today, self.send_day_notifications,
+                              on_unavailable=self.admin_chats.discard)
     
-    def schedule_notifications(self):
-        """Настраивает расписание для уведомлений"""
-        schedule.every().day.at("00:00").do(
-            lambda: asyncio.create_task(self.check_and_send_notifications())
-        )
+    async def send_day_notifications(self, chat_id: int, day, delay: int) -> bool:
+        """Отправляет поздравления чата за указанный день; True - все поздравления дня отправлены"""
+        birthdays = await self.load_birthdays()
+        chat_birthdays = birthdays.get(str(chat_id), {})
+        
+        event_ids = []
+        for name, data in chat_birthdays.items():
+            if data['day'] != day.day or data['month'] != day.month:
+                continue
+            event_id = NotificationLedger.event_id('birthdays', name)
+            event_ids.append(event_id)
+            congratulation = random.choice(self.congratulations).format(name=name)
+            text = f"{late_prefix(delay, day)}🎉 Напоминание о дне рождения!\n\n{congratulation}"
+            try:
+                # Ledger не даст отправить то же поздравление повторно
+                await self.notification_ledger.send_once(
+                    chat_id, event_id, day,
+                    lambda: self.application.bot.send_message(chat_id=chat_id, text=text)
+                )
+            except Exception as e:
+                if is_chat_unavailable(e):
+                    # Бот удален из чата или чат не найден - deliver_pending уберет чат из списка
+                    raise ChatUnavailable(chat_id) from e
+                # Временная ошибка: чат остается, день повторится при следующем проходе
+                logger.error("Ошибка отправки уведомления в чат %s: %s", chat_id, e)
+        # День обработан, только если все поздравления подтверждены в журнале отправок
+        return self.notification_ledger.all_sent(chat_id, event_ids, day)
     
-    def run_scheduler(self):
-        """Запускает планировщик в отдельном потоке"""
-        while True:
-            schedule.run_pending()
-            time.sleep(60)
+    async def post_init(self, application: Application):
+        """Запускает планировщик уведомлений в цикле событий приложения"""
+        self.scheduler.start()
+        self.loop_monitor.start()
+    
+    async def post_shutdown(self, application: Application):
+        """Останавливает планировщик и дописывает файлы данных при завершении"""
+        await self.scheduler.stop()
+        await self.loop_monitor.stop()
+        await file_io.drain()
     
     def run(self):
         """Запускает бота"""
         if not self.bot_token:
-            print("❌ Ошибка: BOT_TOKEN не найден в переменных окружения!")
-            print("Создайте файл .env и добавьте туда ваш токен бота:")
-            print("BOT_TOKEN=your_bot_token_here")
+            logger.error("❌ Ошибка: BOT_TOKEN не найден в переменных окружения! "
+                         "Создайте файл .env и добавьте туда ваш токен бота: BOT_TOKEN=your_bot_token_here")
             return
         
         # Настройка приложения
-        application = Application.builder().token(self.bot_token).build()
+        self.application = (
+            Application.builder()
+            .token(self.bot_token)
+            .request(create_request())
+            .rate_limiter(create_rate_limiter())
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+            .build()
+        )
+        application = self.application
         
         # Добавляем обработчики команд
         application.add_handler(CommandHandler("start", self.start))
@@ -372,16 +404,16 @@ class BirthdayBot:
         application.add_handler(CommandHandler("upcoming", self.upcoming_birthdays))
         application.add_handler(CommandHandler("enable_notifications", self.enable_notifications))
         application.add_handler(CallbackQueryHandler(self.button_callback))
+        # Замер времени обработчиков (метрики и журнал медленных обработчиков)
+        trace_handlers(application)
         
-        # Настраиваем планировщик уведомлений
-        self.schedule_notifications()
-        
-        print("🤖 Бот запущен!")
-        print("📋 Доступные команды: /start, /add, /list, /delete, /today, /upcoming, /help")
+        logger.info("🤖 Бот запущен!")
+        logger.info("📋 Доступные команды: /start, /add, /list, /delete, /today, /upcoming, /help")
         
         # Запускаем бота
         application.run_polling()
 
 if __name__ == "__main__":
+    setup_logging()
     bot = BirthdayBot()
     bot.run() 
\ No newline at end of file
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сравнение памяти: записи-словари (как раньше) и компактные записи
+records.py на файлах бота. Память считается через tracemalloc: сколько
+занимают загруженные данные целиком, включая строки.
+
+Запуск:
+    python measure_records.py
+    python measure_records.py weddings.json messages_log.json
+"""
+
+import argparse
+import glob
+import gc
+import os
+import tracemalloc
+from typing import Callable, Tuple
+
+import codec
+from records import MessageRecord, events_from_json
+
+
+def measure(build: Callable[[], object]) -> int:
+    """Объем памяти, которую удерживает результат build(), в байтах"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def _messages(data) -> list:
+    return [record for chat_log in data.values() for key, record in chat_log.items() if key != 'edited']
+
+
+def builders(path: str, raw: bytes) -> Tuple[int, Callable, Callable]:
+    """(число записей, построение словарей, построение записей) для файла"""
+    data = codec.loads(raw)
+    if os.path.basename(path).startswith('messages_log'):
+        return (len(_messages(data)),
+                lambda: _messages(codec.loads(raw)),
+                lambda: [MessageRecord.from_dict(record) for record in _messages(codec.loads(raw))])
+    return (sum(len(chat_events) for chat_events in data.values()),
+            lambda: codec.loads(raw),
+            lambda: events_from_json(codec.loads(raw)))
+
+
+def report(path: str):
+    with open(path, 'rb') as f:
+        raw = f.read()
+    count, as_dicts, as_records = builders(path, raw)
+    if not count:
+        print(f"\n📄 {os.path.basename(path)}: записей нет")
+        return
+
+    before = measure(as_dicts)
+    after = measure(as_records)
+    print(f"\n📄 {os.path.basename(path)}: {count} записей")
+    print(f"  словари  {before:8} байт  {before / count:7.1f} байт/запись")
+    print(f"  записи   {after:8} байт  {after / count:7.1f} байт/запись  (-{100 * (1 - after / before):.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Память записей-словарей и компактных записей на файлах бота')
+    parser.add_argument('files', nargs='*',
+                        help='Файлы JSON (по умолчанию birthdays*.json, weddings*.json и messages_log.json)')
+    args = parser.parse_args()
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    files = args.files or sorted(
+        glob.glob(os.path.join(current_dir, 'birthdays*.json'))
+        + glob.glob(os.path.join(current_dir, 'weddings*.json'))
+        + glob.glob(os.path.join(current_dir, 'messages_log.json'))
+    )
+
+    for path in files:
+        if os.path.exists(path):
+            report(path)
+        else:
+            print(f"\n⚠️ Файл не найден: {path}")
+
+
+if __name__ == "__main__":
+    main()
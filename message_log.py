@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Журнал сообщений для системы отслеживания.
+
+Вместо перезаписи всего messages_log.json на каждое сообщение журнал
+дописывает одну строку JSON в файл-сегмент своего чата:
+
+    messages_log/<chat_id>/000001.jsonl, 000002.jsonl, ...
+
+Сегмент закрывается и начинается новый, когда его размер превышает
+MESSAGE_LOG_SEGMENT_SIZE байт. fsync выполняется пачками: после каждых
+MESSAGE_LOG_FSYNC_EVERY записей или раз в MESSAGE_LOG_FSYNC_INTERVAL секунд,
+внутри цикла событий - в пуле ввода-вывода (file_io.py), не задерживая
+обработку обновлений. Там же выполняются fsync закрываемого сегмента и
+чтение журнала (load_message, load_chat_messages, load_stats).
+
+Для обратной совместимости журнал можно собрать в прежний формат:
+    python message_log.py compact --out messages_log.json
+Перенести старый messages_log.json в журнал:
+    python message_log.py import --file messages_log.json
+"""
+
+import argparse
+import asyncio
+import atexit
+import logging
+import os
+import shutil
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import codec
+import metrics
+import tracing
+from file_io import IO_EXECUTOR
+from records import MessageRecord
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.jsonl'
+
+
+class MessageLog:
+    """Append-only журнал сообщений с сегментами по чатам"""
+
+    def __init__(self, directory: str = 'messages_log',
+                 segment_size: Optional[int] = None,
+                 fsync_every: Optional[int] = None,
+                 fsync_interval: Optional[float] = None,
+                 recent_per_chat: int = 1000,
+                 max_open_files: int = 64):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size or int(os.getenv('MESSAGE_LOG_SEGMENT_SIZE', 1024 * 1024))
+        self.fsync_every = fsync_every or int(os.getenv('MESSAGE_LOG_FSYNC_EVERY', 50))
+        self.fsync_interval = fsync_interval or float(os.getenv('MESSAGE_LOG_FSYNC_INTERVAL', 1))
+        self.recent_per_chat = recent_per_chat
+        self.max_open_files = max_open_files
+
+        self._writers: "OrderedDict[str, Dict]" = OrderedDict()  # {chat_id: {'file', 'seq'}}
+        self._unsynced = set()  # Файлы с записями, еще не сброшенными fsync
+        self._sync_task: Optional[asyncio.Future] = None  # fsync в пуле ввода-вывода
+        self._closing = set()  # fsync и закрытие сегментов в пуле ввода-вывода
+        self._appended = 0     # Число записей; меняется, пока журнал читается в пуле
+        self._unsynced_count = 0
+        self._last_sync = time.monotonic()
+
+        # Последние сообщения чатов для быстрого поиска оригинала при редактировании
+        self._recent: Dict[str, OrderedDict] = {}
+        # Счетчики записей по чатам, заполняются при первом запросе статистики
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+        atexit.register(self.close)
+
+    # === ЗАПИСЬ ===
+
+    def append_message(self, chat_id, record: Dict):
+        """Добавляет сообщение в журнал чата"""
+        chat_id = str(chat_id)
+        self._append(chat_id, {'type': 'message', **record})
+
+        recent = self._recent.setdefault(chat_id, OrderedDict())
+        recent[str(record['message_id'])] = MessageRecord.from_dict(record)
+        recent.move_to_end(str(record['message_id']))
+        if len(recent) > self.recent_per_chat:
+            recent.popitem(last=False)
+
+        if chat_id in self._counts:
+            self._counts[chat_id]['messages'] += 1
+
+    def append_edit(self, chat_id, record: Dict):
+        """Добавляет запись о редактировании сообщения"""
+        chat_id = str(chat_id)
+        self._append(chat_id, {'type': 'edit', **record})
+
+        if chat_id in self._counts:
+            self._counts[chat_id]['edited'] += 1
+
+    def _append(self, chat_id: str, entry: Dict):
+        """Дописывает строку в текущий сегмент чата"""
+        with metrics.STORE_IO_SECONDS.time('append', 'messages_log'), tracing.span(tracing.STORAGE):
+            writer = self._writer(chat_id)
+            f = writer['file']
+            f.write(codec.dumps(entry) + b'\n')
+            f.flush()
+
+        self._appended += 1
+        self._unsynced.add(f)
+        self._unsynced_count += 1
+
+        if f.tell() >= self.segment_size:
+            self._rotate(chat_id)
+
+        if (self._unsynced_count >= self.fsync_every or
+                time.monotonic() - self._last_sync >= self.fsync_interval):
+            self.sync()
+
+    def _writer(self, chat_id: str) -> Dict:
+        """Возвращает открытый на дозапись сегмент чата"""
+        writer = self._writers.get(chat_id)
+        if writer is not None:
+            self._writers.move_to_end(chat_id)
+            return writer
+
+        segments = self._segments(chat_id)
+        seq = int(segments[-1].stem) if segments else 1
+        writer = {'seq': seq, 'file': self._open_segment(chat_id, seq)}
+        self._writers[chat_id] = writer
+
+        # Ограничиваем число одновременно открытых файлов
+        if len(self._writers) > self.max_open_files:
+            _, oldest = self._writers.popitem(last=False)
+            self._close_file(oldest['file'])
+
+        return writer
+
+    def _open_segment(self, chat_id: str, seq: int):
+        chat_dir = self.directory / chat_id
+        chat_dir.mkdir(parents=True, exist_ok=True)
+        return open(chat_dir / f"{seq:06d}{SEGMENT_SUFFIX}", 'ab')
+
+    def _rotate(self, chat_id: str):
+        """Закрывает заполненный сегмент и открывает следующий"""
+        writer = self._writers[chat_id]
+        self._close_file(writer['file'])
+        writer['seq'] += 1
+        writer['file'] = self._open_segment(chat_id, writer['seq'])
+
+    def _close_file(self, f):
+        """Закрывает сегмент; в цикле событий fsync и закрытие - в фоне"""
+        self._unsynced.discard(f)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._fsync_and_close(f)
+            return
+        future = IO_EXECUTOR.submit(self._fsync_and_close, f)
+        self._closing.add(future)
+        future.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    def _fsync_and_close(f):
+        # fsync всегда: записи файла могут ждать фонового fsync
+        try:
+            os.fsync(f.fileno())
+        except OSError as e:
+            logger.error("Ошибка fsync журнала сообщений: %s", e)
+        finally:
+            f.close()
+
+    def sync(self):
+        """Сбрасывает накопленные записи на диск (fsync); в цикле событий - в фоне"""
+        files = list(self._unsynced)
+        self._unsynced.clear()
+        self._unsynced_count = 0
+        self._last_sync = time.monotonic()
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._fsync(files)
+            return
+        if self._sync_task is not None and not self._sync_task.done():
+            # Предыдущий fsync еще идет - файлы попадут в следующий
+            self._unsynced.update(files)
+            return
+        self._sync_task = loop.run_in_executor(IO_EXECUTOR, self._fsync, files)
+
+    @staticmethod
+    def _fsync(files: List):
+        for f in files:
+            if f.closed:
+                continue  # При закрытии fsync уже выполнен
+            try:
+                os.fsync(f.fileno())
+            except Exception as e:
+                if not f.closed:
+                    logger.error("Ошибка fsync журнала сообщений: %s", e)
+
+    def close(self):
+        """Сбрасывает данные на диск и закрывает файлы (синхронно)"""
+        for writer in self._writers.values():
+            self._fsync_and_close(writer['file'])
+        self._writers.clear()
+        self._unsynced.clear()
+        # Сегменты, закрываемые в фоне, тоже должны быть на диске
+        for future in list(self._closing):
+            future.result()
+
+    # === ЧТЕНИЕ ===
+
+    def _segments(self, chat_id: str) -> List[Path]:
+        chat_dir = self.directory / chat_id
+        if not chat_dir.exists():
+            return []
+        return sorted(chat_dir.glob(f"*{SEGMENT_SUFFIX}"))
+
+    def _entries(self, chat_id: str) -> Iterator[Dict]:
+        """Последовательно читает все записи чата"""
+        for segment in self._segments(chat_id):
+            with open(segment, 'rb') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield codec.loads(line)
+                    except ValueError:
+                        # Недописанная строка после сбоя - пропускаем
+                        continue
+
+    def chats(self) -> List[str]:
+        """Список чатов, у которых есть журнал"""
+        return sorted(p.name for p in self.directory.iterdir() if p.is_dir())
+
+    def get_message(self, chat_id, message_id) -> Optional[Dict]:
+        """Находит залогированное сообщение по ID"""
+        chat_id = str(chat_id)
+        message_id = str(message_id)
+
+        recent = self._recent.get(chat_id)
+        if recent and message_id in recent:
+            return recent[message_id]
+        return self._find_message(chat_id, message_id)
+
+    async def load_message(self, chat_id, message_id) -> Optional[Dict]:
+        """То же, что get_message, но журнал читается в пуле ввода-вывода"""
+        chat_id = str(chat_id)
+        message_id = str(message_id)
+
+        recent = self._recent.get(chat_id)
+        if recent and message_id in recent:
+            return recent[message_id]
+        return await asyncio.get_running_loop().run_in_executor(
+            IO_EXECUTOR, self._find_message, chat_id, message_id
+        )
+
+    def _find_message(self, chat_id: str, message_id: str) -> Optional[Dict]:
+        found = None
+        for entry in self._entries(chat_id):
+            if entry.get('type') == 'message' and str(entry.get('message_id')) == message_id:
+                found = entry
+        if found is not None:
+            found = {k: v for k, v in found.items() if k != 'type'}
+        return found
+
+    def chat_messages(self, chat_id, limit: Optional[int] = None) -> Dict[str, Dict]:
+        """Возвращает сообщения чата {message_id: запись} (последние limit штук)"""
+        messages = OrderedDict()
+        for entry in self._entries(str(chat_id)):
+            if entry.get('type') != 'message':
+                continue
+            key = str(entry['message_id'])
+            messages.pop(key, None)
+            messages[key] = {k: v for k, v in entry.items() if k != 'type'}
+            if limit and len(messages) > limit:
+                messages.popitem(last=False)
+        return dict(messages)
+
+    async def load_chat_messages(self, chat_id, limit: Optional[int] = None) -> Dict[str, Dict]:
+        """То же, что chat_messages, но журнал читается в пуле ввода-вывода"""
+        return await asyncio.get_running_loop().run_in_executor(IO_EXECUTOR, self.chat_messages, chat_id, limit)
+
+    def chat_edits(self, chat_id) -> List[Dict]:
+        """Возвращает записи о редактировании сообщений чата"""
+        return [
+            {k: v for k, v in entry.items() if k != 'type'}
+            for entry in self._entries(str(chat_id))
+            if entry.get('type') == 'edit'
+        ]
+
+    def stats(self, chat_id) -> Dict[str, int]:
+        """Количество сообщений и редактирований в журнале чата"""
+        chat_id = str(chat_id)
+        if chat_id not in self._counts:
+            self._counts[chat_id] = self._count(chat_id)
+        return dict(self._counts[chat_id])
+
+    async def load_stats(self, chat_id) -> Dict[str, int]:
+        """То же, что stats, но журнал читается в пуле ввода-вывода"""
+        chat_id = str(chat_id)
+        if chat_id not in self._counts:
+            appended = self._appended
+            counts = await asyncio.get_running_loop().run_in_executor(IO_EXECUTOR, self._count, chat_id)
+            if chat_id in self._counts:
+                return dict(self._counts[chat_id])
+            if self._appended != appended:
+                # Пока читали, журнал дописывался - счетчики могли не учесть новые записи
+                return counts
+            self._counts[chat_id] = counts
+        return dict(self._counts[chat_id])
+
+    def _count(self, chat_id: str) -> Dict[str, int]:
+        counts = {'messages': 0, 'edited': 0}
+        for entry in self._entries(chat_id):
+            if entry.get('type') == 'edit':
+                counts['edited'] += 1
+            else:
+                counts['messages'] += 1
+        return counts
+
+    # === СОВМЕСТИМОСТЬ С messages_log.json ===
+
+    def import_legacy(self, legacy_file: str) -> int:
+        """Переносит записи из старого messages_log.json, возвращает их количество"""
+        legacy = codec.read_file(legacy_file)
+
+        imported = 0
+        for chat_id, chat_log in legacy.items():
+            messages = [(k, v) for k, v in chat_log.items() if k != 'edited']
+            messages.sort(key=lambda item: int(item[0]) if item[0].lstrip('-').isdigit() else 0)
+            for _, record in messages:
+                self.append_message(chat_id, record)
+                imported += 1
+            for record in chat_log.get('edited', []):
+                self.append_edit(chat_id, record)
+                imported += 1
+
+        self.sync()
+        return imported
+
+    def export_legacy(self) -> Dict:
+        """Собирает журнал в формат messages_log.json"""
+        result = {}
+        for chat_id in self.chats():
+            chat_log = self.chat_messages(chat_id)
+            edits = self.chat_edits(chat_id)
+            if edits:
+                chat_log['edited'] = edits
+            result[chat_id] = chat_log
+        return result
+
+
+def open_message_log(directory: str, legacy_file: Optional[str] = None) -> MessageLog:
+    """Открывает журнал и при первом запуске переносит в него старый messages_log.json.
+
+    Перенос идет во временный каталог, который переименовывается в directory
+    только после успешного импорта: если процесс упал посреди переноса,
+    при следующем запуске он начнется заново.
+    """
+    if not Path(directory).exists() and legacy_file and Path(legacy_file).exists():
+        importing = Path(f"{directory}.importing")
+        shutil.rmtree(importing, ignore_errors=True)  # Остаток прерванного переноса
+        try:
+            log = MessageLog(str(importing))
+            count = log.import_legacy(legacy_file)
+            log.close()
+            os.replace(importing, directory)
+            logger.info("📥 Перенесено %s записей из %s в журнал %s", count, legacy_file, directory)
+        except Exception as e:
+            shutil.rmtree(importing, ignore_errors=True)
+            logger.exception("Ошибка переноса %s в журнал сообщений (повтор: python message_log.py import): %s",
+                             legacy_file, e)
+
+    return MessageLog(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Обслуживание журнала сообщений')
+    parser.add_argument('--dir', default='messages_log', help='Каталог журнала (по умолчанию messages_log)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    compact_parser = subparsers.add_parser('compact', help='Собрать журнал в формат messages_log.json')
+    compact_parser.add_argument('--out', default='messages_log.json', help='Куда записать результат')
+
+    import_parser = subparsers.add_parser('import', help='Перенести messages_log.json в журнал')
+    import_parser.add_argument('--file', default='messages_log.json', help='Исходный файл')
+
+    args = parser.parse_args()
+    log = MessageLog(args.dir)
+
+    if args.command == 'compact':
+        data = log.export_legacy()
+        # Экспорт читает человек - с отступами
+        codec.write_file(args.out, data, pretty=True)
+        print(f"✅ Журнал собран в {args.out}: {len(data)} чатов")
+    elif args.command == 'import':
+        count = log.import_legacy(args.file)
+        print(f"✅ Перенесено {count} записей из {args.file}")
+
+    log.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Метрики бота в текстовом формате Prometheus (GET /metrics веб-хука).
+
+Счетчики, гистограммы и датчики хранятся в памяти процесса и отдаются
+без сторонних библиотек:
+
+  bot_updates_total{type,command}            - обновления по типу и команде
+  bot_update_seconds{type,command}           - время обработки обновления
+  bot_handler_seconds{handler,part}          - время обработчика: total, storage, telegram, render (tracing.py)
+  telegram_api_request_seconds{method}       - время запросов к Bot API
+  telegram_api_errors_total{method,error}    - ошибки Bot API (код HTTP или исключение)
+  store_io_seconds{operation,file}           - чтение и запись файлов данных, запросы SQLite
+  scheduler_lag_seconds{job}                 - опоздание последнего запуска задачи
+  process_resident_memory_bytes              - память процесса
+
+Остальные значения (очередь веб-хука, пул соединений) регистрирует
+serve_webhook через register_callback, задержки цикла событий
+(event_loop_lag_seconds) - loop_monitor.py.
+
+    with metrics.STORE_IO_SECONDS.time('write', 'birthdays.json'):
+        ...
+    metrics.UPDATES.inc('message', '/start')
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    """Общая часть метрик: имя, описание, имена меток и блокировка"""
+
+    type = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()  # Запись файлов идет и из потоков
+
+    def _key(self, values: Sequence) -> Labels:
+        if len(values) != len(self.labels):
+            raise ValueError(f"{self.name}: ожидались метки {self.labels}, получено {values}")
+        return tuple(str(value) for value in values)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """(суффикс имени, метки в формате Prometheus, значение)"""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{self.name}{suffix}{labels} {_format_value(value)}" for suffix, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(self._key(label_values), 0)
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield '', _format_labels(self.labels, key), value
+
+
+class Gauge(Metric):
+    """Значение, которое может расти и уменьшаться"""
+
+    type = 'gauge'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Labels, float] = {}
+
+    def set(self, value: float, *label_values):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, *label_values) -> float:
+        return self._values.get(self._key(label_values), 0)
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield '', _format_labels(self.labels, key), value
+
+
+class Histogram(Metric):
+    """Распределение длительностей по корзинам"""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series: Dict[Labels, List[float]] = {}  # {метки: [счетчики корзин..., сумма, количество]}
+
+    def observe(self, value: float, *label_values):
+        key = self._key(label_values)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        """Измеряет время блока (работает и внутри корутин)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def count(self, *label_values) -> int:
+        series = self._series.get(self._key(label_values))
+        return series[-1] if series else 0
+
+    def samples(self):
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield '_bucket', _format_labels(self.labels, key, f'le="{_format_value(bound)}"'), cumulative
+            yield '_sum', _format_labels(self.labels, key), series[-2]
+            yield '_count', _format_labels(self.labels, key), series[-1]
+
+
+CallbackValue = Union[float, Dict[Labels, float]]
+
+
+class CallbackMetric(Metric):
+    """Значение, которое считывается функцией в момент запроса /metrics"""
+
+    def __init__(self, name: str, help: str, callback: Callable[[], CallbackValue],
+                 type: str = 'gauge', labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.type = type
+        self.callback = callback
+
+    def samples(self):
+        value = self.callback()
+        if isinstance(value, dict):
+            for key, item in sorted(value.items()):
+                yield '', _format_labels(self.labels, key), item
+        elif value is not None:
+            yield '', '', value
+
+
+class Registry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        # Повторная регистрация (перезапуск веб-хука) заменяет старую метрику
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.error("❌ Ошибка метрики %s: %s", metric.name, e)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def register_callback(name: str, help: str, callback: Callable[[], CallbackValue],
+                      type: str = 'gauge', labels: Sequence[str] = ()) -> CallbackMetric:
+    return REGISTRY.register(CallbackMetric(name, help, callback, type, labels))
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+def resident_memory() -> int:
+    """Занятая процессом память (RSS) в байтах"""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource  # Нет /proc (macOS) - пиковое значение
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+UPDATES = REGISTRY.register(Counter(
+    'bot_updates_total', 'Входящие обновления по типу и команде', ('type', 'command')))
+UPDATE_SECONDS = REGISTRY.register(Histogram(
+    'bot_update_seconds', 'Время обработки обновления обработчиками', ('type', 'command')))
+HANDLER_SECONDS = REGISTRY.register(Histogram(
+    'bot_handler_seconds', 'Время обработчика по частям: total, storage, telegram, render', ('handler', 'part')))
+TELEGRAM_API_SECONDS = REGISTRY.register(Histogram(
+    'telegram_api_request_seconds', 'Время запросов к Bot API', ('method',)))
+TELEGRAM_API_ERRORS = REGISTRY.register(Counter(
+    'telegram_api_errors_total', 'Ошибки запросов к Bot API: код HTTP или тип исключения', ('method', 'error')))
+STORE_IO_SECONDS = REGISTRY.register(Histogram(
+    'store_io_seconds', 'Чтение и запись файлов данных, запросы SQLite', ('operation', 'file')))
+SCHEDULER_LAG = REGISTRY.register(Gauge(
+    'scheduler_lag_seconds', 'Опоздание последнего запуска ежедневной задачи', ('job',)))
+register_callback('process_resident_memory_bytes', 'Память процесса (RSS)', resident_memory)
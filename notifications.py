@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Доставка ежедневных уведомлений с догоняющим проходом.
+
+Для каждого чата хранится отметка "последний обработанный день"
+(notifications_state.json). При запуске бота и при каждом срабатывании
+планировщика проверяются все дни после отметки, поэтому поздравления,
+пропущенные из-за перезапуска или сна хостинга, отправляются позже -
+ровно один раз. Дни старше NOTIFY_CATCHUP_DAYS дней не догоняются.
+День отмечается обработанным, только когда все его события подтверждены
+в журнале отправок: если отправка не удалась или событие еще захвачено
+другим процессом, день повторяется при следующем проходе.
+
+NotificationLedger - журнал отправок в SQLite с ключом (chat_id, событие,
+дата). Перед каждой отправкой запись атомарно захватывается, поэтому
+несколько экземпляров бота (пересекающиеся деплои, polling + webhook)
+и повторные запуски не отправляют одно поздравление дважды, а после
+сбоя рассылка продолжается с неотправленных событий.
+
+Режим дайджеста (по умолчанию NOTIFY_MODE=digest, для чата меняется
+командой /notify_mode): все поздравления чата за день собираются в одно
+сообщение, которое при необходимости делится по лимиту Telegram.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Iterable, List, Optional, Tuple
+
+from telegram.error import BadRequest, Forbidden
+
+from store import JsonStore
+
+logger = logging.getLogger(__name__)
+
+# Отправка уведомлений чата за один день: (chat_id, день, опоздание в днях) -> все события
+# дня подтверждены в журнале отправок; ChatUnavailable - чат больше недоступен боту
+DaySender = Callable[[int, date, int], Awaitable[bool]]
+
+
+class ChatUnavailable(Exception):
+    """Чат недоступен боту: уведомления в него больше не отправляются"""
+
+
+def is_chat_unavailable(error: BaseException) -> bool:
+    """Ошибка Telegram означает, что в чат больше нельзя писать (бот удален, чат не найден).
+
+    Сетевые сбои, таймауты и лимиты временные: чат из списка не убирается.
+    """
+    if isinstance(error, Forbidden):
+        return True
+    return isinstance(error, BadRequest) and 'chat not found' in error.message.lower()
+
+
+class NotificationState:
+    """Отметки последнего обработанного дня по чатам"""
+
+    def __init__(self, path: str = 'notifications_state.json', catchup_days: Optional[int] = None):
+        self.store = JsonStore(path)
+        if catchup_days is None:
+            catchup_days = int(os.getenv('NOTIFY_CATCHUP_DAYS', '2'))
+        self.catchup_days = catchup_days
+        # Догоняющий проход при запуске и полуночный запуск не выполняются одновременно
+        self.lock = asyncio.Lock()
+
+    def chats(self) -> List[int]:
+        """Чаты, для которых уже отправлялись уведомления"""
+        return [int(chat_id) for chat_id in self.store.data]
+
+    def last_fired(self, chat_id) -> Optional[date]:
+        value = self.store.data.get(str(chat_id))
+        return date.fromisoformat(value) if value else None
+
+    def mark_fired(self, chat_id, day: date):
+        """Отмечает день обработанным и сразу передает отметку на запись"""
+        self.store.data[str(chat_id)] = day.isoformat()
+        self.store.mark_dirty()
+        self.store.save_now()
+
+    def forget(self, chat_id):
+        """Убирает чат (уведомления отключены или чат недоступен)"""
+        if self.store.data.pop(str(chat_id), None) is not None:
+            self.store.mark_dirty()
+            self.store.save_now()
+
+    def pending_days(self, chat_id, today: date) -> List[date]:
+        """Дни, уведомления за которые еще не отправлены (не старше окна догоняния)"""
+        oldest = today - timedelta(days=self.catchup_days)
+        last = self.last_fired(chat_id)
+        start = today if last is None else max(last + timedelta(days=1), oldest)
+
+        days = []
+        while start <= today:
+            days.append(start)
+            start += timedelta(days=1)
+        return days
+
+
+LEDGER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notifications (
+    chat_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    status TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    claimed_at REAL NOT NULL,
+    sent_at REAL,
+    PRIMARY KEY (chat_id, event_id, day)
+);
+"""
+
+PENDING = 'pending'
+SENT = 'sent'
+
+
+class NotificationLedger:
+    """Журнал отправленных уведомлений: каждое уведомление отправляется один раз"""
+
+    def __init__(self, path: str = 'notifications_ledger.db', lease: Optional[float] = None,
+                 keep_days: int = 90):
+        self.path = path
+        if lease is None:
+            lease = float(os.getenv('NOTIFY_LEDGER_LEASE', '300'))
+        # Захват, не подтвержденный за lease секунд, считается брошенным (процесс упал)
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(LEDGER_SCHEMA)
+        self.prune(keep_days)
+
+    @staticmethod
+    def event_id(kind: str, name: str) -> str:
+        """Идентификатор события: тип и имя записи"""
+        return f"{kind}:{name}"
+
+    def claim(self, chat_id, event_id: str, day: date) -> bool:
+        """Атомарно захватывает отправку; False - уже отправлено или отправляется другим процессом"""
+        now = time.time()
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT INTO notifications (chat_id, event_id, day, status, owner, claimed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (chat_id, event_id, day) DO UPDATE SET owner = excluded.owner, claimed_at = excluded.claimed_at "
+                "WHERE notifications.status = ? AND notifications.claimed_at < ?",
+                (str(chat_id), event_id, day.isoformat(), PENDING, self.owner, now, PENDING, now - self.lease)
+            )
+            return cursor.rowcount == 1
+
+    def confirm(self, chat_id, event_id: str, day: date):
+        """Отмечает уведомление отправленным"""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE notifications SET status = ?, sent_at = ? WHERE chat_id = ? AND event_id = ? AND day = ?",
+                (SENT, time.time(), str(chat_id), event_id, day.isoformat())
+            )
+
+    def release(self, chat_id, event_id: str, day: date):
+        """Снимает захват после неудачной отправки, чтобы ее можно было повторить"""
+        with self._lock:
+            self.conn.execute(
+                "DELETE FROM notifications WHERE chat_id = ? AND event_id = ? AND day = ? AND status = ? AND owner = ?",
+                (str(chat_id), event_id, day.isoformat(), PENDING, self.owner)
+            )
+
+    def all_sent(self, chat_id, event_ids: Iterable[str], day: date) -> bool:
+        """Все ли события чата за день подтверждены (захват без подтверждения не считается)"""
+        event_ids = set(event_ids)
+        if not event_ids:
+            return True
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT event_id FROM notifications WHERE chat_id = ? AND day = ? AND status = ?",
+                (str(chat_id), day.isoformat(), SENT)
+            ).fetchall()
+        return event_ids <= {row[0] for row in rows}
+
+    def was_sent(self, chat_id, event_id: str, day: date) -> bool:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT status FROM notifications WHERE chat_id = ? AND event_id = ? AND day = ?",
+                (str(chat_id), event_id, day.isoformat())
+            ).fetchone()
+        return row is not None and row[0] == SENT
+
+    def prune(self, keep_days: int):
+        """Удаляет записи старше keep_days дней"""
+        oldest = (date.today() - timedelta(days=keep_days)).isoformat()
+        with self._lock:
+            self.conn.execute("DELETE FROM notifications WHERE day < ?", (oldest,))
+
+    async def send_once(self, chat_id, event_id: str, day: date, send: Callable[[], Awaitable[Any]]) -> bool:
+        """Выполняет send(), если уведомление еще не отправлено; False - отправка пропущена"""
+        if not self.claim(chat_id, event_id, day):
+            return False
+        try:
+            await send()
+        except BaseException:
+            self.release(chat_id, event_id, day)
+            raise
+        self.confirm(chat_id, event_id, day)
+        return True
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+DIGEST = 'digest'
+INDIVIDUAL = 'individual'
+NOTIFY_MODES = (DIGEST, INDIVIDUAL)
+
+# Максимальная длина сообщения Telegram (в единицах UTF-16)
+MESSAGE_LIMIT = 4096
+
+
+class NotificationModes:
+    """Режим уведомлений по чатам: дайджест или отдельное сообщение на каждое событие"""
+
+    def __init__(self, path: str = 'notification_modes.json', default: Optional[str] = None):
+        self.store = JsonStore(path)
+        default = default or os.getenv('NOTIFY_MODE', DIGEST)
+        self.default = default if default in NOTIFY_MODES else DIGEST
+
+    def get(self, chat_id) -> str:
+        return self.store.data.get(str(chat_id), self.default)
+
+    def set(self, chat_id, mode: str):
+        if mode not in NOTIFY_MODES:
+            raise ValueError(f"Неизвестный режим уведомлений: {mode}")
+        self.store.data[str(chat_id)] = mode
+        self.store.mark_dirty()
+
+
+def message_length(text: str) -> int:
+    """Длина текста так, как ее считает Telegram (UTF-16)"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _cut(text: str, size: int) -> Tuple[str, str]:
+    """Начало text длиной не больше size единиц UTF-16 и остаток"""
+    units = 0
+    for position, char in enumerate(text):
+        units += 2 if ord(char) > 0xFFFF else 1
+        if units > size:
+            return text[:position], text[position:]
+    return text, ''
+
+
+def split_message(blocks: List[str], header: str = '', limit: int = MESSAGE_LIMIT) -> List[Tuple[str, List[int]]]:
+    """Склеивает блоки через пустую строку в сообщения не длиннее limit.
+
+    Возвращает [(текст, номера блоков, закончившихся в этом сообщении)].
+    Блок длиннее лимита режется на части; заголовок не отправляется отдельно -
+    первый блок при необходимости режется так, чтобы его начало поместилось
+    в сообщение с заголовком.
+    """
+    messages = []
+    current, indexes = header, []
+
+    for index, block in enumerate(blocks):
+        rest = block
+        while rest:
+            candidate = f"{current}\n\n{rest}" if current else rest
+            if message_length(candidate) <= limit:
+                current, rest = candidate, ''
+            elif current and (messages or indexes or current != header):
+                # В сообщении уже есть блоки - остаток начинает следующее
+                messages.append((current, indexes))
+                current, indexes = '', []
+            else:
+                # Пустое сообщение или только заголовок - заполняем его началом блока
+                piece, rest = _cut(rest, limit - message_length(current) - (2 if current else 0))
+                messages.append((f"{current}\n\n{piece}" if current else piece, indexes))
+                current, indexes = '', []
+        indexes.append(index)
+
+    if indexes or (current and not messages):
+        messages.append((current, indexes))
+    return messages
+
+
+async def send_digest(ledger: NotificationLedger, chat_id, day: date, header: str,
+                      items: List[Tuple[str, str]], send: Callable[[str], Awaitable[Any]]) -> int:
+    """Отправляет события чата за день одним сообщением (или несколькими по лимиту).
+
+    items - [(event_id, текст)]. В дайджест попадают только события, которые
+    удалось захватить в журнале отправок; возвращает их количество.
+    """
+    claimed = [(event_id, text) for event_id, text in items if ledger.claim(chat_id, event_id, day)]
+    if not claimed:
+        return 0
+
+    confirmed = set()
+    try:
+        for text, indexes in split_message([text for _, text in claimed], header):
+            await send(text)
+            for index in indexes:
+                ledger.confirm(chat_id, claimed[index][0], day)
+                confirmed.add(index)
+    finally:
+        # Неотправленные части освобождаются при любом выходе, включая отмену задачи
+        for index, (event_id, _) in enumerate(claimed):
+            if index not in confirmed:
+                ledger.release(chat_id, event_id, day)
+    return len(claimed)
+
+
+def late_prefix(delay: int, day: date) -> str:
+    """Пометка для поздравления, отправленного с опозданием"""
+    if delay <= 0:
+        return ""
+    return f"⏰ С опозданием: событие было {day.strftime('%d.%m')}\n\n"
+
+
+async def deliver_pending(state: NotificationState, chats: Iterable[int], today: date,
+                          send_day: DaySender, concurrency: Optional[int] = None,
+                          on_unavailable: Optional[Callable[[int], None]] = None) -> int:
+    """Отправляет уведомления за все необработанные дни; возвращает число обработанных дней.
+
+    Чаты обрабатываются параллельно (не более concurrency одновременно),
+    дни внутри чата - по порядку. Скорость отправки ограничивает лимитер бота.
+    Если send_day вернул False, день и следующие за ним остаются необработанными.
+    Недоступный чат (ChatUnavailable) забывается, on_unavailable(chat_id) вызывается.
+    """
+    if concurrency is None:
+        concurrency = int(os.getenv('NOTIFY_CONCURRENCY', '30'))
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def deliver_chat(chat_id) -> int:
+        delivered = 0
+        async with semaphore:
+            for day in state.pending_days(chat_id, today):
+                try:
+                    complete = await send_day(chat_id, day, (today - day).days)
+                except ChatUnavailable as e:
+                    # Чат недоступен - больше не отправляем в него уведомления
+                    logger.warning("🚫 Чат %s недоступен, уведомления в него отключены: %s",
+                                   chat_id, e.__cause__ or e, extra={'chat_id': chat_id})
+                    state.forget(chat_id)
+                    if on_unavailable is not None:
+                        on_unavailable(chat_id)
+                    break
+                if not complete:
+                    # Часть событий не отправлена или еще отправляется другим процессом:
+                    # отметку не двигаем, день повторится при следующем проходе
+                    logger.warning("⏳ Уведомления за %s в чат %s отправлены не полностью, повтор при следующем проходе",
+                                   day.isoformat(), chat_id, extra={'chat_id': chat_id})
+                    break
+                state.mark_fired(chat_id, day)
+                delivered += 1
+        return delivered
+
+    async with state.lock:
+        chat_ids = sorted(set(chats) | set(state.chats()))
+        results = await asyncio.gather(*(deliver_chat(chat_id) for chat_id in chat_ids), return_exceptions=True)
+
+    delivered = 0
+    for chat_id, result in zip(chat_ids, results):
+        if isinstance(result, Exception):
+            logger.error("❌ Ошибка отправки уведомлений в чат %s: %s", chat_id, result, extra={'chat_id': chat_id})
+        else:
+            delivered += result
+    return delivered
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ограничение скорости исходящих запросов к Telegram.
+
+Все запросы бота проходят через общий AIORateLimiter из
+python-telegram-bot[rate-limiter]:
+  - общий лимит - TELEGRAM_MAX_RATE запросов в секунду;
+  - для групп - TELEGRAM_GROUP_MAX_RATE запросов в минуту на чат;
+  - при RetryAfter запрос повторяется после паузы, которую назвал
+    Telegram (не более TELEGRAM_MAX_RETRIES раз).
+
+Поэтому отправки можно запускать параллельно без ручных asyncio.sleep:
+лимитер сам выстраивает их в очередь и пропускает так быстро, как
+позволяет Telegram.
+
+Запросы идут через один пул HTTP-соединений (PooledRequest): размер
+TELEGRAM_POOL_SIZE, keep-alive TELEGRAM_KEEPALIVE секунд. Пул считает
+занятые соединения, ожидающие запросы и TLS-рукопожатия (pool_stats()),
+а время и ошибки каждого метода Bot API попадают в метрики (metrics.py).
+Время запросов вместе с ожиданием лимитера учитывается в трассировке
+обработчиков (tracing.py).
+"""
+
+import os
+import time
+from typing import Dict
+
+import httpx
+from telegram.error import TelegramError
+from telegram.ext import AIORateLimiter, ExtBot
+from telegram.request import HTTPXRequest
+
+import codec
+import metrics
+import tracing
+
+
+class TracedRateLimiter(AIORateLimiter):
+    """AIORateLimiter, ожидание и запросы которого относятся ко времени telegram обработчика"""
+
+    __slots__ = ()
+
+    async def process_request(self, *args, **kwargs):
+        with tracing.span(tracing.TELEGRAM):
+            return await super().process_request(*args, **kwargs)
+
+
+def create_rate_limiter() -> AIORateLimiter:
+    """Создает лимитер с настройками из переменных окружения"""
+    return TracedRateLimiter(
+        overall_max_rate=float(os.getenv('TELEGRAM_MAX_RATE', '30')),
+        overall_time_period=1,
+        group_max_rate=float(os.getenv('TELEGRAM_GROUP_MAX_RATE', '20')),
+        group_time_period=60,
+        max_retries=int(os.getenv('TELEGRAM_MAX_RETRIES', '3')),
+    )
+
+
+class PooledRequest(HTTPXRequest):
+    """HTTPXRequest с настраиваемым keep-alive и счетчиками пула соединений"""
+
+    __slots__ = ('pool_size', '_keepalive_expiry', '_in_flight', '_requests', '_connections', '_handshakes')
+
+    def __init__(self, connection_pool_size: int, keepalive_expiry: float, pool_timeout: float):
+        # Настройки пула нужны до super().__init__: он сразу создает клиент через _build_client
+        self.pool_size = connection_pool_size
+        self._keepalive_expiry = keepalive_expiry
+        self._in_flight = 0
+        self._requests = 0
+        self._connections = 0
+        self._handshakes = 0
+        super().__init__(connection_pool_size=connection_pool_size, pool_timeout=pool_timeout)
+
+    def _build_client(self) -> httpx.AsyncClient:
+        """Клиент с keep-alive пула и трассировкой соединений (и при повторной инициализации)"""
+        return httpx.AsyncClient(**{
+            **self._client_kwargs,
+            'limits': httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+                keepalive_expiry=self._keepalive_expiry,
+            ),
+            # Трассировка httpcore сообщает об открытии соединений и TLS-рукопожатиях
+            'event_hooks': {'request': [self._attach_trace]},
+        })
+
+    async def _attach_trace(self, request: httpx.Request):
+        request.extensions['trace'] = self._trace
+
+    async def _trace(self, event_name: str, info: Dict):
+        if event_name == 'connection.connect_tcp.complete':
+            self._connections += 1
+        elif event_name == 'connection.start_tls.complete':
+            self._handshakes += 1
+
+    async def do_request(self, url: str, *args, **kwargs):
+        method = url.rsplit('/', 1)[-1]
+        self._in_flight += 1
+        self._requests += 1
+        started = time.perf_counter()
+        try:
+            with tracing.span(tracing.TELEGRAM):
+                code, payload = await super().do_request(url, *args, **kwargs)
+        except Exception as e:
+            metrics.TELEGRAM_API_ERRORS.inc(method, type(e).__name__)
+            raise
+        finally:
+            self._in_flight -= 1
+            metrics.TELEGRAM_API_SECONDS.observe(time.perf_counter() - started, method)
+        if code >= 400:
+            metrics.TELEGRAM_API_ERRORS.inc(method, str(code))
+        return code, payload
+
+    @staticmethod
+    def parse_json_payload(payload: bytes) -> Dict:
+        """Разбирает ответы Telegram быстрым кодеком"""
+        try:
+            return codec.loads(payload)
+        except ValueError as exc:
+            raise TelegramError("Invalid server response") from exc
+
+    def pool_stats(self) -> Dict[str, int]:
+        """Состояние пула: занятые соединения, ожидающие запросы, рукопожатия"""
+        return {
+            'pool_size': self.pool_size,
+            'in_use': min(self._in_flight, self.pool_size),
+            'waiting': max(0, self._in_flight - self.pool_size),
+            'requests': self._requests,
+            'connections_opened': self._connections,
+            'tls_handshakes': self._handshakes,
+        }
+
+
+def create_request() -> PooledRequest:
+    """Пул соединений с настройками из переменных окружения"""
+    return PooledRequest(
+        connection_pool_size=int(os.getenv('TELEGRAM_POOL_SIZE', '16')),
+        keepalive_expiry=float(os.getenv('TELEGRAM_KEEPALIVE', '60')),
+        # Запросов может быть больше, чем соединений: ждем свободное, а не падаем через 1 с
+        pool_timeout=float(os.getenv('TELEGRAM_POOL_TIMEOUT', '10')),
+    )
+
+
+def create_bot(token: str) -> ExtBot:
+    """Общий бот для запуска без Application (веб-хук): один пул соединений и лимитер.
+
+    Перед использованием нужно вызвать await bot.initialize(), при выходе - bot.shutdown().
+    """
+    return ExtBot(token=token, request=create_request(), rate_limiter=create_rate_limiter())
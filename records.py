@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Компактные записи для данных в памяти.
+
+Вместо словаря на каждую запись (с повторяющимися ключами 'day', 'month',
+'year' и восемью ключами у сообщения) используются объекты со __slots__:
+без __dict__ и без хранения имен полей в каждой записи. Имена
+пользователей и типы сообщений интернируются - одинаковые строки
+хранятся один раз, а поле names у свадьбы ссылается на ту же строку,
+что и ключ записи.
+
+Записи ведут себя как словари только для чтения (data['day'],
+data.get('year'), dict(data)), поэтому код ботов не меняется, а в JSON
+они записываются в прежнем виде (codec.py превращает их в словари).
+
+Сравнение памяти на файлах бота:
+    python measure_records.py
+"""
+
+import sys
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class EventRecord(Mapping):
+    """День рождения или свадьба: {'day', 'month', 'year'[, 'names']}"""
+
+    __slots__ = ('day', 'month', 'year', 'names')
+
+    def __init__(self, day: int, month: int, year: Optional[int] = None, names: Optional[str] = None):
+        self.day = day
+        self.month = month
+        self.year = year
+        self.names = names  # Только у свадеб
+
+    @classmethod
+    def from_dict(cls, data: Mapping, name: Optional[str] = None) -> 'EventRecord':
+        """Запись из словаря; name - ключ записи (с ним разделяется строка names)"""
+        if isinstance(data, cls):
+            return data
+        names = data.get('names')
+        if names is not None and names == name:
+            names = name
+        return cls(data['day'], data['month'], data.get('year'), names)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in ('day', 'month', 'year') or (key == 'names' and self.names is not None):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        yield 'day'
+        yield 'month'
+        yield 'year'
+        if self.names is not None:
+            yield 'names'
+
+    def __len__(self) -> int:
+        return 3 if self.names is None else 4
+
+    def __repr__(self) -> str:
+        return f"EventRecord({dict(self)!r})"
+
+
+MESSAGE_FIELDS = ('message_id', 'user_id', 'username', 'first_name', 'date', 'text', 'content_type', 'logged_at')
+
+
+class MessageRecord(Mapping):
+    """Сообщение из журнала (поля MESSAGE_FIELDS)"""
+
+    __slots__ = MESSAGE_FIELDS
+
+    def __init__(self, message_id: int, user_id: Optional[int] = None, username: Optional[str] = None,
+                 first_name: Optional[str] = None, date: Optional[str] = None, text: Optional[str] = None,
+                 content_type: Optional[str] = None, logged_at: Optional[str] = None):
+        self.message_id = message_id
+        self.user_id = user_id
+        self.username = _intern(username)
+        self.first_name = _intern(first_name)
+        self.date = date
+        self.text = text
+        self.content_type = _intern(content_type)
+        self.logged_at = logged_at
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> 'MessageRecord':
+        if isinstance(data, cls):
+            return data
+        return cls(**{field: data.get(field) for field in MESSAGE_FIELDS})
+
+    def __getitem__(self, key: str) -> Any:
+        if key in MESSAGE_FIELDS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(MESSAGE_FIELDS)
+
+    def __len__(self) -> int:
+        return len(MESSAGE_FIELDS)
+
+    def __repr__(self) -> str:
+        return f"MessageRecord({dict(self)!r})"
+
+
+def events_from_json(data: Dict[str, Dict[str, Mapping]]) -> Dict[str, Dict[str, EventRecord]]:
+    """Данные birthdays.json / weddings.json -> {chat_id: {имя: EventRecord}}"""
+    return {
+        sys.intern(chat_id): {name: EventRecord.from_dict(record, name) for name, record in chat_events.items()}
+        for chat_id, chat_events in data.items()
+    }
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Планировщик ежедневных задач внутри цикла событий бота.
+
+Вместо потока с schedule/time.sleep и опроса часов каждые 30-60 секунд
+планировщик - одна задача asyncio в цикле бота: она вычисляет ближайший
+срок в часовом поясе бота и спит ровно до него. Задачи выполняются в том
+же цикле, поэтому используют уже созданного бота и его пул соединений.
+
+    scheduler = DailyScheduler(timezone)
+    scheduler.add_daily_job(self.check_and_send_notifications, '00:00')
+    scheduler.start()  # внутри работающего цикла событий
+"""
+
+import asyncio
+import logging
+from datetime import datetime, time, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Максимальный непрерывный сон: часы системы могут сдвинуться (перевод
+# времени, пауза хоста), поэтому срок перепроверяется хотя бы раз в час
+MAX_SLEEP = 3600
+
+
+class DailyScheduler:
+    """Запускает корутины каждый день в заданное время (часовой пояс бота)"""
+
+    def __init__(self, timezone, max_sleep: float = MAX_SLEEP):
+        self.timezone = timezone
+        self.max_sleep = max_sleep
+        self.jobs: List[Dict] = []  # [{'name', 'at', 'callback', 'run_on_start', 'next_run'}]
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._running_jobs = set()
+
+    def add_daily_job(self, callback: Callable[[], Awaitable], at: str = '00:00',
+                      name: Optional[str] = None, run_on_start: bool = False):
+        """Добавляет ежедневную задачу; at - время в формате ЧЧ:ММ.
+
+        run_on_start - выполнить задачу сразу при запуске планировщика
+        (догоняющий проход после перезапуска или сна)."""
+        hour, minute = (int(part) for part in at.split(':'))
+        job = {
+            'name': name or getattr(callback, '__name__', 'job'),
+            'at': time(hour, minute),
+            'callback': callback,
+            'run_on_start': run_on_start,
+            'next_run': None,
+        }
+        job['next_run'] = self.next_run_time(job['at'], datetime.now(self.timezone))
+        self.jobs.append(job)
+
+        # Новая задача может оказаться раньше текущего срока сна
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _localize(self, moment: datetime) -> datetime:
+        localize = getattr(self.timezone, 'localize', None)  # pytz
+        if localize is not None:
+            return localize(moment)
+        return moment.replace(tzinfo=self.timezone)
+
+    def next_run_time(self, at: time, after: datetime) -> datetime:
+        """Ближайший момент строго позже after, когда на часах будет at"""
+        day = after.astimezone(self.timezone).date()
+        while True:
+            candidate = self._localize(datetime.combine(day, at))
+            if candidate > after:
+                return candidate
+            day += timedelta(days=1)
+
+    def next_due(self) -> Optional[datetime]:
+        """Ближайший срок среди всех задач"""
+        if not self.jobs:
+            return None
+        return min(job['next_run'] for job in self.jobs)
+
+    def start(self):
+        """Запускает планировщик в текущем цикле событий"""
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        for job in self.jobs:
+            if job['run_on_start']:
+                self._launch(job)
+        due = self.next_due()
+        if due is not None:
+            logger.info("🔔 Планировщик уведомлений запущен, ближайший запуск: %s", due.strftime('%d.%m.%Y %H:%M %Z'))
+
+    async def stop(self):
+        """Останавливает планировщик и дожидается выполняющихся задач"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._running_jobs:
+            await asyncio.gather(*self._running_jobs, return_exceptions=True)
+
+    async def _sleep_until(self, due: datetime):
+        """Спит до срока (не дольше max_sleep) или до добавления новой задачи"""
+        delay = (due - datetime.now(self.timezone)).total_seconds()
+        if delay <= 0:
+            return
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay, self.max_sleep))
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self):
+        while True:
+            due = self.next_due()
+            if due is None:
+                # Задач нет - ждем, пока их добавят
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = datetime.now(self.timezone)
+            if due > now:
+                await self._sleep_until(due)
+                continue
+
+            for job in self.jobs:
+                if job['next_run'] <= now:
+                    # Насколько позже срока запускается задача (сон хоста, занятый цикл)
+                    metrics.SCHEDULER_LAG.set((now - job['next_run']).total_seconds(), job['name'])
+                    job['next_run'] = self.next_run_time(job['at'], now)
+                    self._launch(job)
+
+    def _launch(self, job: Dict):
+        """Выполняет задачу отдельной задачей asyncio, чтобы не задерживать расписание"""
+        task = asyncio.get_running_loop().create_task(self._run_job(job))
+        self._running_jobs.add(task)
+        task.add_done_callback(self._running_jobs.discard)
+
+    async def _run_job(self, job: Dict):
+        started = datetime.now(self.timezone)
+        logger.info("🔔 Запуск задачи %s: %s", job['name'], started.strftime('%H:%M:%S'))
+        try:
+            await job['callback']()
+        except Exception as e:
+            logger.exception("❌ Ошибка в задаче %s: %s", job['name'], e)
@@ -11,6 +11,8 @@ import sys
 import requests
 from dotenv import load_dotenv
 
+from webhook_server import webhook_secret
+
 # Загружаем переменные окружения
 load_dotenv()
 
@@ -46,7 +48,8 @@ def setup_webhook():
     params = {
         'url': full_webhook_url,
         'allowed_updates': ['message', 'callback_query'],
-        'ip_address': RENDER_IPS[0]  # Используем первый IP из списка
+        'ip_address': RENDER_IPS[0],  # Используем первый IP из списка
+        'secret_token': webhook_secret(BOT_TOKEN)  # Без него веб-сервер бота отклоняет запросы
     }
     
     try:
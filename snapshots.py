@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Автоматические снимки данных (дни рождения и свадьбы).
+
+Снимок - манифест snapshots/manifests/<id>.json со ссылками на объекты
+snapshots/objects/<sha256>.json.gz: содержимое каждого хранилища сжимается
+gzip и лежит под своей контрольной суммой. Неизменившиеся данные между
+снимками не дублируются, а снимок без изменений не создается.
+
+Снимки делаются раз в SNAPSHOT_INTERVAL секунд и после каждых
+SNAPSHOT_EVERY изменений записей. Состояние копируется в цикле событий
+одной сериализацией данных в памяти (без чтения файлов), а хэширование,
+сжатие и запись выполняются в отдельном потоке.
+
+Хранятся SNAPSHOT_KEEP_LAST последних снимков и по одному снимку на каждый
+из последних SNAPSHOT_KEEP_HOURLY часов, SNAPSHOT_KEEP_DAILY дней и
+SNAPSHOT_KEEP_WEEKLY недель; объекты, на которые не ссылается ни один
+снимок, удаляются.
+
+Восстановление - командой /restore (администратор) или из консоли при
+остановленном боте:
+    python snapshots.py list
+    python snapshots.py take
+    python snapshots.py restore 20261018_120000
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import codec
+from atomic_file import CorruptFileError, replace_file
+from store import BIRTHDAYS, WEDDINGS, Storage, create_storage
+
+logger = logging.getLogger(__name__)
+
+KINDS = (BIRTHDAYS, WEDDINGS)
+
+# Уровни хранения: (переменная окружения, значение по умолчанию, формат ключа периода)
+RETENTION_TIERS = (
+    ('SNAPSHOT_KEEP_HOURLY', 24, '%Y%m%d%H'),
+    ('SNAPSHOT_KEEP_DAILY', 7, '%Y%m%d'),
+    ('SNAPSHOT_KEEP_WEEKLY', 4, '%G%V'),
+)
+
+
+class SnapshotManager:
+    """Инкрементальные сжатые снимки хранилища с уровнями хранения"""
+
+    def __init__(self, storage: Storage, directory: str = 'snapshots',
+                 every: Optional[int] = None, interval: Optional[float] = None):
+        self.storage = storage
+        self.directory = Path(directory)
+        self.objects_dir = self.directory / 'objects'
+        self.manifests_dir = self.directory / 'manifests'
+        self.every = max(1, every or int(os.getenv('SNAPSHOT_EVERY', '20')))
+        self.interval = interval or float(os.getenv('SNAPSHOT_INTERVAL', '3600'))
+        self.keep_last = max(1, int(os.getenv('SNAPSHOT_KEEP_LAST', '10')))
+        self.tiers = [(int(os.getenv(name, str(default))), key) for name, default, key in RETENTION_TIERS]
+        self._mutations = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Optional[asyncio.Task] = None
+
+        storage.add_change_listener(self._on_change)
+
+    # === СОЗДАНИЕ СНИМКОВ ===
+
+    def _on_change(self, kind: str):
+        self._mutations += 1
+        if self._mutations < self.every:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Нет цикла событий (консольные скрипты) - снимок сразу
+            self.write(self.capture(), 'changes')
+            return
+        if self._pending is None or self._pending.done():
+            self._pending = loop.create_task(self.snapshot('changes'))
+
+    def capture(self) -> Dict[str, bytes]:
+        """Копия текущего состояния: сериализация данных в памяти"""
+        self._mutations = 0
+        return {kind: codec.dumps(self.storage.export_events(kind)) for kind in KINDS}
+
+    async def snapshot(self, reason: str = 'schedule') -> str:
+        """Делает снимок, не блокируя цикл событий; возвращает его id"""
+        payloads = self.capture()
+        async with self._lock:
+            return await asyncio.to_thread(self.write, payloads, reason)
+
+    def write(self, payloads: Dict[str, bytes], reason: str) -> str:
+        """Сохраняет объекты и манифест снимка (выполняется в отдельном потоке)"""
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.manifests_dir.mkdir(parents=True, exist_ok=True)
+
+        objects = {kind: self._store_object(payload) for kind, payload in payloads.items()}
+        latest = self.latest()
+        if latest is not None and latest['objects'] == objects:
+            return latest['id']  # Ничего не изменилось
+
+        now = datetime.now()
+        snapshot_id = now.strftime('%Y%m%d_%H%M%S')
+        suffix = 1
+        while (self.manifests_dir / f"{snapshot_id}.json").exists():
+            snapshot_id = f"{now.strftime('%Y%m%d_%H%M%S')}_{suffix}"
+            suffix += 1
+
+        manifest = {
+            'id': snapshot_id,
+            'created': now.isoformat(timespec='seconds'),
+            'reason': reason,
+            'objects': objects,
+        }
+        replace_file(str(self.manifests_dir / f"{snapshot_id}.json"), codec.dumps(manifest))
+        self.prune()
+        return snapshot_id
+
+    def _store_object(self, payload: bytes) -> Dict:
+        digest = hashlib.sha256(payload).hexdigest()
+        path = self.objects_dir / f"{digest}.json.gz"
+        if not path.exists():
+            replace_file(str(path), gzip.compress(payload, mtime=0))
+        return {'sha256': digest, 'size': len(payload)}
+
+    # === СПИСОК И ХРАНЕНИЕ ===
+
+    def list(self) -> List[Dict]:
+        """Манифесты снимков, новые первыми"""
+        if not self.manifests_dir.exists():
+            return []
+        manifests = []
+        for path in self.manifests_dir.glob('*.json'):
+            try:
+                manifests.append(codec.loads(path.read_bytes()))
+            except (OSError, ValueError) as e:
+                logger.error("Ошибка чтения снимка %s: %s", path.name, e)
+        manifests.sort(key=lambda manifest: (manifest['created'], manifest['id']), reverse=True)
+        return manifests
+
+    def latest(self) -> Optional[Dict]:
+        manifests = self.list()
+        return manifests[0] if manifests else None
+
+    def prune(self):
+        """Удаляет снимки вне уровней хранения и объекты без ссылок"""
+        manifests = self.list()
+        if not manifests:
+            return
+
+        keep = {manifest['id'] for manifest in manifests[:self.keep_last]}
+        for count, key_format in self.tiers:
+            periods = set()
+            for manifest in manifests:
+                period = datetime.fromisoformat(manifest['created']).strftime(key_format)
+                if period in periods:
+                    continue
+                if len(periods) >= count:
+                    break
+                periods.add(period)
+                keep.add(manifest['id'])
+
+        referenced = set()
+        for manifest in manifests:
+            if manifest['id'] in keep:
+                referenced.update(entry['sha256'] for entry in manifest['objects'].values())
+            else:
+                (self.manifests_dir / f"{manifest['id']}.json").unlink(missing_ok=True)
+
+        for path in self.objects_dir.glob('*.json.gz'):
+            if path.name[:-len('.json.gz')] not in referenced:
+                path.unlink(missing_ok=True)
+
+    # === ВОССТАНОВЛЕНИЕ ===
+
+    def load(self, snapshot_id: str) -> Dict[str, Dict]:
+        """Данные снимка {kind: данные}; KeyError - снимка нет"""
+        path = self.manifests_dir / f"{snapshot_id}.json"
+        if not re.fullmatch(r'\d{8}_\d{6}(_\d+)?', snapshot_id) or not path.exists():
+            raise KeyError(snapshot_id)
+        manifest = codec.loads(path.read_bytes())
+
+        data = {}
+        for kind, entry in manifest['objects'].items():
+            payload = gzip.decompress((self.objects_dir / f"{entry['sha256']}.json.gz").read_bytes())
+            if hashlib.sha256(payload).hexdigest() != entry['sha256']:
+                raise CorruptFileError(f"объект {entry['sha256']} снимка {snapshot_id} поврежден")
+            data[kind] = codec.loads(payload)
+        return data
+
+    def _apply(self, data: Dict[str, Dict]) -> Dict[str, int]:
+        for kind, events in data.items():
+            self.storage.replace_events(kind, events)
+        self._mutations = 0
+        return {kind: sum(len(chat_events) for chat_events in events.values()) for kind, events in data.items()}
+
+    async def restore(self, snapshot_id: str) -> Dict[str, int]:
+        """Восстанавливает данные из снимка; текущее состояние сначала сохраняется снимком"""
+        data = await asyncio.to_thread(self.load, snapshot_id)
+        await self.snapshot('before-restore')
+        return self._apply(data)
+
+    def restore_sync(self, snapshot_id: str) -> Dict[str, int]:
+        """То же для консольного запуска (без цикла событий)"""
+        data = self.load(snapshot_id)
+        self.write(self.capture(), 'before-restore')
+        return self._apply(data)
+
+    # === ПЛАНИРОВЩИК ===
+
+    def start(self):
+        """Запускает периодические снимки в текущем цикле событий"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.snapshot('schedule')
+            except Exception as e:
+                logger.exception("❌ Ошибка создания снимка: %s", e)
+
+    async def stop(self):
+        """Останавливает снимки и сохраняет последний"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.snapshot('shutdown')
+        except Exception as e:
+            logger.exception("❌ Ошибка создания снимка при остановке: %s", e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Снимки данных бота (дни рождения и свадьбы)')
+    parser.add_argument('--dir', default='.', help='Каталог с данными бота')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help='Показать снимки')
+    subparsers.add_parser('take', help='Сделать снимок сейчас')
+    restore_parser = subparsers.add_parser('restore', help='Восстановить данные из снимка (бот должен быть остановлен)')
+    restore_parser.add_argument('snapshot_id', help='Идентификатор снимка из списка')
+
+    args = parser.parse_args()
+    data_dir = Path(args.dir)
+    storage = create_storage(
+        str(data_dir / 'birthdays.json'),
+        str(data_dir / 'weddings.json'),
+        messages_log_file=str(data_dir / 'messages_log.json'),
+        messages_log_dir=str(data_dir / 'messages_log')
+    )
+    manager = SnapshotManager(storage, str(data_dir / 'snapshots'))
+
+    if args.command == 'list':
+        for manifest in manager.list():
+            sizes = ', '.join(f"{kind}: {entry['size']} байт" for kind, entry in manifest['objects'].items())
+            print(f"{manifest['id']}  {manifest['reason']:14} {sizes}")
+    elif args.command == 'take':
+        print(f"✅ Снимок {manager.write(manager.capture(), 'manual')}")
+    elif args.command == 'restore':
+        try:
+            counts = manager.restore_sync(args.snapshot_id)
+        except KeyError:
+            print(f"❌ Снимок {args.snapshot_id} не найден")
+            return
+        print(f"✅ Восстановлено из {args.snapshot_id}: {counts.get(BIRTHDAYS, 0)} дней рождения, "
+              f"{counts.get(WEDDINGS, 0)} свадеб")
+
+    storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Хранилище на SQLite (режим WAL).
+
+Включается переменной окружения STORAGE_BACKEND=sqlite, путь к базе
+задается SQLITE_PATH (по умолчанию bot.db рядом с birthdays.json).
+При первом запуске база заполняется из birthdays.json, weddings.json
+и журнала сообщений.
+
+Разовый перенос JSON-файлов (если текущий файл испорчен - самой новой
+целой резервной копии *_backup_*.json):
+    python sqlite_store.py import --db bot.db
+"""
+
+import argparse
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import codec
+import metrics
+import tracing
+from message_log import MessageLog
+from records import EventRecord
+from store import BIRTHDAYS, WEDDINGS, Storage, date_ranges, next_occurrence
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS birthdays (
+    chat_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    year INTEGER,
+    PRIMARY KEY (chat_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_birthdays_date ON birthdays (chat_id, month, day);
+CREATE INDEX IF NOT EXISTS idx_birthdays_month_day ON birthdays (month, day);
+
+CREATE TABLE IF NOT EXISTS weddings (
+    chat_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    year INTEGER,
+    names TEXT,
+    PRIMARY KEY (chat_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_weddings_date ON weddings (chat_id, month, day);
+CREATE INDEX IF NOT EXISTS idx_weddings_month_day ON weddings (month, day);
+
+CREATE TABLE IF NOT EXISTS messages (
+    chat_id TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    user_id INTEGER,
+    username TEXT,
+    first_name TEXT,
+    date TEXT,
+    text TEXT,
+    content_type TEXT,
+    logged_at TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_chat_message ON messages (chat_id, message_id);
+
+CREATE TABLE IF NOT EXISTS message_edits (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    user_id INTEGER,
+    username TEXT,
+    edited_time TEXT,
+    original_text TEXT,
+    new_text TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_message_edits_chat_message ON message_edits (chat_id, message_id);
+"""
+
+MESSAGE_COLUMNS = ('message_id', 'user_id', 'username', 'first_name', 'date', 'text', 'content_type', 'logged_at')
+EDIT_COLUMNS = ('message_id', 'user_id', 'username', 'edited_time', 'original_text', 'new_text')
+
+
+class SqliteStorage(Storage):
+    """Хранилище дней рождения, свадеб и журнала сообщений в SQLite"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._db_name = os.path.basename(db_path)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def _execute(self, sql: str, params=()) -> List[sqlite3.Row]:
+        with tracing.span(tracing.STORAGE), self._lock, metrics.STORE_IO_SECONDS.time('sqlite', self._db_name):
+            return self.conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _table(kind: str) -> str:
+        if kind not in (BIRTHDAYS, WEDDINGS):
+            raise ValueError(f"Неизвестный тип записей: {kind}")
+        return kind
+
+    @staticmethod
+    def _record(kind: str, row: sqlite3.Row) -> EventRecord:
+        return EventRecord(row['day'], row['month'], row['year'], row['names'] if kind == WEDDINGS else None)
+
+    # === ДНИ РОЖДЕНИЯ И СВАДЬБЫ ===
+
+    def get_events(self, kind: str, chat_id) -> Dict[str, Dict]:
+        rows = self._execute(
+            f"SELECT * FROM {self._table(kind)} WHERE chat_id = ? ORDER BY month, day",
+            (str(chat_id),)
+        )
+        return {row['name']: self._record(kind, row) for row in rows}
+
+    def add_event(self, kind: str, chat_id, name: str, record: Dict):
+        if kind == WEDDINGS:
+            self._execute(
+                "INSERT OR REPLACE INTO weddings (chat_id, name, day, month, year, names) VALUES (?, ?, ?, ?, ?, ?)",
+                (str(chat_id), name, record['day'], record['month'], record.get('year'), record.get('names', name))
+            )
+        else:
+            self._execute(
+                "INSERT OR REPLACE INTO birthdays (chat_id, name, day, month, year) VALUES (?, ?, ?, ?, ?)",
+                (str(chat_id), name, record['day'], record['month'], record.get('year'))
+            )
+        self._changed(kind)
+
+    def delete_event(self, kind: str, chat_id, name: str) -> bool:
+        with self._lock:
+            cursor = self.conn.execute(
+                f"DELETE FROM {self._table(kind)} WHERE chat_id = ? AND name = ?",
+                (str(chat_id), name)
+            )
+        if cursor.rowcount == 0:
+            return False
+        self._changed(kind)
+        return True
+
+    def count_events(self, kind: str, chat_id) -> int:
+        rows = self._execute(f"SELECT COUNT(*) FROM {self._table(kind)} WHERE chat_id = ?", (str(chat_id),))
+        return rows[0][0]
+
+    def events_on(self, kind: str, chat_id, month: int, day: int) -> Dict[str, Dict]:
+        rows = self._execute(
+            f"SELECT * FROM {self._table(kind)} WHERE chat_id = ? AND month = ? AND day = ?",
+            (str(chat_id), month, day)
+        )
+        return {row['name']: self._record(kind, row) for row in rows}
+
+    def upcoming_events(self, kind: str, chat_id, today: date, days: int) -> List[Tuple[str, Dict, int, date]]:
+        upcoming = []
+        for (start_month, start_day), (end_month, end_day) in date_ranges(today, days):
+            rows = self._execute(
+                f"SELECT * FROM {self._table(kind)} WHERE chat_id = ? "
+                f"AND (month, day) BETWEEN (?, ?) AND (?, ?)",
+                (str(chat_id), start_month, start_day, end_month, end_day)
+            )
+            for row in rows:
+                occurrence = next_occurrence(today, row['month'], row['day'])
+                if occurrence is None:
+                    continue
+                days_until = (occurrence - today).days
+                if days_until <= days:
+                    upcoming.append((row['name'], self._record(kind, row), days_until, occurrence))
+        upcoming.sort(key=lambda x: x[2])
+        return upcoming
+
+    def all_events_on(self, kind: str, month: int, day: int) -> List[Tuple[str, str, Dict]]:
+        rows = self._execute(
+            f"SELECT * FROM {self._table(kind)} WHERE month = ? AND day = ?",
+            (month, day)
+        )
+        return [(row['chat_id'], row['name'], self._record(kind, row)) for row in rows]
+
+    # === ЖУРНАЛ СООБЩЕНИЙ ===
+
+    def log_message(self, chat_id, record: Dict):
+        self._execute(
+            f"INSERT OR REPLACE INTO messages (chat_id, {', '.join(MESSAGE_COLUMNS)}) "
+            f"VALUES (?, {', '.join('?' for _ in MESSAGE_COLUMNS)})",
+            (str(chat_id), *(record.get(column) for column in MESSAGE_COLUMNS))
+        )
+
+    def log_edit(self, chat_id, record: Dict):
+        self._execute(
+            f"INSERT INTO message_edits (chat_id, {', '.join(EDIT_COLUMNS)}) "
+            f"VALUES (?, {', '.join('?' for _ in EDIT_COLUMNS)})",
+            (str(chat_id), *(record.get(column) for column in EDIT_COLUMNS))
+        )
+
+    def get_logged_message(self, chat_id, message_id) -> Optional[Dict]:
+        rows = self._execute(
+            f"SELECT {', '.join(MESSAGE_COLUMNS)} FROM messages WHERE chat_id = ? AND message_id = ?",
+            (str(chat_id), int(message_id))
+        )
+        return dict(rows[0]) if rows else None
+
+    def message_stats(self, chat_id) -> Dict[str, int]:
+        messages = self._execute("SELECT COUNT(*) FROM messages WHERE chat_id = ?", (str(chat_id),))
+        edited = self._execute("SELECT COUNT(*) FROM message_edits WHERE chat_id = ?", (str(chat_id),))
+        return {'messages': messages[0][0], 'edited': edited[0][0]}
+
+    def chat_messages(self, chat_id, limit: Optional[int] = None) -> Dict[str, Dict]:
+        sql = f"SELECT {', '.join(MESSAGE_COLUMNS)} FROM messages WHERE chat_id = ? ORDER BY rowid DESC"
+        params = [str(chat_id)]
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = self._execute(sql, params)
+        return {str(row['message_id']): dict(row) for row in reversed(rows)}
+
+    def export_events(self, kind: str) -> Dict[str, Dict[str, Dict]]:
+        result = {}
+        for row in self._execute(f"SELECT * FROM {self._table(kind)} ORDER BY chat_id, month, day"):
+            result.setdefault(row['chat_id'], {})[row['name']] = self._record(kind, row)
+        return result
+
+    def replace_events(self, kind: str, data: Dict[str, Dict[str, Dict]]):
+        self._import(kind, data, replace=True)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    # === ИМПОРТ ===
+
+    def import_events(self, kind: str, data: Dict) -> int:
+        """Импортирует данные в формате birthdays.json / weddings.json"""
+        return self._import(kind, data)
+
+    def _import(self, kind: str, data: Dict, replace: bool = False) -> int:
+        count = 0
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                if replace:
+                    self.conn.execute(f"DELETE FROM {self._table(kind)}")
+                for chat_id, chat_events in data.items():
+                    for name, record in chat_events.items():
+                        if kind == WEDDINGS:
+                            self.conn.execute(
+                                "INSERT OR REPLACE INTO weddings (chat_id, name, day, month, year, names) "
+                                "VALUES (?, ?, ?, ?, ?, ?)",
+                                (str(chat_id), name, record['day'], record['month'],
+                                 record.get('year'), record.get('names', name))
+                            )
+                        else:
+                            self.conn.execute(
+                                "INSERT OR REPLACE INTO birthdays (chat_id, name, day, month, year) "
+                                "VALUES (?, ?, ?, ?, ?)",
+                                (str(chat_id), name, record['day'], record['month'], record.get('year'))
+                            )
+                        count += 1
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return count
+
+    def import_messages_log(self, data: Dict) -> int:
+        """Импортирует данные в формате messages_log.json"""
+        count = 0
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                for chat_id, chat_log in data.items():
+                    for key, record in chat_log.items():
+                        if key == 'edited':
+                            continue
+                        self.conn.execute(
+                            f"INSERT OR REPLACE INTO messages (chat_id, {', '.join(MESSAGE_COLUMNS)}) "
+                            f"VALUES (?, {', '.join('?' for _ in MESSAGE_COLUMNS)})",
+                            (str(chat_id), *(record.get(column) for column in MESSAGE_COLUMNS))
+                        )
+                        count += 1
+                    for record in chat_log.get('edited', []):
+                        exists = self.conn.execute(
+                            "SELECT 1 FROM message_edits WHERE chat_id = ? AND message_id = ? AND edited_time IS ?",
+                            (str(chat_id), record.get('message_id'), record.get('edited_time'))
+                        ).fetchone()
+                        if exists:
+                            continue
+                        self.conn.execute(
+                            f"INSERT INTO message_edits (chat_id, {', '.join(EDIT_COLUMNS)}) "
+                            f"VALUES (?, {', '.join('?' for _ in EDIT_COLUMNS)})",
+                            (str(chat_id), *(record.get(column) for column in EDIT_COLUMNS))
+                        )
+                        count += 1
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return count
+
+
+def _load_json(path: Path) -> Dict:
+    return codec.read_file(path)
+
+
+def _backup_timestamp(path: Path) -> str:
+    """Время создания резервной копии из имени файла (..._ГГГГММДД_ЧЧММСС.json)"""
+    match = re.search(r'(\d{8}_\d{6})', path.name)
+    return match.group(1) if match else ''
+
+
+def newest_valid(paths: List[Path]) -> Optional[Path]:
+    """Самый новый из файлов (список от старых к новым), который читается целиком.
+
+    Более старые копии не импортируются: запись, удаленная позже, вернулась бы
+    из них обратно. Пропущенные файлы выводятся в журнал.
+    """
+    chosen = None
+    for path in reversed(paths):
+        if not path.exists():
+            continue
+        if chosen is not None:
+            logger.info("⏭️ %s пропущен: есть более новая копия %s", path.name, chosen.name)
+            continue
+        try:
+            _load_json(path)
+        except (OSError, ValueError) as e:
+            logger.warning("⏭️ %s пропущен: файл не читается (%s)", path.name, e)
+            continue
+        chosen = path
+    return chosen
+
+
+def import_files(storage: SqliteStorage, birthdays_files: List[Path], weddings_files: List[Path],
+                 messages_log_files: List[Path], messages_log_dir: Optional[Path] = None) -> Dict[str, int]:
+    """Импортирует JSON-файлы по порядку (более поздние файлы перекрывают более ранние)"""
+    totals = {BIRTHDAYS: 0, WEDDINGS: 0, 'messages': 0}
+
+    for path in birthdays_files:
+        if path.exists():
+            count = storage.import_events(BIRTHDAYS, _load_json(path))
+            totals[BIRTHDAYS] += count
+            logger.info("📥 %s: %s дней рождения", path.name, count)
+
+    for path in weddings_files:
+        if path.exists():
+            count = storage.import_events(WEDDINGS, _load_json(path))
+            totals[WEDDINGS] += count
+            logger.info("📥 %s: %s свадеб", path.name, count)
+
+    for path in messages_log_files:
+        if path.exists():
+            count = storage.import_messages_log(_load_json(path))
+            totals['messages'] += count
+            logger.info("📥 %s: %s записей журнала", path.name, count)
+
+    if messages_log_dir is not None and messages_log_dir.is_dir():
+        log = MessageLog(str(messages_log_dir))
+        count = storage.import_messages_log(log.export_legacy())
+        log.close()
+        totals['messages'] += count
+        logger.info("📥 %s/: %s записей журнала", messages_log_dir.name, count)
+
+    return totals
+
+
+def open_sqlite_storage(db_path: str, birthdays_file: str, weddings_file: str,
+                        messages_log_file: str, messages_log_dir: str = 'messages_log') -> SqliteStorage:
+    """Открывает базу, при первом запуске переносит в нее текущие JSON-файлы.
+
+    Перенос идет во временную базу, которая переименовывается в db_path только
+    после успешного импорта: если процесс упал посреди переноса, при следующем
+    запуске он начнется заново.
+    """
+    if not Path(db_path).exists():
+        importing = f"{db_path}.importing"
+        _remove_database(importing)  # Остаток прерванного переноса
+        storage = SqliteStorage(importing)
+        try:
+            import_files(storage, [Path(birthdays_file)], [Path(weddings_file)],
+                         [Path(messages_log_file)], Path(messages_log_dir))
+            storage.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except Exception as e:
+            storage.close()
+            _remove_database(importing)
+            logger.exception("Ошибка переноса данных в SQLite (повтор: python sqlite_store.py import): %s", e)
+        else:
+            storage.close()
+            os.replace(importing, db_path)
+
+    return SqliteStorage(db_path)
+
+
+def _remove_database(path: str):
+    """Удаляет файл базы вместе с файлами WAL"""
+    for name in (path, f"{path}-wal", f"{path}-shm"):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+def import_directory(storage: SqliteStorage, data_dir: Path, backups: bool = True) -> Dict[str, int]:
+    """Импортирует каталог с данными бота.
+
+    Для дней рождения и свадеб берется одна версия - текущий файл или, если он
+    отсутствует или испорчен, самая новая целая резервная копия *_backup_*.json.
+    """
+    # Кандидаты от старых к новым: резервные копии по времени в имени, затем текущий файл
+    copies = sorted(data_dir.glob('*_backup_*.json'), key=_backup_timestamp) if backups else []
+    sources = {}
+    for kind in (BIRTHDAYS, WEDDINGS):
+        candidates = [p for p in copies if p.name.startswith(f'{kind}_')] + [data_dir / f'{kind}.json']
+        chosen = newest_valid(candidates)
+        sources[kind] = [chosen] if chosen is not None else []
+
+    return import_files(storage, sources[BIRTHDAYS], sources[WEDDINGS],
+                        [data_dir / 'messages_log.json'], data_dir / 'messages_log')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Перенос JSON-данных бота в SQLite')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help='Импортировать JSON-файлы в базу')
+    import_parser.add_argument('--db', default='bot.db', help='Файл базы данных (по умолчанию bot.db)')
+    import_parser.add_argument('--dir', default='.', help='Каталог с JSON-файлами')
+    import_parser.add_argument('--no-backups', action='store_true', help='Не использовать *_backup_*.json, даже если текущий файл испорчен')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    data_dir = Path(args.dir)
+
+    storage = SqliteStorage(args.db)
+    totals = import_directory(storage, data_dir, backups=not args.no_backups)
+    storage.close()
+
+    print(f"✅ Импорт в {args.db} завершен: {totals[BIRTHDAYS]} дней рождения, "
+          f"{totals[WEDDINGS]} свадеб, {totals['messages']} записей журнала")
+
+
+if __name__ == "__main__":
+    main()
@@ -93,6 +93,8 @@ if __name__ == "__main__":
         # Импортируем и запускаем бота
         try:
             from main import BirthdayBot
+            from structured_log import setup_logging
+            setup_logging()
             bot = BirthdayBot()
             bot.run()
         except KeyboardInterrupt:
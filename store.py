@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Хранилище данных бота.
+
+JsonStore: файл читается один раз при запуске, все команды работают
+с данными в памяти, а изменения сбрасываются на диск фоновой задачей
+не чаще, чем раз в STORE_FLUSH_DELAY секунд. Данные сериализуются в цикле
+событий, а сама запись идет в пуле ввода-вывода (file_io.py).
+
+Storage: общий интерфейс операций, которые используют боты. Реализации:
+JsonStorage (JSON-файлы + журнал сообщений) и SqliteStorage (sqlite_store.py).
+Выбор - переменная окружения STORAGE_BACKEND. Записи в памяти - компактные
+EventRecord (records.py), которые читаются как словари.
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import codec
+from atomic_file import CorruptFileError
+from date_index import DateIndex
+from file_io import writer_for
+from message_log import open_message_log
+from records import EventRecord, events_from_json
+from tracing import TracedStorage
+
+logger = logging.getLogger(__name__)
+
+
+class JsonStore:
+    """JSON-файл, загруженный в память, с отложенной (write-behind) записью"""
+
+    def __init__(self, path: str, flush_delay: Optional[float] = None):
+        self.path = path
+        if flush_delay is None:
+            flush_delay = float(os.getenv('STORE_FLUSH_DELAY', '2'))
+        self.flush_delay = flush_delay
+        self.data = self._read()
+        self.writer = writer_for(path)
+        self._dirty = False
+        self._flush_task = None
+
+        # Гарантируем, что несохраненные изменения попадут на диск при выходе
+        atexit.register(self.flush)
+
+    def _read(self) -> Dict:
+        """Читает файл с диска (только при запуске).
+
+        Нет файла - пустые данные; испорченный файл без целой копии останавливает
+        запуск (CorruptFileError), чтобы не перезаписать данные пустыми.
+        """
+        try:
+            return codec.read_file(self.path)
+        except FileNotFoundError:
+            return {}
+        except CorruptFileError as e:
+            logger.critical("❌ Файл %s поврежден, запуск остановлен: %s", self.path, e)
+            raise
+
+    def replace(self, data: Dict):
+        """Заменяет данные в памяти и планирует запись на диск"""
+        self.data = data
+        self.mark_dirty()
+
+    def mark_dirty(self):
+        """Отмечает данные измененными и планирует отложенную запись"""
+        self._dirty = True
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Нет работающего цикла событий (скрипты, потоки) - пишем сразу
+            self.flush()
+            return
+
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        """Ждет окончания окна накопления изменений и передает файл на запись"""
+        await asyncio.sleep(self.flush_delay)
+        self.save_now()
+
+    def save_now(self):
+        """Передает текущие данные на запись без окна накопления (запись - в фоне)"""
+        if not self._dirty:
+            return
+        try:
+            self.writer.submit(codec.dumps(self.data))
+            self._dirty = False
+        except Exception as e:
+            logger.error("Ошибка сохранения файла %s: %s", self.path, e)
+
+    def flush(self):
+        """Немедленно записывает данные на диск, если они изменились (синхронно)"""
+        try:
+            if self._dirty:
+                self.writer.submit(codec.dumps(self.data))
+                self._dirty = False
+            self.writer.flush()
+        except Exception as e:
+            logger.error("Ошибка сохранения файла %s: %s", self.path, e)
+
+
+# === ОБЩИЙ ИНТЕРФЕЙС ХРАНИЛИЩА ===
+
+BIRTHDAYS = 'birthdays'
+WEDDINGS = 'weddings'
+
+
+def next_occurrence(today: date, month: int, day: int) -> Optional[date]:
+    """Ближайшая (сегодня или позже) дата события, None для 29.02 в невисокосный год"""
+    try:
+        occurrence = date(today.year, month, day)
+        if occurrence < today:
+            # Если дата уже прошла в этом году, берем следующий год
+            occurrence = date(today.year + 1, month, day)
+        return occurrence
+    except ValueError:
+        return None
+
+
+def date_ranges(today: date, days: int) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
+    """Диапазоны (месяц, день) от сегодня на days дней вперед с учетом перехода через новый год"""
+    if days >= 365:
+        return [((1, 1), (12, 31))]
+
+    start = (today.month, today.day)
+    end_date = today + timedelta(days=days)
+    end = (end_date.month, end_date.day)
+
+    if end >= start:
+        return [(start, end)]
+    return [(start, (12, 31)), ((1, 1), end)]
+
+
+class Storage:
+    """Операции с днями рождения, свадьбами и журналом сообщений, которые используют боты"""
+
+    # --- Дни рождения и свадьбы (kind = BIRTHDAYS или WEDDINGS) ---
+
+    def get_events(self, kind: str, chat_id) -> Dict[str, Dict]:
+        """Все записи чата {имя: {'day', 'month', 'year', ...}}"""
+        raise NotImplementedError
+
+    def add_event(self, kind: str, chat_id, name: str, record: Dict):
+        """Добавляет или заменяет запись"""
+        raise NotImplementedError
+
+    def delete_event(self, kind: str, chat_id, name: str) -> bool:
+        """Удаляет запись, возвращает False, если ее не было"""
+        raise NotImplementedError
+
+    def count_events(self, kind: str, chat_id) -> int:
+        return len(self.get_events(kind, chat_id))
+
+    def events_on(self, kind: str, chat_id, month: int, day: int) -> Dict[str, Dict]:
+        """Записи чата на указанный день"""
+        return {
+            name: data for name, data in self.get_events(kind, chat_id).items()
+            if data['day'] == day and data['month'] == month
+        }
+
+    def upcoming_events(self, kind: str, chat_id, today: date, days: int) -> List[Tuple[str, Dict, int, date]]:
+        """Записи на ближайшие days дней: [(имя, данные, дней до события, дата)] по возрастанию"""
+        upcoming = []
+        for name, data in self.get_events(kind, chat_id).items():
+            occurrence = next_occurrence(today, data['month'], data['day'])
+            if occurrence is None:
+                continue
+            days_until = (occurrence - today).days
+            if days_until <= days:
+                upcoming.append((name, data, days_until, occurrence))
+        upcoming.sort(key=lambda x: x[2])
+        return upcoming
+
+    def all_events_on(self, kind: str, month: int, day: int) -> List[Tuple[str, str, Dict]]:
+        """Записи всех чатов на указанный день: [(chat_id, имя, данные)]"""
+        raise NotImplementedError
+
+    # --- Снимки (snapshots.py) ---
+
+    def export_events(self, kind: str) -> Dict[str, Dict[str, Dict]]:
+        """Все записи в формате birthdays.json / weddings.json (только для чтения)"""
+        raise NotImplementedError
+
+    def replace_events(self, kind: str, data: Dict[str, Dict[str, Dict]]):
+        """Заменяет все записи данными в формате birthdays.json / weddings.json"""
+        raise NotImplementedError
+
+    _change_listeners: Tuple = ()
+
+    def add_change_listener(self, callback: Callable[[str], None]):
+        """callback(kind) вызывается после каждого добавления или удаления записи"""
+        self._change_listeners = self._change_listeners + (callback,)
+
+    def _changed(self, kind: str):
+        for callback in self._change_listeners:
+            callback(kind)
+
+    # --- Журнал сообщений ---
+
+    def log_message(self, chat_id, record: Dict):
+        raise NotImplementedError
+
+    def log_edit(self, chat_id, record: Dict):
+        raise NotImplementedError
+
+    def get_logged_message(self, chat_id, message_id) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def message_stats(self, chat_id) -> Dict[str, int]:
+        """{'messages': N, 'edited': M}"""
+        raise NotImplementedError
+
+    def chat_messages(self, chat_id, limit: Optional[int] = None) -> Dict[str, Dict]:
+        raise NotImplementedError
+
+    # Для обработчиков: реализация может читать журнал вне цикла событий
+
+    async def load_logged_message(self, chat_id, message_id) -> Optional[Dict]:
+        return self.get_logged_message(chat_id, message_id)
+
+    async def load_message_stats(self, chat_id) -> Dict[str, int]:
+        return self.message_stats(chat_id)
+
+    async def load_chat_messages(self, chat_id, limit: Optional[int] = None) -> Dict[str, Dict]:
+        return self.chat_messages(chat_id, limit=limit)
+
+    def close(self):
+        pass
+
+
+class JsonStorage(Storage):
+    """Хранилище на JSON-файлах (данные в памяти) и сегментированном журнале сообщений"""
+
+    def __init__(self, birthdays_file: str, weddings_file: str,
+                 messages_log_dir: str = 'messages_log',
+                 messages_log_file: Optional[str] = None):
+        self.stores = {
+            BIRTHDAYS: JsonStore(birthdays_file),
+            WEDDINGS: JsonStore(weddings_file),
+        }
+        for store in self.stores.values():
+            store.data = events_from_json(store.data)
+        # Индексы по дате обновляются вместе с данными
+        self.indexes = {kind: DateIndex.build(store.data) for kind, store in self.stores.items()}
+        self._messages_log = None
+        self._messages_log_dir = messages_log_dir
+        self._messages_log_file = messages_log_file
+
+    @property
+    def messages_log(self):
+        """Журнал сообщений открывается при первом обращении"""
+        if self._messages_log is None:
+            self._messages_log = open_message_log(self._messages_log_dir, legacy_file=self._messages_log_file)
+        return self._messages_log
+
+    def get_events(self, kind: str, chat_id) -> Dict[str, Dict]:
+        return self.stores[kind].data.get(str(chat_id), {})
+
+    def add_event(self, kind: str, chat_id, name: str, record: Dict):
+        store = self.stores[kind]
+        record = EventRecord.from_dict(record, name)
+        store.data.setdefault(str(chat_id), {})[name] = record
+        self.indexes[kind].add(chat_id, name, record['month'], record['day'])
+        store.mark_dirty()
+        self._changed(kind)
+
+    def delete_event(self, kind: str, chat_id, name: str) -> bool:
+        store = self.stores[kind]
+        chat_events = store.data.get(str(chat_id), {})
+        if name not in chat_events:
+            return False
+        del chat_events[name]
+        self.indexes[kind].remove(chat_id, name)
+        store.mark_dirty()
+        self._changed(kind)
+        return True
+
+    def events_on(self, kind: str, chat_id, month: int, day: int) -> Dict[str, Dict]:
+        chat_events = self.get_events(kind, chat_id)
+        return {name: chat_events[name] for name in self.indexes[kind].chat_on(chat_id, month, day)}
+
+    def upcoming_events(self, kind: str, chat_id, today: date, days: int) -> List[Tuple[str, Dict, int, date]]:
+        chat_events = self.get_events(kind, chat_id)
+        upcoming = []
+        for start, end in date_ranges(today, days):
+            for name in self.indexes[kind].chat_between(chat_id, start, end):
+                data = chat_events[name]
+                occurrence = next_occurrence(today, data['month'], data['day'])
+                if occurrence is None:
+                    continue
+                upcoming.append((name, data, (occurrence - today).days, occurrence))
+        upcoming.sort(key=lambda x: x[2])
+        return upcoming
+
+    def all_events_on(self, kind: str, month: int, day: int) -> List[Tuple[str, str, Dict]]:
+        data = self.stores[kind].data
+        return [(chat_id, name, data[chat_id][name]) for chat_id, name in self.indexes[kind].on(month, day)]
+
+    def export_events(self, kind: str) -> Dict[str, Dict[str, Dict]]:
+        return self.stores[kind].data
+
+    def replace_events(self, kind: str, data: Dict[str, Dict[str, Dict]]):
+        data = events_from_json(data)
+        self.stores[kind].replace(data)
+        self.indexes[kind] = DateIndex.build(data)
+
+    def log_message(self, chat_id, record: Dict):
+        self.messages_log.append_message(chat_id, record)
+
+    def log_edit(self, chat_id, record: Dict):
+        self.messages_log.append_edit(chat_id, record)
+
+    def get_logged_message(self, chat_id, message_id) -> Optional[Dict]:
+        return self.messages_log.get_message(chat_id, message_id)
+
+    def message_stats(self, chat_id) -> Dict[str, int]:
+        return self.messages_log.stats(chat_id)
+
+    def chat_messages(self, chat_id, limit: Optional[int] = None) -> Dict[str, Dict]:
+        return self.messages_log.chat_messages(chat_id, limit=limit)
+
+    async def load_logged_message(self, chat_id, message_id) -> Optional[Dict]:
+        return await self.messages_log.load_message(chat_id, message_id)
+
+    async def load_message_stats(self, chat_id) -> Dict[str, int]:
+        return await self.messages_log.load_stats(chat_id)
+
+    async def load_chat_messages(self, chat_id, limit: Optional[int] = None) -> Dict[str, Dict]:
+        return await self.messages_log.load_chat_messages(chat_id, limit=limit)
+
+    def close(self):
+        for store in self.stores.values():
+            store.flush()
+        if self._messages_log is not None:
+            self._messages_log.close()
+
+
+def create_storage(birthdays_file: str = 'birthdays.json',
+                   weddings_file: str = 'weddings.json',
+                   messages_log_file: str = 'messages_log.json',
+                   messages_log_dir: str = 'messages_log') -> Storage:
+    """Создает хранилище, выбранное переменной окружения STORAGE_BACKEND (json или sqlite).
+
+    Вызовы хранилища учитываются в трассировке обработчиков (TracedStorage).
+    """
+    backend = os.getenv('STORAGE_BACKEND', 'json').lower()
+
+    if backend == 'sqlite':
+        from sqlite_store import open_sqlite_storage
+        db_path = os.getenv('SQLITE_PATH') or os.path.join(os.path.dirname(os.path.abspath(birthdays_file)), 'bot.db')
+        return TracedStorage(open_sqlite_storage(db_path, birthdays_file, weddings_file, messages_log_file, messages_log_dir))
+
+    return TracedStorage(JsonStorage(birthdays_file, weddings_file,
+                                     messages_log_dir=messages_log_dir,
+                                     messages_log_file=messages_log_file))
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Журнал бота: уровни, JSON-строки, прореживание повторов и запись в фоне.
+
+Модули пишут через стандартный logging (logger = logging.getLogger(__name__)),
+а setup_logging() в точке входа бота настраивает вывод:
+
+  - уровень LOG_LEVEL (DEBUG, INFO, WARNING, ERROR);
+  - формат LOG_FORMAT: json - одна строка JSON на запись, text - для чтения
+    глазами при отладке; LOG_FILE - дополнительно писать в файл;
+  - одинаковые записи DEBUG и INFO (один логгер, уровень и шаблон
+    сообщения) сверх LOG_SAMPLE_BURST за LOG_SAMPLE_WINDOW секунд
+    отбрасываются, а первая запись следующего окна сообщает, сколько было
+    пропущено (suppressed); WARNING и выше пишутся всегда;
+  - обработчик цикла событий только кладет запись в очередь, форматирование
+    и запись в stdout/файл выполняет отдельный поток (QueueListener).
+
+Чтобы прореживание работало, параметры передаются аргументами, а не
+f-строкой - тогда шаблон сообщения одинаковый:
+
+    logger.info("Сообщение %s в чате %s удалено", message_id, chat_id,
+                extra={'chat_id': chat_id})
+
+    {"time": "2025-07-01T00:00:00.123+03:00", "level": "INFO",
+     "logger": "bot", "message": "Сообщение 42 в чате ...", "chat_id": -100...}
+"""
+
+import atexit
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional, Tuple
+
+import codec
+
+# Атрибуты самой LogRecord: все остальное пришло через extra и попадает в JSON
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# Библиотеки, которые пишут INFO на каждый запрос к Bot API и к веб-хуку
+_NOISY_LOGGERS = ('httpx', 'httpcore', 'aiohttp.access')
+
+_listener: Optional[QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+def _json_value(value):
+    if value is None or isinstance(value, (str, int, float, bool, list, dict)):
+        return value
+    return str(value)
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна строка JSON на запись: время, уровень, логгер, сообщение и поля extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).astimezone().isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = _json_value(value)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        try:
+            return codec.dumps(entry).decode('utf-8')
+        except (TypeError, ValueError):
+            # Вложенный объект, который не кодируется - записываем строкой
+            return codec.dumps({key: str(value) if isinstance(value, (list, dict)) else value
+                                for key, value in entry.items()}).decode('utf-8')
+
+
+class TextFormatter(logging.Formatter):
+    """Читаемые строки для отладки; поле suppressed дописывается в конец"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s %(name)s: %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        return f"{line} (пропущено повторов: {suppressed})" if suppressed else line
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает не больше burst одинаковых записей DEBUG/INFO за window секунд"""
+
+    MAX_KEYS = 10000
+
+    def __init__(self, window: float, burst: int):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self._seen: Dict[Tuple[str, int, str], List[float]] = {}  # {ключ: [начало окна, записей в окне]}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.window <= 0 or self.burst <= 0 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            state = self._seen.get(key)
+            if state is None or now - state[0] >= self.window:
+                if state is not None and state[1] > self.burst:
+                    record.suppressed = int(state[1] - self.burst)
+                if state is None and len(self._seen) >= self.MAX_KEYS:
+                    self._seen.clear()
+                self._seen[key] = [now, 1]
+                return True
+            state[1] += 1
+            return state[1] <= self.burst
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """Кладет запись в очередь, не форматируя ее в потоке цикла событий"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Аргументы подставляются сразу: изменяемый объект может поменяться до записи.
+        # Исключение (exc_info) форматирует уже поток записи
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None,
+                  log_file: Optional[str] = None) -> logging.Logger:
+    """Настраивает корневой логгер (повторный вызов ничего не меняет)"""
+    global _listener
+    root = logging.getLogger()
+    with _setup_lock:
+        if _listener is not None:
+            return root
+
+        level_name = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+        fmt = (fmt or os.getenv('LOG_FORMAT', 'json')).lower()
+        log_file = log_file if log_file is not None else os.getenv('LOG_FILE', '')
+        formatter = TextFormatter() if fmt == 'text' else JsonFormatter()
+
+        handlers = [logging.StreamHandler(sys.stdout)]
+        if log_file:
+            handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = BackgroundQueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(float(os.getenv('LOG_SAMPLE_WINDOW', '60')),
+                                               _env_int('LOG_SAMPLE_BURST', 5)))
+
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(getattr(logging, level_name, logging.INFO))
+        if root.level > logging.DEBUG:
+            for name in _NOISY_LOGGERS:
+                logging.getLogger(name).setLevel(logging.WARNING)
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    return root
+
+
+def shutdown_logging():
+    """Дописывает очередь и останавливает поток записи"""
+    global _listener
+    with _setup_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты атомарной записи и восстановления файлов данных (atomic_file.py).
+
+    python -m pytest test_atomic_file.py
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from atomic_file import CorruptFileError, backup_path, checksum_path, read_verified, write_atomic
+from store import JsonStore
+
+
+class AtomicFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'birthdays.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, obj):
+        write_atomic(self.path, json.dumps(obj).encode('utf-8'))
+
+    def read(self):
+        return read_verified(self.path, json.loads)
+
+    def corrupt(self, path):
+        with open(path, 'wb') as f:
+            f.write(b'{"1": {')
+
+    def files(self):
+        return sorted(os.listdir(self.tmp.name))
+
+    def test_write_keeps_checksum_and_previous_version(self):
+        self.write({'v': 1})
+        self.write({'v': 2})
+
+        self.assertEqual(self.read(), {'v': 2})
+        self.assertEqual(read_verified(backup_path(self.path), json.loads), {'v': 1})
+        with open(checksum_path(self.path), encoding='utf-8') as f:
+            self.assertTrue(f.read().endswith('  birthdays.json\n'))
+        # Временные файлы не остаются
+        self.assertEqual(self.files(), ['birthdays.json', 'birthdays.json.bak', 'birthdays.json.bak.sha256',
+                                        'birthdays.json.sha256'])
+
+    def test_checksum_mismatch_restores_from_backup(self):
+        self.write({'v': 1})
+        self.write({'v': 2})
+        # Файл разбирается, но не совпадает с контрольной суммой (частичная запись)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'v': 3}, f)
+
+        self.assertEqual(self.read(), {'v': 1})
+        self.assertEqual(self.read(), {'v': 1})  # файл восстановлен из копии
+        self.assertTrue(any(name.startswith('birthdays.json.corrupt-') for name in self.files()))
+
+    def test_corrupt_file_without_backup_is_set_aside(self):
+        self.write({'v': 1})
+        self.corrupt(self.path)
+        os.remove(checksum_path(self.path))
+
+        with self.assertRaises(CorruptFileError):
+            self.read()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertTrue(any(name.startswith('birthdays.json.corrupt-') for name in self.files()))
+
+    def test_missing_file(self):
+        with self.assertRaises(FileNotFoundError):
+            self.read()
+
+    def test_store_does_not_start_with_corrupt_file(self):
+        self.corrupt(self.path)
+        with self.assertRaises(CorruptFileError):
+            JsonStore(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты ограниченного кэша сообщений по чатам (chat_cache.py).
+
+    python -m pytest test_chat_cache.py
+"""
+
+import unittest
+
+from chat_cache import ChatCache
+
+
+class ChatCacheTest(unittest.TestCase):
+    def test_per_chat_limit_evicts_oldest_entry(self):
+        cache = ChatCache(per_chat=3, max_items=100)
+        for message_id in range(1, 6):
+            cache.add(-100, message_id)
+
+        self.assertEqual(cache.last(-100, 10), [3, 4, 5])
+        self.assertEqual((len(cache), cache.evicted), (3, 2))
+        self.assertNotIn((-100, 1), cache)
+
+    def test_updated_entry_becomes_newest(self):
+        cache = ChatCache(per_chat=3, max_items=100)
+        for message_id in (1, 2, 3):
+            cache.add(-100, message_id)
+        cache.add(-100, 1, 'новое')  # Обновление не увеличивает размер
+        cache.add(-100, 4)
+
+        self.assertEqual(cache.last(-100, 10), [3, 1, 4])
+        self.assertEqual(cache.get(-100, 1), 'новое')
+        self.assertEqual(len(cache), 3)
+
+    def test_total_limit_evicts_least_recently_used_chat(self):
+        cache = ChatCache(per_chat=10, max_items=4)
+        cache.add(-1, 1)
+        cache.add(-1, 2)
+        cache.add(-2, 1)
+        cache.add(-2, 2)
+        cache.add(-1, 3)  # Чат -1 снова использован, самый старый теперь -2
+
+        self.assertEqual(cache.last(-2, 10), [2])
+        self.assertEqual(cache.last(-1, 10), [1, 2, 3])
+
+        cache.add(-3, 1)
+        cache.add(-3, 2)
+        # Чат -2 опустел и удален, дальше вытесняются старые записи чата -1
+        self.assertEqual(cache.stats()['chats'], 2)
+        self.assertEqual(cache.last(-1, 10), [2, 3])
+        self.assertEqual((len(cache), cache.evicted), (4, 3))
+
+    def test_discard_and_last(self):
+        cache = ChatCache(per_chat=5, max_items=100)
+        for message_id in (1, 2, 3):
+            cache.add(-100, message_id)
+
+        self.assertTrue(cache.discard(-100, 2))
+        self.assertFalse(cache.discard(-100, 2))
+        self.assertEqual(cache.last(-100, 2), [1, 3])
+        self.assertEqual(cache.last(-100, 0), [])
+        self.assertEqual(cache.count(-200), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
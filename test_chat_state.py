@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты сохранения состояния чатов (chat_state.py).
+
+    python -m pytest test_chat_state.py
+"""
+
+import os
+import tempfile
+import unittest
+
+from chat_state import ChatSet, ChatState
+
+
+class ChatSetTest(unittest.TestCase):
+    def setUp(self):
+        self.changes = 0
+        self.chats = ChatSet([1, 2, 3], self.changed)
+
+    def changed(self):
+        self.changes += 1
+
+    def test_every_mutation_is_saved(self):
+        self.chats.pop()
+        self.chats.difference_update([1, 2])
+        self.chats.update([4, 5])
+        self.chats.intersection_update([4])
+        self.chats.symmetric_difference_update([4, 6])
+        self.chats |= {7, 9}
+        self.chats -= {9}
+        self.chats &= {6, 8}
+        self.chats ^= {8}
+
+        self.assertEqual(self.chats, {6, 8})
+        self.assertEqual(self.changes, 9)
+        self.assertIsInstance(self.chats, ChatSet)
+
+    def test_noop_is_not_saved(self):
+        self.chats.add(1)
+        self.chats.discard(4)
+        self.chats.update([1, 2])
+        self.chats.difference_update([9])
+        self.chats.intersection_update([1, 2, 3])
+        self.chats.symmetric_difference_update([])
+        self.chats |= {3}
+        self.chats -= {9}
+        self.chats &= {1, 2, 3}
+        self.chats ^= set()
+
+        self.assertEqual(self.changes, 0)
+
+
+class ChatStateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'chat_state.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_state_survives_restart(self):
+        state = ChatState(self.path)
+        state.admin_chats.add(-100)
+        state.admin_chats |= {-200}
+        state.alarm_enabled_chats.add(-300)
+        state.admin_chats.pop()
+        state.target_group_id = -300
+
+        restored = ChatState(self.path)
+        self.assertEqual(restored.admin_chats, state.admin_chats)
+        self.assertEqual(restored.alarm_enabled_chats, {-300})
+        self.assertEqual(restored.target_group_id, -300)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты журнала сообщений и переноса в него messages_log.json (message_log.py).
+
+    python -m pytest test_message_log.py
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import message_log
+from message_log import MessageLog, open_message_log
+from store import JsonStorage
+from tracing import TracedStorage
+
+LEGACY = {
+    '-100': {
+        '1': {'message_id': 1, 'text': 'Привет', 'username': 'ivan'},
+        '2': {'message_id': 2, 'text': 'Пока', 'username': 'ivan'},
+        'edited': [{'message_id': 1, 'old_text': 'Привет', 'new_text': 'Привет!'}],
+    },
+}
+
+
+class OpenMessageLogTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp.name, 'messages_log')
+        self.legacy = os.path.join(self.tmp.name, 'messages_log.json')
+        with open(self.legacy, 'w', encoding='utf-8') as f:
+            json.dump(LEGACY, f, ensure_ascii=False)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_legacy_file_is_imported_once(self):
+        log = open_message_log(self.directory, self.legacy)
+        self.assertEqual(log.stats(-100), {'messages': 2, 'edited': 1})
+        self.assertEqual(log.get_message(-100, 2)['text'], 'Пока')
+        log.append_message(-100, {'message_id': 3, 'text': 'Новое'})
+        log.close()
+
+        log = open_message_log(self.directory, self.legacy)
+        self.assertEqual(log.stats(-100), {'messages': 3, 'edited': 1})
+        log.close()
+
+    def test_interrupted_import_is_repeated(self):
+        # Прерванный перенос оставил частичный временный каталог, а каталога журнала нет
+        partial = MessageLog(f"{self.directory}.importing")
+        partial.append_message(-100, {'message_id': 1, 'text': 'Привет'})
+        partial.close()
+
+        log = open_message_log(self.directory, self.legacy)
+        self.assertEqual(log.stats(-100), {'messages': 2, 'edited': 1})
+        log.close()
+        self.assertFalse(os.path.exists(f"{self.directory}.importing"))
+
+    def test_broken_legacy_file_leaves_empty_log(self):
+        with open(self.legacy, 'w', encoding='utf-8') as f:
+            f.write('{"-100": {')
+
+        with self.assertLogs('message_log', 'ERROR'):
+            log = open_message_log(self.directory, self.legacy)
+        self.assertEqual(log.chats(), [])
+        log.close()
+        self.assertFalse(os.path.exists(f"{self.directory}.importing"))
+
+
+class MessageLogLoopTest(unittest.TestCase):
+    """Работа журнала внутри цикла событий: fsync и чтение - в пуле ввода-вывода"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp.name, 'messages_log')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_rotated_segment_is_synced_in_io_pool(self):
+        threads = []
+        real_fsync = os.fsync
+
+        def fsync(fd):
+            threads.append(threading.current_thread().name.split('_')[0])
+            real_fsync(fd)
+
+        async def scenario():
+            log = MessageLog(self.directory, segment_size=100, fsync_every=1000, fsync_interval=1000)
+            for message_id in range(3):
+                log.append_message(-100, {'message_id': message_id, 'text': 'x' * 80})
+            log.close()
+            return log
+
+        with mock.patch.object(message_log.os, 'fsync', fsync):
+            log = asyncio.run(scenario())
+
+        self.assertEqual(sorted(os.listdir(os.path.join(self.directory, '-100'))),
+                         ['000001.jsonl', '000002.jsonl', '000003.jsonl', '000004.jsonl'])
+        # Заполненные сегменты закрыты в пуле, текущий - синхронно в close()
+        self.assertEqual(sorted(threads), sorted(['file-io'] * 3 + [threading.current_thread().name]))
+        self.assertEqual(log.stats(-100), {'messages': 3, 'edited': 0})
+
+    def test_reads_run_in_io_pool(self):
+        storage = TracedStorage(JsonStorage(os.path.join(self.tmp.name, 'birthdays.json'),
+                                            os.path.join(self.tmp.name, 'weddings.json'),
+                                            messages_log_dir=self.directory))
+        log = storage.messages_log
+        log.recent_per_chat = 1
+        for message_id in range(1, 4):
+            storage.log_message(-100, {'message_id': message_id, 'text': f"Сообщение {message_id}"})
+        storage.log_edit(-100, {'message_id': 1, 'old_text': 'Сообщение 1', 'new_text': 'Изменено'})
+        threads = []
+        real_entries = MessageLog._entries
+
+        def entries(self, chat_id):
+            threads.append(threading.current_thread().name.split('_')[0])
+            return real_entries(self, chat_id)
+
+        async def scenario():
+            with mock.patch.object(MessageLog, '_entries', entries):
+                return (
+                    await storage.load_logged_message(-100, 1),  # нет среди последних - читается журнал
+                    await storage.load_logged_message(-100, 3),  # из памяти
+                    await storage.load_chat_messages(-100, limit=2),
+                    await storage.load_message_stats(-100),
+                )
+
+        message, recent, messages, stats = asyncio.run(scenario())
+        self.assertEqual(message['text'], 'Сообщение 1')
+        self.assertEqual(recent['text'], 'Сообщение 3')
+        self.assertEqual(list(messages), ['2', '3'])
+        self.assertEqual(stats, {'messages': 3, 'edited': 1})
+        self.assertEqual(len(threads), 3)
+        self.assertEqual(threads, ['file-io'] * 3)
+
+        # Счетчики запомнены и дальше обновляются при записи
+        log.append_message(-100, {'message_id': 4, 'text': 'Еще'})
+        self.assertEqual(log.stats(-100), {'messages': 4, 'edited': 1})
+        storage.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты текстового формата метрик Prometheus (metrics.py).
+
+    python -m pytest test_metrics.py
+"""
+
+import unittest
+
+from metrics import CallbackMetric, Counter, Gauge, Histogram, Registry
+
+
+class MetricsFormatTest(unittest.TestCase):
+    def test_counter(self):
+        counter = Counter('bot_updates_total', 'Обновления', ('type', 'command'))
+        counter.inc('message', '/start')
+        counter.inc('message', '/start', amount=2)
+        counter.inc('callback_query', '')
+
+        self.assertEqual(counter.render(), [
+            '# HELP bot_updates_total Обновления',
+            '# TYPE bot_updates_total counter',
+            'bot_updates_total{type="callback_query",command=""} 1',
+            'bot_updates_total{type="message",command="/start"} 3',
+        ])
+
+    def test_gauge_without_labels_and_float_value(self):
+        gauge = Gauge('scheduler_lag_seconds', 'Опоздание')
+        gauge.set(0.25)
+        self.assertEqual(gauge.render()[1:], ['# TYPE scheduler_lag_seconds gauge', 'scheduler_lag_seconds 0.25'])
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('store_io_seconds', 'Ввод-вывод', ('operation',), buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.7, 3):
+            histogram.observe(value, 'read')
+
+        self.assertEqual(histogram.render()[2:], [
+            'store_io_seconds_bucket{operation="read",le="0.1"} 1',
+            'store_io_seconds_bucket{operation="read",le="1"} 3',
+            'store_io_seconds_bucket{operation="read",le="+Inf"} 4',
+            'store_io_seconds_sum{operation="read"} 4.25',
+            'store_io_seconds_count{operation="read"} 4',
+        ])
+        self.assertEqual(histogram.count('read'), 4)
+
+    def test_label_values_are_escaped(self):
+        counter = Counter('telegram_api_errors_total', 'Ошибки', ('method', 'error'))
+        counter.inc('sendMessage', 'Bad "request"\\\n')
+        self.assertEqual(counter.render()[-1],
+                         'telegram_api_errors_total{method="sendMessage",error="Bad \\"request\\"\\\\\\n"} 1')
+
+    def test_wrong_label_count_is_rejected(self):
+        with self.assertRaises(ValueError):
+            Counter('c', 'c', ('type',)).inc()
+
+    def test_callback_metric_is_read_on_render(self):
+        values = {'queue': 1}
+        metric = CallbackMetric('webhook_queue_size', 'Очередь', lambda: values['queue'])
+        values['queue'] = 5
+        self.assertEqual(metric.render()[-1], 'webhook_queue_size 5')
+
+        by_label = CallbackMetric('pool_connections', 'Пул', lambda: {('idle',): 2, ('active',): 1},
+                                  labels=('state',))
+        self.assertEqual(by_label.render()[2:], ['pool_connections{state="active"} 1', 'pool_connections{state="idle"} 2'])
+
+    def test_broken_metric_does_not_break_registry(self):
+        def fail():
+            raise RuntimeError("нет данных")
+
+        registry = Registry()
+        registry.register(CallbackMetric('broken', 'Сломанная', fail))
+        registry.register(Gauge('ok', 'Рабочая')).set(1)
+        self.assertTrue(registry.render().endswith('# TYPE ok gauge\nok 1\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
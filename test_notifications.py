@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты доставки уведомлений и журнала отправок (notifications.py).
+
+    python -m pytest test_notifications.py
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from datetime import date
+from types import SimpleNamespace
+from unittest import mock
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+import file_io
+from bot import UniversalBot
+from notifications import (
+    DIGEST, ChatUnavailable, NotificationLedger, NotificationModes, NotificationState, deliver_pending,
+    is_chat_unavailable, message_length, send_digest, split_message
+)
+from store import BIRTHDAYS, JsonStorage
+
+TODAY = date(2025, 7, 1)
+
+
+class DeliverPendingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.state = NotificationState(os.path.join(self.tmp.name, 'state.json'), catchup_days=2)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def deliver(self, send_day, chats=(1,), **kwargs):
+        async def scenario():
+            delivered = await deliver_pending(self.state, chats, TODAY, send_day, **kwargs)
+            await file_io.drain()
+            return delivered
+
+        return asyncio.run(scenario())
+
+    def test_incomplete_day_is_repeated(self):
+        self.state.mark_fired(1, date(2025, 6, 28))
+        calls = []
+
+        async def failing(chat_id, day, delay):
+            calls.append(day)
+            return day != date(2025, 6, 30)
+
+        self.assertEqual(self.deliver(failing), 1)
+        # 29.06 обработан, 30.06 не подтвержден - 01.07 не отправляется раньше него
+        self.assertEqual(calls, [date(2025, 6, 29), date(2025, 6, 30)])
+        self.assertEqual(self.state.last_fired(1), date(2025, 6, 29))
+
+        calls.clear()
+
+        async def working(chat_id, day, delay):
+            calls.append(day)
+            return True
+
+        self.assertEqual(self.deliver(working), 2)
+        self.assertEqual(calls, [date(2025, 6, 30), TODAY])
+        self.assertEqual(self.state.last_fired(1), TODAY)
+
+    def test_unavailable_chat_is_forgotten(self):
+        self.state.mark_fired(2, date(2025, 6, 30))
+        removed = []
+
+        async def send_day(chat_id, day, delay):
+            raise ChatUnavailable(chat_id)
+
+        self.assertEqual(self.deliver(send_day, chats=(2,), on_unavailable=removed.append), 0)
+        self.assertEqual(removed, [2])
+        self.assertNotIn(2, self.state.chats())
+
+    def test_error_in_one_chat_does_not_stop_others(self):
+        async def send_day(chat_id, day, delay):
+            if chat_id == 1:
+                raise RuntimeError("сбой")
+            return True
+
+        self.assertEqual(self.deliver(send_day, chats=(1, 2)), 1)
+        self.assertIsNone(self.state.last_fired(1))
+        self.assertEqual(self.state.last_fired(2), TODAY)
+
+
+class BotDeliveryTest(unittest.TestCase):
+    """deliver_pending с отправкой бота (UniversalBot.send_day_notifications)"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+        def path(name):
+            return os.path.join(self.tmp.name, name)
+
+        self.state = NotificationState(path('state.json'))
+        self.storage = JsonStorage(path('birthdays.json'), path('weddings.json'), messages_log_dir=path('messages_log'))
+        self.storage.add_event(BIRTHDAYS, -100, 'Иван', {'day': TODAY.day, 'month': TODAY.month})
+        self.send_message = mock.AsyncMock()
+        self.bot = SimpleNamespace(
+            storage=self.storage,
+            notification_ledger=NotificationLedger(path('ledger.db')),
+            notification_modes=NotificationModes(path('modes.json')),
+            application=SimpleNamespace(bot=SimpleNamespace(send_message=self.send_message)),
+            congratulations=['С днём рождения, {name}!'],
+            wedding_congratulations=['{names}: {years} лет'],
+            cache_bot_message=lambda chat_id, message_id: None,
+        )
+        self.admin_chats = {-100}
+
+    def tearDown(self):
+        self.bot.notification_ledger.close()
+        self.storage.close()
+        self.tmp.cleanup()
+
+    def deliver(self):
+        async def send_day(chat_id, day, delay):
+            return await UniversalBot.send_day_notifications(self.bot, chat_id, day, delay)
+
+        async def scenario():
+            delivered = await deliver_pending(self.state, self.admin_chats, TODAY, send_day,
+                                              on_unavailable=self.admin_chats.discard)
+            await file_io.drain()
+            return delivered
+
+        return asyncio.run(scenario())
+
+    def test_kicked_bot_removes_chat(self):
+        self.send_message.side_effect = Forbidden("Forbidden: bot was kicked from the group chat")
+        for mode in (None, DIGEST):
+            with self.subTest(mode=mode):
+                if mode is not None:
+                    self.bot.notification_modes.set(-100, mode)
+                self.admin_chats.add(-100)
+                self.state.mark_fired(-100, date(2025, 6, 30))
+
+                with self.assertLogs('notifications', 'WARNING'):
+                    self.assertEqual(self.deliver(), 0)
+                self.assertEqual(self.admin_chats, set())
+                self.assertNotIn(-100, self.state.chats())
+
+    def test_temporary_error_keeps_chat(self):
+        self.send_message.side_effect = TimedOut()
+        with self.assertLogs('bot', 'ERROR'):
+            self.assertEqual(self.deliver(), 0)
+        self.assertEqual(self.admin_chats, {-100})
+        self.assertIsNone(self.state.last_fired(-100))
+
+
+class ChatUnavailableTest(unittest.TestCase):
+    def test_only_permanent_errors_make_chat_unavailable(self):
+        self.assertTrue(is_chat_unavailable(Forbidden("Forbidden: bot was kicked from the group chat")))
+        self.assertTrue(is_chat_unavailable(BadRequest("Chat not found")))
+        self.assertFalse(is_chat_unavailable(BadRequest("Message is too long")))
+        self.assertFalse(is_chat_unavailable(TimedOut()))
+        self.assertFalse(is_chat_unavailable(NetworkError("Connection reset")))
+        self.assertFalse(is_chat_unavailable(RetryAfter(5)))
+        self.assertFalse(is_chat_unavailable(RuntimeError("chat not found")))
+
+
+class LedgerCompletenessTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'ledger.db')
+        self.ledger = NotificationLedger(self.path)
+        self.other = NotificationLedger(self.path)
+        self.other.owner = 'other-host:1'
+
+    def tearDown(self):
+        self.ledger.close()
+        self.other.close()
+        self.tmp.cleanup()
+
+    def test_event_claimed_by_another_process_is_not_sent(self):
+        async def send():
+            pass
+
+        self.assertTrue(self.other.claim(1, 'birthdays:Иван', TODAY))
+        self.assertTrue(asyncio.run(self.ledger.send_once(1, 'birthdays:Мария', TODAY, send)))
+
+        # Захват другого процесса пропускается, но день еще не завершен
+        self.assertFalse(self.ledger.all_sent(1, ['birthdays:Иван', 'birthdays:Мария'], TODAY))
+        self.other.confirm(1, 'birthdays:Иван', TODAY)
+        self.assertTrue(self.ledger.all_sent(1, ['birthdays:Иван', 'birthdays:Мария'], TODAY))
+
+    def test_failed_send_leaves_day_incomplete(self):
+        async def fail():
+            raise RuntimeError("сеть недоступна")
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(self.ledger.send_once(1, 'weddings:Иван и Мария', TODAY, fail))
+        self.assertFalse(self.ledger.all_sent(1, ['weddings:Иван и Мария'], TODAY))
+
+    def test_day_without_events_is_complete(self):
+        self.assertTrue(self.ledger.all_sent(1, [], TODAY))
+
+
+class LedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ledger = NotificationLedger(os.path.join(self.tmp.name, 'ledger.db'))
+
+    def tearDown(self):
+        self.ledger.close()
+        self.tmp.cleanup()
+
+    def test_claim_confirm_release(self):
+        self.assertTrue(self.ledger.claim(1, 'birthdays:Иван', TODAY))
+        self.assertFalse(self.ledger.claim(1, 'birthdays:Иван', TODAY))
+        self.ledger.release(1, 'birthdays:Иван', TODAY)
+        self.assertTrue(self.ledger.claim(1, 'birthdays:Иван', TODAY))
+        self.ledger.confirm(1, 'birthdays:Иван', TODAY)
+        self.assertTrue(self.ledger.was_sent(1, 'birthdays:Иван', TODAY))
+        # Отправленное не захватывается и не освобождается повторно
+        self.ledger.release(1, 'birthdays:Иван', TODAY)
+        self.assertFalse(self.ledger.claim(1, 'birthdays:Иван', TODAY))
+
+    def test_abandoned_claim_expires_after_lease(self):
+        self.ledger.lease = 0
+        self.assertTrue(self.ledger.claim(1, 'birthdays:Иван', TODAY))
+        time.sleep(0.01)
+        self.assertTrue(self.ledger.claim(1, 'birthdays:Иван', TODAY))
+
+    def test_send_once_releases_claim_on_failure(self):
+        async def fail():
+            raise RuntimeError("сеть недоступна")
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(self.ledger.send_once(1, 'birthdays:Иван', TODAY, fail))
+        self.assertTrue(self.ledger.claim(1, 'birthdays:Иван', TODAY))
+
+
+class SendDigestTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ledger = NotificationLedger(os.path.join(self.tmp.name, 'ledger.db'))
+
+    def tearDown(self):
+        self.ledger.close()
+        self.tmp.cleanup()
+
+    def test_failed_second_part_releases_the_rest(self):
+        # Каждое событие занимает больше половины лимита - по сообщению на событие
+        items = [(f'birthdays:{name}', name * 3000) for name in 'АБВ']
+        sent = []
+
+        async def send(text):
+            if sent:
+                raise RuntimeError("сеть недоступна")
+            sent.append(text)
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(send_digest(self.ledger, 1, TODAY, '', items, send))
+
+        self.assertEqual(len(sent), 1)
+        self.assertTrue(self.ledger.was_sent(1, 'birthdays:А', TODAY))
+        self.assertTrue(self.ledger.claim(1, 'birthdays:Б', TODAY))
+        self.assertTrue(self.ledger.claim(1, 'birthdays:В', TODAY))
+
+    def test_cancelled_digest_releases_claims(self):
+        async def send(text):
+            raise asyncio.CancelledError()
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(send_digest(self.ledger, 1, TODAY, '', [('birthdays:Иван', 'Иван')], send))
+        self.assertTrue(self.ledger.claim(1, 'birthdays:Иван', TODAY))
+
+    def test_sent_events_are_not_repeated(self):
+        sent = []
+
+        async def send(text):
+            sent.append(text)
+
+        items = [('birthdays:Иван', 'Иван'), ('weddings:Петр и Анна', 'Петр и Анна')]
+        self.assertEqual(asyncio.run(send_digest(self.ledger, 1, TODAY, '🎉', items, send)), 2)
+        self.assertEqual(asyncio.run(send_digest(self.ledger, 1, TODAY, '🎉', items, send)), 0)
+        self.assertEqual(sent, ['🎉\n\nИван\n\nПетр и Анна'])
+
+
+class SplitMessageTest(unittest.TestCase):
+    def test_length_is_counted_in_utf16_units(self):
+        self.assertEqual(message_length('Иван'), 4)
+        self.assertEqual(message_length('🎉'), 2)
+        self.assertEqual(message_length('🎉 Иван'), 7)
+
+    def test_blocks_fit_in_one_message(self):
+        self.assertEqual(split_message(['Иван', 'Мария'], '🎉'), [('🎉\n\nИван\n\nМария', [0, 1])])
+
+    def test_limit_counts_emoji_as_two_units(self):
+        # 5 эмодзи - 10 единиц UTF-16, хотя символов всего 5
+        messages = split_message(['🎉' * 5, '🎂' * 5], limit=12)
+        self.assertEqual(messages, [('🎉' * 5, [0]), ('🎂' * 5, [1])])
+        self.assertTrue(all(message_length(text) <= 12 for text, _ in messages))
+
+    def test_long_block_is_cut_and_ends_in_last_part(self):
+        messages = split_message(['а' * 25, 'б'], limit=10)
+        self.assertTrue(all(message_length(text) <= 10 for text, _ in messages))
+        self.assertEqual(sum(text.count('а') for text, _ in messages), 25)
+        # Номер блока приходит с сообщением, в котором блок закончился
+        self.assertEqual([indexes for _, indexes in messages], [[], [], [0, 1]])
+
+    def test_header_is_not_sent_alone(self):
+        header = '📅 Праздники 01.07.2025:'
+        messages = split_message(['ж' * 30, 'б' * 5], header, limit=40)
+
+        self.assertTrue(messages[0][0].startswith(f'{header}\n\nж'))
+        self.assertEqual(message_length(messages[0][0]), 40)
+        self.assertTrue(all(message_length(text) <= 40 for text, _ in messages))
+        self.assertEqual(sum(text.count('ж') for text, _ in messages), 30)
+        self.assertEqual([indexes for _, indexes in messages], [[], [0, 1]])
+
+    def test_long_first_block_with_header(self):
+        header = 'Заголовок'
+        messages = split_message(['🎉' * 20], header, limit=20)
+
+        # 20 - 9 (заголовок) - 2 (пустая строка) = 9 единиц: в первое сообщение входят 4 эмодзи
+        self.assertEqual(messages[0], (f'{header}\n\n' + '🎉' * 4, []))
+        self.assertEqual([text.count('🎉') for text, _ in messages], [4, 10, 6])
+        self.assertEqual(messages[-1][1], [0])
+
+    def test_header_only(self):
+        self.assertEqual(split_message([], 'Заголовок'), [('Заголовок', [])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты пула соединений с Telegram (outbound.py).
+
+    python -m pytest test_outbound.py
+"""
+
+import asyncio
+import unittest
+
+from telegram.error import TelegramError
+
+from outbound import PooledRequest
+
+
+class CountingRequest(PooledRequest):
+    __slots__ = ('built',)
+
+    def _build_client(self):
+        self.built = getattr(self, 'built', 0) + 1
+        return super()._build_client()
+
+
+class PooledRequestTest(unittest.TestCase):
+    def test_client_is_built_once_with_pool_settings(self):
+        request = CountingRequest(connection_pool_size=4, keepalive_expiry=30, pool_timeout=10)
+        pool = request._client._transport._pool
+
+        self.assertEqual(request.built, 1)
+        self.assertEqual(pool._max_connections, 4)
+        self.assertEqual(pool._max_keepalive_connections, 4)
+        self.assertEqual(pool._keepalive_expiry, 30)
+        self.assertEqual(request._client.event_hooks['request'], [request._attach_trace])
+        asyncio.run(request.shutdown())
+
+    def test_reinitialized_client_keeps_pool_settings(self):
+        async def scenario():
+            request = PooledRequest(connection_pool_size=2, keepalive_expiry=5, pool_timeout=1)
+            await request.shutdown()
+            await request.initialize()  # Закрытый клиент создается заново
+            pool = request._client._transport._pool
+            await request.shutdown()
+            return pool
+
+        pool = asyncio.run(scenario())
+        self.assertEqual((pool._max_connections, pool._keepalive_expiry), (2, 5))
+
+    def test_pool_stats_and_invalid_payload(self):
+        request = PooledRequest(connection_pool_size=2, keepalive_expiry=5, pool_timeout=1)
+        request._in_flight = 3
+        self.assertEqual(request.pool_stats()['in_use'], 2)
+        self.assertEqual(request.pool_stats()['waiting'], 1)
+        with self.assertRaises(TelegramError):
+            request.parse_json_payload(b'<html>')
+        asyncio.run(request.shutdown())
+
+
+if __name__ == '__main__':
+    unittest.main()
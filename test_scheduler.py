@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты планировщика ежедневных задач (scheduler.py).
+
+    python -m pytest test_scheduler.py
+"""
+
+import asyncio
+import unittest
+from datetime import datetime, time, timedelta
+
+import pytz
+
+from scheduler import DailyScheduler
+
+MOSCOW = pytz.timezone('Europe/Moscow')
+
+
+class NextRunTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = DailyScheduler(MOSCOW)
+
+    def test_later_today(self):
+        after = MOSCOW.localize(datetime(2025, 7, 1, 8, 30))
+        self.assertEqual(self.scheduler.next_run_time(time(9, 0), after), MOSCOW.localize(datetime(2025, 7, 1, 9, 0)))
+
+    def test_passed_time_moves_to_tomorrow(self):
+        after = MOSCOW.localize(datetime(2025, 12, 31, 0, 0))
+        # Ровно в срок - уже не "строго позже", следующий запуск завтра
+        self.assertEqual(self.scheduler.next_run_time(time(0, 0), after), MOSCOW.localize(datetime(2026, 1, 1, 0, 0)))
+
+    def test_time_in_other_zone_is_converted(self):
+        after = datetime(2025, 7, 1, 21, 30, tzinfo=pytz.utc)  # 00:30 по Москве 2 июля
+        self.assertEqual(self.scheduler.next_run_time(time(9, 0), after), MOSCOW.localize(datetime(2025, 7, 2, 9, 0)))
+
+    def test_next_due_is_earliest_job(self):
+        async def job():
+            pass
+
+        self.assertIsNone(self.scheduler.next_due())
+        self.scheduler.add_daily_job(job, '23:59')
+        self.scheduler.add_daily_job(job, '00:00')
+        self.assertEqual(self.scheduler.next_due(), min(j['next_run'] for j in self.scheduler.jobs))
+
+
+class SchedulerRunTest(unittest.TestCase):
+    def test_due_job_runs_and_is_rescheduled(self):
+        runs = []
+
+        async def job():
+            runs.append(datetime.now(MOSCOW))
+
+        async def scenario():
+            scheduler = DailyScheduler(MOSCOW)
+            scheduler.add_daily_job(job, '00:00', name='notifications')
+            scheduler.jobs[0]['next_run'] = datetime.now(MOSCOW) - timedelta(seconds=1)
+            scheduler.start()
+            await asyncio.sleep(0.05)
+            await scheduler.stop()
+            return scheduler
+
+        scheduler = asyncio.run(scenario())
+        self.assertEqual(len(runs), 1)
+        self.assertGreater(scheduler.jobs[0]['next_run'], runs[0])
+
+    def test_run_on_start_and_failing_job(self):
+        runs = []
+
+        async def failing():
+            runs.append('failing')
+            raise RuntimeError("сбой")
+
+        async def job():
+            runs.append('job')
+
+        async def scenario():
+            scheduler = DailyScheduler(MOSCOW)
+            scheduler.add_daily_job(failing, '00:00', run_on_start=True)
+            scheduler.add_daily_job(job, '00:00', run_on_start=True)
+            scheduler.start()
+            await asyncio.sleep(0.05)
+            # Ошибка задачи не останавливает планировщик
+            self.assertFalse(scheduler._task.done())
+            await scheduler.stop()
+
+        with self.assertLogs('scheduler', 'ERROR'):
+            asyncio.run(scenario())
+        self.assertEqual(sorted(runs), ['failing', 'job'])
+
+    def test_stop_waits_for_running_jobs(self):
+        finished = []
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            finished.append(True)
+
+        async def scenario():
+            scheduler = DailyScheduler(MOSCOW)
+            scheduler.add_daily_job(slow, '00:00', run_on_start=True)
+            scheduler.start()
+            await asyncio.sleep(0)
+            await scheduler.stop()
+            self.assertIsNone(scheduler._task)
+
+        asyncio.run(scenario())
+        self.assertEqual(finished, [True])
+
+    def test_added_job_wakes_up_sleeping_scheduler(self):
+        runs = []
+
+        async def job():
+            runs.append(True)
+
+        async def scenario():
+            scheduler = DailyScheduler(MOSCOW)
+            scheduler.start()  # Задач нет - планировщик ждет
+            await asyncio.sleep(0.01)
+            scheduler.add_daily_job(job, '00:00')
+            scheduler.jobs[0]['next_run'] = datetime.now(MOSCOW)  # планировщик проснется раньше полуночи
+            await asyncio.sleep(0.05)
+            await scheduler.stop()
+
+        asyncio.run(scenario())
+        self.assertEqual(runs, [True])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты снимков данных (snapshots.py).
+
+    python -m pytest test_snapshots.py
+"""
+
+import asyncio
+import gzip
+import os
+import tempfile
+import unittest
+
+import codec
+import file_io
+from atomic_file import CorruptFileError
+from snapshots import SnapshotManager
+from store import BIRTHDAYS, WEDDINGS, JsonStorage
+
+
+class SnapshotManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = JsonStorage(
+            os.path.join(self.tmp.name, 'birthdays.json'),
+            os.path.join(self.tmp.name, 'weddings.json'),
+            messages_log_dir=os.path.join(self.tmp.name, 'messages_log')
+        )
+        self.manager = SnapshotManager(self.storage, os.path.join(self.tmp.name, 'snapshots'), every=1000)
+
+    def tearDown(self):
+        self.storage.close()
+        self.tmp.cleanup()
+
+    def objects(self):
+        return sorted(path.name for path in self.manager.objects_dir.glob('*.json.gz'))
+
+    def take(self, reason: str = 'manual') -> str:
+        return self.manager.write(self.manager.capture(), reason)
+
+    def test_unchanged_data_is_stored_once(self):
+        self.storage.add_event(BIRTHDAYS, -100, 'Иван', {'day': 1, 'month': 2})
+        first = self.take()
+        self.assertEqual(self.take(), first)  # Без изменений новый снимок не создается
+        self.assertEqual(len(self.manager.list()), 1)
+        self.assertEqual(len(self.objects()), 2)
+
+        # Изменились только свадьбы - объект дней рождения общий для обоих снимков
+        self.storage.add_event(WEDDINGS, -100, 'Иван и Мария', {'day': 3, 'month': 4})
+        second = self.take()
+        self.assertNotEqual(second, first)
+        manifests = {manifest['id']: manifest['objects'] for manifest in self.manager.list()}
+        self.assertEqual(manifests[first][BIRTHDAYS], manifests[second][BIRTHDAYS])
+        self.assertNotEqual(manifests[first][WEDDINGS], manifests[second][WEDDINGS])
+        self.assertEqual(len(self.objects()), 3)
+
+    def test_pruning_keeps_tiers_and_referenced_objects(self):
+        created = ['2026-10-01T10:00:00', '2026-10-01T12:00:00', '2026-10-02T10:00:00',
+                   '2026-10-03T10:00:00', '2026-10-04T10:00:00', '2026-10-04T12:00:00']
+        ids = []
+        for i, timestamp in enumerate(created):
+            self.storage.add_event(BIRTHDAYS, -100, f"Человек {i}", {'day': 1, 'month': 1})
+            ids.append(self.take())
+            # Снимки за несколько дней: меняем время создания в манифесте
+            path = self.manager.manifests_dir / f"{ids[-1]}.json"
+            manifest = codec.loads(path.read_bytes())
+            manifest['created'] = timestamp
+            path.write_bytes(codec.dumps(manifest))
+        self.assertEqual(len(self.manager.list()), 6)
+
+        self.manager.keep_last = 2
+        self.manager.tiers = [(3, '%Y%m%d')]
+        self.manager.prune()
+
+        # Два последних снимка и по одному на каждый из трех последних дней
+        self.assertEqual([manifest['id'] for manifest in self.manager.list()], ids[:1:-1])
+        referenced = {entry['sha256'] + '.json.gz'
+                      for manifest in self.manager.list() for entry in manifest['objects'].values()}
+        self.assertEqual(set(self.objects()), referenced)
+
+    def test_restore_round_trip(self):
+        async def scenario():
+            self.storage.add_event(BIRTHDAYS, -100, 'Иван', {'day': 1, 'month': 2})
+            snapshot_id = await self.manager.snapshot('manual')
+
+            self.storage.delete_event(BIRTHDAYS, -100, 'Иван')
+            self.storage.add_event(BIRTHDAYS, -100, 'Петр', {'day': 5, 'month': 6})
+            counts = await self.manager.restore(snapshot_id)
+            await file_io.drain()
+            return snapshot_id, counts
+
+        snapshot_id, counts = asyncio.run(scenario())
+
+        self.assertEqual(counts, {BIRTHDAYS: 1, WEDDINGS: 0})
+        self.assertEqual(list(self.storage.get_events(BIRTHDAYS, -100)), ['Иван'])
+        self.assertEqual(list(self.storage.events_on(BIRTHDAYS, -100, 2, 1)), ['Иван'])
+        # Состояние до восстановления сохранено снимком и само может быть восстановлено
+        before = self.manager.latest()
+        self.assertEqual(before['reason'], 'before-restore')
+        self.assertEqual(list(self.manager.load(before['id'])[BIRTHDAYS]['-100']), ['Петр'])
+        self.assertNotEqual(before['id'], snapshot_id)
+
+    def test_unknown_or_corrupt_snapshot_is_not_restored(self):
+        self.storage.add_event(BIRTHDAYS, -100, 'Иван', {'day': 1, 'month': 2})
+        snapshot_id = self.take()
+
+        with self.assertRaises(KeyError):
+            self.manager.restore_sync('20200101_000000')
+        with self.assertRaises(KeyError):
+            self.manager.restore_sync('../birthdays')
+
+        for path in self.manager.objects_dir.glob('*.json.gz'):
+            path.write_bytes(gzip.compress(b'{}'))  # Содержимое не совпадает с контрольной суммой
+        with self.assertRaises(CorruptFileError):
+            self.manager.restore_sync(snapshot_id)
+        self.assertEqual(list(self.storage.get_events(BIRTHDAYS, -100)), ['Иван'])
+
+
+if __name__ == '__main__':
+    unittest.main()
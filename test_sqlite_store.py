@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты хранилища SQLite и переноса в него JSON-файлов (sqlite_store.py).
+
+    python -m pytest test_sqlite_store.py
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from sqlite_store import SqliteStorage, import_directory, open_sqlite_storage
+from store import BIRTHDAYS, WEDDINGS
+
+
+class SqliteStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.storage = SqliteStorage(str(self.dir / 'bot.db'))
+
+    def tearDown(self):
+        self.storage.close()
+        self.tmp.cleanup()
+
+    def write(self, name, data):
+        (self.dir / name).write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+
+    def test_add_get_delete(self):
+        self.storage.add_event(BIRTHDAYS, 1, 'Иван', {'day': 1, 'month': 2, 'year': 1990})
+        self.assertEqual(self.storage.get_events(BIRTHDAYS, '1')['Иван']['year'], 1990)
+        self.assertTrue(self.storage.delete_event(BIRTHDAYS, 1, 'Иван'))
+        self.assertFalse(self.storage.delete_event(BIRTHDAYS, 1, 'Иван'))
+
+    def test_deleted_entry_does_not_come_back_from_older_backup(self):
+        self.write('birthdays_backup_20250101_000000.json', {'1': {'Иван': {'day': 1, 'month': 2},
+                                                                   'Петр': {'day': 3, 'month': 4}}})
+        self.write('birthdays.json', {'1': {'Иван': {'day': 1, 'month': 2}}})
+
+        totals = import_directory(self.storage, self.dir)
+
+        self.assertEqual(list(self.storage.get_events(BIRTHDAYS, 1)), ['Иван'])
+        self.assertEqual(totals[BIRTHDAYS], 1)
+
+    def test_newest_valid_backup_replaces_damaged_file(self):
+        self.write('weddings_backup_20250101_000000.json', {'1': {'Старая': {'day': 1, 'month': 1}}})
+        self.write('weddings_backup_20250301_000000.json', {'1': {'Новая': {'day': 2, 'month': 2}}})
+        (self.dir / 'weddings.json').write_text('{"1": {', encoding='utf-8')
+
+        import_directory(self.storage, self.dir)
+
+        self.assertEqual(list(self.storage.get_events(WEDDINGS, 1)), ['Новая'])
+        # Испорченный файл не удален, а отложен в сторону
+        self.assertTrue(any(name.startswith('weddings.json.corrupt-') for name in os.listdir(self.dir)))
+
+    def test_backups_can_be_disabled(self):
+        self.write('birthdays_backup_20250101_000000.json', {'1': {'Иван': {'day': 1, 'month': 2}}})
+
+        import_directory(self.storage, self.dir, backups=False)
+
+        self.assertEqual(self.storage.get_events(BIRTHDAYS, 1), {})
+
+
+class OpenSqliteStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.db = str(self.dir / 'bot.db')
+        (self.dir / 'birthdays.json').write_text(json.dumps({'1': {'Иван': {'day': 1, 'month': 2}}}), encoding='utf-8')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def open(self):
+        return open_sqlite_storage(self.db, str(self.dir / 'birthdays.json'), str(self.dir / 'weddings.json'),
+                                   str(self.dir / 'messages_log.json'), str(self.dir / 'messages_log'))
+
+    def test_json_files_are_imported_on_first_start(self):
+        storage = self.open()
+        self.assertEqual(list(storage.get_events(BIRTHDAYS, 1)), ['Иван'])
+        storage.close()
+        self.assertEqual(sorted(os.listdir(self.dir)), ['birthdays.json', 'bot.db'])
+
+    def test_interrupted_import_is_repeated(self):
+        # Прерванный перенос оставил частичную временную базу, а bot.db нет
+        partial = SqliteStorage(f"{self.db}.importing")
+        partial.add_event(WEDDINGS, 1, 'Старая', {'day': 1, 'month': 1})
+        partial.close()
+
+        storage = self.open()
+        self.assertEqual(list(storage.get_events(BIRTHDAYS, 1)), ['Иван'])
+        self.assertEqual(storage.get_events(WEDDINGS, 1), {})
+        storage.close()
+        self.assertFalse(os.path.exists(f"{self.db}.importing"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты хранилища в памяти с отложенной записью (store.py).
+
+    python -m pytest test_store.py
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from datetime import date
+from unittest import mock
+
+import file_io
+from store import BIRTHDAYS, WEDDINGS, JsonStorage, JsonStore
+
+
+class JsonStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'data.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read(self):
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_missing_file_is_empty(self):
+        self.assertEqual(JsonStore(self.path).data, {})
+
+    def test_change_without_loop_is_written_immediately(self):
+        store = JsonStore(self.path)
+        store.replace({'1': {'Иван': {'day': 1, 'month': 2}}})
+        self.assertEqual(self.read(), {'1': {'Иван': {'day': 1, 'month': 2}}})
+
+    def test_changes_in_loop_are_coalesced(self):
+        async def scenario():
+            store = JsonStore(self.path, flush_delay=0.05)
+            for i in range(50):
+                store.data = {'i': i}
+                store.mark_dirty()
+            self.assertFalse(os.path.exists(self.path))  # запись отложена
+            await asyncio.sleep(0.1)
+            await file_io.drain()
+            return store
+
+        store = asyncio.run(scenario())
+        self.assertEqual(self.read(), {'i': 49})
+        self.assertEqual(store.writer.written, 1)
+
+    def test_flush_writes_pending_changes(self):
+        async def scenario():
+            store = JsonStore(self.path, flush_delay=60)
+            store.replace({'a': 1})
+            store.flush()
+
+        asyncio.run(scenario())
+        self.assertEqual(self.read(), {'a': 1})
+
+    def test_failed_write_is_kept_and_retried(self):
+        self.path = os.path.join(self.tmp.name, 'missing', 'data.json')
+
+        async def scenario():
+            store = JsonStore(self.path, flush_delay=0)
+            with self.assertLogs('file_io', 'ERROR'):
+                store.replace({'a': 1})
+                await asyncio.sleep(0.01)
+                await file_io.drain()  # Не ждет повтора
+            # Каталога нет - версия не записана, но осталась в памяти
+            self.assertEqual(json.loads(store.writer.pending()), {'a': 1})
+            os.mkdir(os.path.dirname(self.path))
+
+            store.replace({'a': 2})  # Новая версия ждет того же повтора
+            await asyncio.sleep(0)
+            self.assertFalse(os.path.exists(self.path))
+            await asyncio.sleep(0.2)
+            await file_io.drain()
+            self.assertIsNone(store.writer.pending())
+            return store
+
+        with mock.patch.object(file_io, 'RETRY_DELAY', 0.05):
+            store = asyncio.run(scenario())
+        self.assertEqual(self.read(), {'a': 2})
+        self.assertEqual(store.writer.written, 1)
+
+
+class JsonStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.files = [os.path.join(self.tmp.name, name) for name in ('birthdays.json', 'weddings.json')]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def open(self):
+        return JsonStorage(*self.files, messages_log_dir=os.path.join(self.tmp.name, 'messages_log'))
+
+    def test_events_survive_reopen(self):
+        storage = self.open()
+        storage.add_event(BIRTHDAYS, -100, 'Иван', {'day': 1, 'month': 2, 'year': 1990})
+        storage.add_event(WEDDINGS, -100, 'Иван и Мария', {'day': 3, 'month': 4, 'year': 2015})
+        storage.close()
+
+        storage = self.open()
+        self.assertEqual(dict(storage.get_events(BIRTHDAYS, -100)['Иван']), {'day': 1, 'month': 2, 'year': 1990})
+        self.assertEqual(list(storage.get_events(WEDDINGS, '-100')), ['Иван и Мария'])
+
+    def test_delete_event(self):
+        storage = self.open()
+        storage.add_event(BIRTHDAYS, 1, 'Иван', {'day': 1, 'month': 2})
+        self.assertTrue(storage.delete_event(BIRTHDAYS, 1, 'Иван'))
+        self.assertFalse(storage.delete_event(BIRTHDAYS, 1, 'Иван'))
+        self.assertEqual(storage.events_on(BIRTHDAYS, 1, 2, 1), {})
+
+    def test_queries_use_date_index(self):
+        storage = self.open()
+        storage.add_event(BIRTHDAYS, 1, 'Новый год', {'day': 1, 'month': 1})
+        storage.add_event(BIRTHDAYS, 1, 'Канун', {'day': 31, 'month': 12})
+        storage.add_event(BIRTHDAYS, 2, 'Другой чат', {'day': 1, 'month': 1})
+
+        self.assertEqual(list(storage.events_on(BIRTHDAYS, 1, 1, 1)), ['Новый год'])
+        upcoming = storage.upcoming_events(BIRTHDAYS, 1, date(2024, 12, 30), 7)
+        self.assertEqual([(name, days) for name, _, days, _ in upcoming], [('Канун', 1), ('Новый год', 2)])
+        self.assertEqual(sorted(chat for chat, _, _ in storage.all_events_on(BIRTHDAYS, 1, 1)), ['1', '2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты журнала бота: прореживание повторов и формат JSON (structured_log.py).
+
+    python -m pytest test_structured_log.py
+"""
+
+import json
+import logging
+import sys
+import unittest
+
+from structured_log import BackgroundQueueHandler, JsonFormatter, SamplingFilter
+
+
+def make_record(level=logging.INFO, msg="Сообщение %s в чате %s удалено", args=(42, -100), **extra):
+    record = logging.LogRecord('bot', level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class SamplingFilterTest(unittest.TestCase):
+    def test_repeated_info_is_sampled(self):
+        sampling = SamplingFilter(window=60, burst=3)
+        passed = [sampling.filter(make_record(args=(i, -100))) for i in range(10)]
+        # Шаблон одинаковый, аргументы разные - это одна и та же запись
+        self.assertEqual(passed, [True] * 3 + [False] * 7)
+        self.assertTrue(sampling.filter(make_record(msg="Другое сообщение")))
+
+    def test_next_window_reports_suppressed(self):
+        sampling = SamplingFilter(window=60, burst=2)
+        for _ in range(5):
+            sampling.filter(make_record())
+        # Окно истекло
+        for state in sampling._seen.values():
+            state[0] -= 60
+
+        record = make_record()
+        self.assertTrue(sampling.filter(record))
+        self.assertEqual(record.suppressed, 3)
+
+    def test_warnings_and_errors_are_never_dropped(self):
+        sampling = SamplingFilter(window=60, burst=1)
+        for level in (logging.WARNING, logging.ERROR, logging.CRITICAL):
+            self.assertTrue(all(sampling.filter(make_record(level)) for _ in range(20)))
+
+    def test_sampling_can_be_disabled(self):
+        sampling = SamplingFilter(window=0, burst=1)
+        self.assertTrue(all(sampling.filter(make_record()) for _ in range(20)))
+
+
+class JsonFormatterTest(unittest.TestCase):
+    def format(self, record):
+        return json.loads(JsonFormatter().format(record))
+
+    def test_fields_and_extra(self):
+        entry = self.format(make_record(chat_id=-100, slow_handler={'handler': 'start', 'total_ms': 1200}))
+
+        self.assertEqual(entry['level'], 'INFO')
+        self.assertEqual(entry['logger'], 'bot')
+        self.assertEqual(entry['message'], "Сообщение 42 в чате -100 удалено")
+        self.assertEqual(entry['chat_id'], -100)
+        self.assertEqual(entry['slow_handler'], {'handler': 'start', 'total_ms': 1200})
+        self.assertIn('time', entry)
+        self.assertNotIn('args', entry)
+
+    def test_exception_is_formatted(self):
+        try:
+            raise RuntimeError("сбой")
+        except RuntimeError:
+            record = make_record(logging.ERROR)
+            record.exc_info = sys.exc_info()
+
+        entry = self.format(record)
+        self.assertIn('RuntimeError: сбой', entry['exception'])
+
+    def test_unknown_objects_are_written_as_strings(self):
+        entry = self.format(make_record(chat=object(), nested={'value': object()}))
+        self.assertIsInstance(entry['chat'], str)
+        self.assertIsInstance(entry['nested'], str)
+
+    def test_queue_handler_substitutes_arguments(self):
+        items = [1]
+        record = BackgroundQueueHandler(None).prepare(make_record(msg="Чаты: %s", args=(items,)))
+        items.append(2)  # Изменение после записи в журнал не попадает в сообщение
+        self.assertEqual(self.format(record)['message'], "Чаты: [1]")
+
+
+if __name__ == '__main__':
+    unittest.main()
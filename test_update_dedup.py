@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты защиты от повторной обработки обновлений (update_dedup.py).
+
+    python -m pytest test_update_dedup.py
+"""
+
+import os
+import tempfile
+import time
+import unittest
+
+from update_dedup import UpdateDeduplicator
+
+
+class UpdateDeduplicatorTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'processed_updates.ring')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_repeated_update_is_detected(self):
+        dedup = UpdateDeduplicator(None)
+        self.assertFalse(dedup.seen(1))
+        dedup.add(1)
+        self.assertTrue(dedup.seen(1))
+        self.assertFalse(dedup.seen(2))
+        self.assertEqual(dedup.duplicates, 1)
+
+    def test_size_is_bounded(self):
+        dedup = UpdateDeduplicator(None, capacity=3)
+        for update_id in range(5):
+            dedup.add(update_id)
+        self.assertEqual(len(dedup), 3)
+        # Вытесняются самые старые
+        self.assertFalse(dedup.seen(0))
+        self.assertTrue(dedup.seen(4))
+
+    def test_old_updates_expire(self):
+        dedup = UpdateDeduplicator(None, ttl=0.01)
+        dedup.add(1)
+        time.sleep(0.02)
+        self.assertFalse(dedup.seen(1))
+        self.assertEqual(len(dedup), 0)
+
+    def test_updates_survive_restart(self):
+        dedup = UpdateDeduplicator(self.path, capacity=3)
+        for update_id in range(5):
+            dedup.add(update_id)
+        dedup.close()
+
+        dedup = UpdateDeduplicator(self.path, capacity=3)
+        self.assertEqual(len(dedup), 3)
+        self.assertTrue(dedup.seen(4))
+        self.assertFalse(dedup.seen(1))
+        # Запись продолжается с той же ячейки кольца
+        dedup.add(5)
+        dedup.close()
+
+        dedup = UpdateDeduplicator(self.path, capacity=3)
+        self.assertTrue(dedup.seen(5))
+        dedup.close()
+
+    def test_ring_of_other_size_is_reset(self):
+        dedup = UpdateDeduplicator(self.path, capacity=3)
+        dedup.add(1)
+        dedup.close()
+
+        dedup = UpdateDeduplicator(self.path, capacity=5)
+        self.assertEqual(len(dedup), 0)
+        dedup.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
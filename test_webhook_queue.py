@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты очереди обработки обновлений веб-хука (webhook_queue.py).
+
+    python -m pytest test_webhook_queue.py
+"""
+
+import asyncio
+import unittest
+
+from telegram import Update
+
+from webhook_queue import UpdateDispatcher
+
+
+def make_update(update_id: int, chat_id: int) -> Update:
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {'message_id': update_id, 'date': 0, 'chat': {'id': chat_id, 'type': 'group'}, 'text': 'текст'},
+    }, None)
+
+
+class UpdateDispatcherTest(unittest.IsolatedAsyncioTestCase):
+    async def test_order_is_kept_within_chat_and_chats_run_in_parallel(self):
+        processed = {}
+        running = 0
+        max_running = 0
+
+        async def process(update):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.001 * (update.update_id % 3))
+            processed.setdefault(update.effective_chat.id, []).append(update.update_id)
+            running -= 1
+
+        dispatcher = UpdateDispatcher(process, workers=4, queue_size=400)
+        dispatcher.start()
+        chats = [-1001, -1002, -1003, -1004, -1005, -1006]
+        update_id = 0
+        for _ in range(10):
+            for chat_id in chats:
+                update_id += 1
+                self.assertTrue(dispatcher.submit(make_update(update_id, chat_id)))
+        await dispatcher.stop()
+
+        self.assertEqual(dispatcher.processed, 60)
+        for chat_id in chats:
+            self.assertEqual(processed[chat_id], sorted(processed[chat_id]))
+            self.assertEqual(len(processed[chat_id]), 10)
+        self.assertGreater(max_running, 1)
+
+    async def test_full_queue_is_rejected_without_waiting(self):
+        release = asyncio.Event()
+
+        async def process(update):
+            await release.wait()
+
+        dispatcher = UpdateDispatcher(process, workers=1, queue_size=2)
+        dispatcher.start()
+        self.assertTrue(dispatcher.submit(make_update(1, -100)))
+        await asyncio.sleep(0)  # Воркер забрал первое обновление и ждет
+        self.assertTrue(dispatcher.submit(make_update(2, -100)))
+        self.assertTrue(dispatcher.submit(make_update(3, -100)))
+
+        # Очередь заполнена: ответ сразу, без ожидания места в очереди
+        self.assertFalse(dispatcher.submit(make_update(4, -100)))
+        self.assertEqual(dispatcher.rejected, 1)
+        self.assertEqual(dispatcher.pending(), 2)
+
+        release.set()
+        await dispatcher.stop()
+        self.assertEqual(dispatcher.processed, 3)
+
+    async def test_failed_update_does_not_stop_worker(self):
+        async def process(update):
+            if update.update_id == 1:
+                raise RuntimeError("сбой")
+
+        dispatcher = UpdateDispatcher(process, workers=1, queue_size=10)
+        dispatcher.start()
+        with self.assertLogs('webhook_queue', 'ERROR'):
+            dispatcher.submit(make_update(1, -100))
+            dispatcher.submit(make_update(2, -100))
+            await dispatcher.stop()
+        self.assertEqual((dispatcher.failed, dispatcher.processed), (1, 1))
+
+    async def test_stop_gives_up_after_timeout(self):
+        async def process(update):
+            await asyncio.sleep(10)
+
+        dispatcher = UpdateDispatcher(process, workers=1, queue_size=10)
+        dispatcher.start()
+        dispatcher.submit(make_update(1, -100))
+        with self.assertLogs('webhook_queue', 'WARNING'):
+            await dispatcher.stop(timeout=0.01)
+        self.assertEqual(dispatcher.processed, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты приема обновлений веб-хуком (webhook_server.py).
+
+    python -m pytest test_webhook_server.py
+"""
+
+import json
+import unittest
+from unittest import mock
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import webhook_server
+from update_dedup import UpdateDeduplicator
+from webhook_queue import UpdateDispatcher
+
+SECRET = b'secret'
+
+
+def update_body(update_id: int = 1, kind: str = 'message') -> bytes:
+    return json.dumps({
+        'update_id': update_id,
+        kind: {'message_id': 1, 'date': 0, 'chat': {'id': -100, 'type': 'group'}, 'text': '/start'},
+    }).encode()
+
+
+class WebhookAppTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.processed = []
+
+        async def process(update):
+            self.processed.append(update.update_id)
+
+        self.dispatcher = UpdateDispatcher(process, workers=1, queue_size=10)
+        self.dispatcher.start()
+        self.deduplicator = UpdateDeduplicator(None)
+        app = webhook_server.create_webhook_app(None, self.dispatcher, self.deduplicator, SECRET,
+                                                max_body=1024, wanted=frozenset({'message'}))
+        self.client = TestClient(TestServer(app))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.dispatcher.stop()
+
+    async def post(self, body: bytes, secret: bytes = SECRET, **kwargs):
+        headers = {webhook_server.SECRET_HEADER: secret.decode()} if secret is not None else {}
+        return await self.client.post('/telegram', data=body, headers=headers, **kwargs)
+
+    async def test_update_is_accepted_once(self):
+        self.assertEqual((await self.post(update_body(7))).status, 200)
+        self.assertEqual((await self.post(update_body(7))).status, 200)  # повторная доставка
+        await self.dispatcher.stop()
+        self.assertEqual(self.processed, [7])
+        self.assertEqual(self.deduplicator.duplicates, 1)
+
+    async def test_wrong_or_missing_secret_is_forbidden(self):
+        with mock.patch.object(webhook_server.codec, 'loads') as loads:
+            self.assertEqual((await self.post(update_body(), secret=b'wrong')).status, 403)
+            self.assertEqual((await self.post(update_body(), secret=None)).status, 403)
+        loads.assert_not_called()
+        self.assertEqual(self.dispatcher.pending(), 0)
+
+    async def test_oversized_body_is_rejected_before_parsing(self):
+        with mock.patch.object(webhook_server.codec, 'loads') as loads:
+            self.assertEqual((await self.post(b'x' * 2048)).status, 413)
+
+            # Тело без Content-Length ограничивается при чтении
+            async def chunks():
+                for _ in range(4):
+                    yield b'x' * 512
+
+            self.assertEqual((await self.post(chunks())).status, 413)
+        loads.assert_not_called()
+
+    async def test_invalid_json_is_bad_request(self):
+        with self.assertLogs('webhook_server', 'WARNING'):
+            self.assertEqual((await self.post(b'not json')).status, 400)
+            self.assertEqual((await self.post(b'{"message": {}}')).status, 400)  # нет update_id
+        self.assertEqual(self.dispatcher.pending(), 0)
+
+    async def test_unwanted_update_type_is_acknowledged_without_processing(self):
+        self.assertEqual((await self.post(update_body(3, kind='channel_post'))).status, 200)
+        await self.dispatcher.stop()
+        self.assertEqual(self.processed, [])
+
+    async def test_full_queue_asks_telegram_to_retry(self):
+        with mock.patch.object(self.dispatcher, 'submit', return_value=False):
+            response = await self.post(update_body(5))
+        self.assertEqual(response.status, 503)
+        self.assertEqual(response.headers['Retry-After'], str(self.dispatcher.retry_after))
+        # Отклоненное обновление не запоминается - повтор Telegram будет обработан
+        self.assertFalse(self.deduplicator.seen(5))
+
+
+if __name__ == '__main__':
+    unittest.main()
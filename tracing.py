@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Трассировка обработчиков: куда уходит время команды.
+
+Каждый обработчик Application оборачивается (trace_handlers), и его время
+делится на части:
+  storage  - вызовы хранилища и чтение/запись файлов данных;
+  telegram - запросы к Bot API вместе с ожиданием лимитера;
+  render   - остальное: разбор команды, подготовка текста ответа.
+
+Части попадают в метрику bot_handler_seconds{handler,part}, а обработчик
+дольше SLOW_HANDLER_MS миллисекунд записывается строкой JSON в журнал
+медленных обработчиков SLOW_HANDLER_LOG (и в журнал бота):
+
+    {"handler": "list_birthdays", "chat_id": -100..., "total_ms": 1520.3,
+     "storage_ms": 1340.1, "telegram_ms": 150.2, "render_ms": 30.0, ...}
+
+Вложенные замеры (файл внутри вызова хранилища) учитываются один раз.
+
+    application.add_handler(CommandHandler('list', self.list_birthdays))
+    trace_handlers(application)
+    storage = TracedStorage(create_storage(...))
+    with tracing.span('storage'):
+        ...
+"""
+
+import functools
+import inspect
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+STORAGE = 'storage'
+TELEGRAM = 'telegram'
+RENDER = 'render'
+
+
+class HandlerTrace:
+    """Замер одного вызова обработчика"""
+
+    __slots__ = ('handler', 'started', 'spent', 'calls', 'finished')
+
+    def __init__(self, handler: str):
+        self.handler = handler
+        self.started = time.perf_counter()
+        self.spent = {STORAGE: 0.0, TELEGRAM: 0.0}
+        self.calls = {STORAGE: 0, TELEGRAM: 0}
+        self.finished = False
+
+    def add(self, part: str, seconds: float):
+        self.spent[part] += seconds
+        self.calls[part] += 1
+
+    def parts(self, total: float) -> Dict[str, float]:
+        # Параллельные запросы внутри обработчика могут дать в сумме больше общего времени
+        render = max(0.0, total - self.spent[STORAGE] - self.spent[TELEGRAM])
+        return {STORAGE: self.spent[STORAGE], TELEGRAM: self.spent[TELEGRAM], RENDER: render}
+
+
+_current: ContextVar[Optional[HandlerTrace]] = ContextVar('handler_trace', default=None)
+_in_span: ContextVar[bool] = ContextVar('handler_trace_span', default=False)
+
+_slow_threshold = float(os.getenv('SLOW_HANDLER_MS', '1000')) / 1000
+_slow_log = os.getenv('SLOW_HANDLER_LOG', 'slow_handlers.jsonl')
+
+
+@contextmanager
+def span(part: str):
+    """Учитывает время блока как часть part текущего обработчика"""
+    trace = _current.get()
+    if trace is None or trace.finished or _in_span.get():
+        yield
+        return
+
+    token = _in_span.set(True)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _in_span.reset(token)
+        trace.add(part, time.perf_counter() - started)
+
+
+def _chat_id(update: Any) -> Optional[int]:
+    chat = getattr(update, 'effective_chat', None)
+    return chat.id if chat else None
+
+
+def _finish(trace: HandlerTrace, update: Any):
+    trace.finished = True
+    total = time.perf_counter() - trace.started
+    parts = trace.parts(total)
+
+    metrics.HANDLER_SECONDS.observe(total, trace.handler, 'total')
+    for part, seconds in parts.items():
+        metrics.HANDLER_SECONDS.observe(seconds, trace.handler, part)
+
+    if total < _slow_threshold:
+        return
+    record = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'handler': trace.handler,
+        'chat_id': _chat_id(update),
+        'update_id': getattr(update, 'update_id', None),
+        'total_ms': round(total * 1000, 1),
+        **{f"{part}_ms": round(seconds * 1000, 1) for part, seconds in parts.items()},
+        'storage_calls': trace.calls[STORAGE],
+        'telegram_calls': trace.calls[TELEGRAM],
+    }
+    _log_slow(record)
+
+
+def _log_slow(record: Dict):
+    logger.warning("🐢 Медленный обработчик %s: %s мс", record['handler'], record['total_ms'],
+                   extra={'slow_handler': record})
+    if not _slow_log:
+        return
+    import file_io  # file_io через codec сам отчитывается в трассировку, поэтому импорт здесь
+
+    # Запись идет в пуле ввода-вывода, а не в потоке цикла событий
+    file_io.append_json(_slow_log, record)
+
+
+def traced(callback: Callable[..., Awaitable], name: Optional[str] = None) -> Callable[..., Awaitable]:
+    """Оборачивает обработчик (update, context) замером времени"""
+    if getattr(callback, '__traced__', False):
+        return callback
+    handler_name = name or getattr(callback, '__name__', 'handler')
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        trace = HandlerTrace(handler_name)
+        token = _current.set(trace)
+        try:
+            return await callback(update, context)
+        finally:
+            _current.reset(token)
+            _finish(trace, update)
+
+    wrapper.__traced__ = True
+    return wrapper
+
+
+def trace_handlers(application):
+    """Оборачивает все зарегистрированные обработчики Application (вызывать после add_handler)"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = traced(handler.callback)
+
+
+class TracedStorage:
+    """Хранилище, вызовы которого учитываются как время storage"""
+
+    def __init__(self, storage):
+        self._storage = storage
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._storage, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        if inspect.iscoroutinefunction(attr):
+            @functools.wraps(attr)
+            async def call_async(*args, **kwargs):
+                with span(STORAGE):
+                    return await attr(*args, **kwargs)
+
+            return call_async
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            with span(STORAGE):
+                return attr(*args, **kwargs)
+
+        return call
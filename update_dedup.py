@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Защита от повторной обработки обновлений веб-хука.
+
+Telegram повторяет доставку обновления, если веб-хук ответил ошибкой
+или не ответил вовремя. UpdateDeduplicator помнит update_id последних
+UPDATE_DEDUP_SIZE обновлений не дольше UPDATE_DEDUP_TTL секунд; повтор
+отбрасывается одной проверкой по словарю.
+
+Чтобы память переживала перезапуск, каждый update_id пишется в кольцевой
+файл фиксированного размера (processed_updates.ring): заголовок с
+номером следующей ячейки и ячейки по 16 байт (update_id, время).
+"""
+
+import logging
+import os
+import struct
+import time
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('<Q')  # номер следующей ячейки
+RECORD = struct.Struct('<qd')  # update_id, время обработки
+
+
+class UpdateDeduplicator:
+    """Ограниченный по размеру и времени набор обработанных update_id"""
+
+    def __init__(self, path: Optional[str] = 'processed_updates.ring',
+                 capacity: Optional[int] = None, ttl: Optional[float] = None):
+        self.capacity = max(1, capacity or int(os.getenv('UPDATE_DEDUP_SIZE', '10000')))
+        self.ttl = ttl or float(os.getenv('UPDATE_DEDUP_TTL', '86400'))
+        self._seen: "OrderedDict[int, float]" = OrderedDict()  # {update_id: время}, по времени добавления
+        self._position = 0
+        self._fd = None
+        self.duplicates = 0
+
+        if path:
+            self._open(path)
+
+    def _open(self, path: str):
+        """Открывает кольцевой файл и загружает из него не устаревшие update_id"""
+        size = HEADER.size + RECORD.size * self.capacity
+        try:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            data = os.pread(self._fd, size, 0)
+        except OSError as e:
+            logger.error("Ошибка открытия файла обработанных обновлений %s: %s", path, e)
+            self._fd = None
+            return
+
+        if len(data) != size:
+            # Новый файл или изменился размер кольца - начинаем с чистого
+            os.ftruncate(self._fd, 0)
+            os.ftruncate(self._fd, size)
+            os.pwrite(self._fd, HEADER.pack(0), 0)
+            return
+
+        self._position = HEADER.unpack_from(data, 0)[0] % self.capacity
+        oldest = time.time() - self.ttl
+        records = []
+        for slot in range(self.capacity):
+            update_id, seen_at = RECORD.unpack_from(data, HEADER.size + slot * RECORD.size)
+            if seen_at > oldest:
+                records.append((seen_at, update_id))
+        for seen_at, update_id in sorted(records):
+            self._seen[update_id] = seen_at
+
+    def _expire(self, now: float):
+        oldest = now - self.ttl
+        while self._seen:
+            update_id, seen_at = next(iter(self._seen.items()))
+            if seen_at > oldest and len(self._seen) <= self.capacity:
+                break
+            self._seen.popitem(last=False)
+
+    def seen(self, update_id: int) -> bool:
+        """True, если обновление уже обрабатывалось"""
+        self._expire(time.time())
+        if update_id in self._seen:
+            self.duplicates += 1
+            return True
+        return False
+
+    def add(self, update_id: int):
+        """Запоминает обновление как принятое в обработку"""
+        now = time.time()
+        self._seen[update_id] = now
+        self._expire(now)
+
+        if self._fd is not None:
+            try:
+                os.pwrite(self._fd, RECORD.pack(update_id, now), HEADER.size + self._position * RECORD.size)
+                self._position = (self._position + 1) % self.capacity
+                os.pwrite(self._fd, HEADER.pack(self._position), 0)
+            except OSError as e:
+                logger.error("Ошибка записи файла обработанных обновлений: %s", e)
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
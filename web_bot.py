@@ -2,44 +2,62 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
-import json
+import logging
 import os
 import random
-import threading
 from datetime import datetime, timedelta
-from pathlib import Path
-from typing import Dict, List
+from typing import List
 
 import pytz
-import schedule
-import time
 from dotenv import load_dotenv
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Bot
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application, CommandHandler, ContextTypes, 
     CallbackQueryHandler, MessageHandler, filters
 )
 
-# Отладочный вывод переменных окружения
-print("🔍 Проверка переменных окружения:")
-print(f"BOT_TOKEN: {'✅ Установлен' if os.environ.get('BOT_TOKEN') else '❌ Отсутствует'}")
-print(f"TIMEZONE: {os.environ.get('TIMEZONE', 'Не установлен')}")
-print(f"WEBHOOK_URL: {'✅ Установлен' if os.environ.get('WEBHOOK_URL') else '❌ Отсутствует'}")
-print(f"PORT: {os.environ.get('PORT', 'Не установлен')}")
+from chat_state import ChatState
+from loop_monitor import LoopMonitor
+from notifications import (
+    DIGEST, INDIVIDUAL, NOTIFY_MODES, ChatUnavailable, NotificationLedger, NotificationModes, NotificationState,
+    deliver_pending, is_chat_unavailable, late_prefix, send_digest
+)
+from outbound import create_bot
+from scheduler import DailyScheduler
+from snapshots import SnapshotManager
+from store import BIRTHDAYS, WEDDINGS, create_storage
+from structured_log import setup_logging
+from tracing import trace_handlers
+from webhook_server import serve_webhook
+
+logger = logging.getLogger(__name__)
 
-# Создаем файл .env, если он не существует
-if not os.path.exists('.env'):
+# Загружаем переменные окружения
+load_dotenv()
+
+
+def create_env_file():
+    """Создает файл .env из переменных окружения, если его нет (вызывается после setup_logging)"""
+    if os.path.exists('.env'):
+        return
     try:
         with open('.env', 'w') as f:
             f.write(f"BOT_TOKEN={os.environ.get('BOT_TOKEN', '')}\n")
             f.write(f"TIMEZONE={os.environ.get('TIMEZONE', 'Europe/Moscow')}\n")
             f.write(f"WEBHOOK_URL={os.environ.get('WEBHOOK_URL', '')}\n")
-        print("✅ Файл .env создан на основе переменных окружения")
+        logger.info("✅ Файл .env создан на основе переменных окружения")
     except Exception as e:
-        print(f"❌ Ошибка при создании файла .env: {e}")
+        logger.error("❌ Ошибка при создании файла .env: %s", e)
+
+
+def log_environment():
+    """Отладочный вывод переменных окружения при запуске"""
+    logger.info("🔍 Проверка переменных окружения: BOT_TOKEN: %s, TIMEZONE: %s, WEBHOOK_URL: %s, PORT: %s",
+                '✅ Установлен' if os.environ.get('BOT_TOKEN') else '❌ Отсутствует',
+                os.environ.get('TIMEZONE', 'Не установлен'),
+                '✅ Установлен' if os.environ.get('WEBHOOK_URL') else '❌ Отсутствует',
+                os.environ.get('PORT', 'Не установлен'))
 
-# Загружаем переменные окружения
-load_dotenv()
 
 class BirthdayBot:
     def __init__(self):
@@ -49,7 +67,32 @@ class BirthdayBot:
         self.current_dir = os.path.dirname(os.path.abspath(__file__))
         self.birthdays_file = os.path.join(self.current_dir, 'birthdays.json')
         self.weddings_file = os.path.join(self.current_dir, 'weddings.json')
-        self.admin_chats = set()  # Чаты где бот может отправлять уведомления
+        # Хранилище данных (JSON в памяти или SQLite, см. STORAGE_BACKEND)
+        self.storage = create_storage(
+            self.birthdays_file,
+            self.weddings_file,
+            messages_log_file=os.path.join(self.current_dir, 'messages_log.json'),
+            messages_log_dir=os.path.join(self.current_dir, 'messages_log')
+        )
+        # Автоматические снимки данных (восстановление - /restore)
+        self.snapshots = SnapshotManager(self.storage, os.path.join(self.current_dir, 'snapshots'))
+        # Чаты с уведомлениями сохраняются между перезапусками
+        self.chat_state = ChatState(os.path.join(self.current_dir, 'chat_state.json'))
+        self.admin_chats = self.chat_state.admin_chats  # Чаты где бот может отправлять уведомления
+        self.admin_username = "dmitru_pv"  # Администратор: восстановление данных из снимков
+        self.application = None
+        self.bot = None  # Создается в run_webhook и используется для уведомлений
+        # Отметки отправленных уведомлений для догоняющего прохода
+        self.notification_state = NotificationState(os.path.join(self.current_dir, 'notifications_state.json'))
+        # Журнал отправок: одно поздравление не уходит дважды даже при нескольких экземплярах
+        self.notification_ledger = NotificationLedger(os.path.join(self.current_dir, 'notifications_ledger.db'))
+        # Режим уведомлений чатов: дайджест или отдельные сообщения
+        self.notification_modes = NotificationModes(os.path.join(self.current_dir, 'notification_modes.json'))
+        # Ежедневные уведомления в полночь в цикле событий бота, при запуске - догоняющий проход
+        self.scheduler = DailyScheduler(self.timezone)
+        self.scheduler.add_daily_job(self.check_and_send_notifications, '00:00', name='notifications', run_on_start=True)
+        # Контроль задержек цикла событий (метрики, в отладке - стек блокирующего вызова)
+        self.loop_monitor = LoopMonitor()
         self.webhook_url = os.environ.get('WEBHOOK_URL') or os.getenv('WEBHOOK_URL')
         self.port = int(os.environ.get('PORT') or os.getenv('PORT', 10000))
         
@@ -71,55 +114,6 @@ class BirthdayBot:
             "🌹 Поздравляем {names} с годовщиной! Любви, терпения и взаимопонимания! 💕"
         ]
     
-    def load_birthdays(self) -> Dict:
-        """Загружает дни рождения из файла"""
-        try:
-            if Path(self.birthdays_file).exists():
-                print(f"🔍 Файл {self.birthdays_file} существует, пытаюсь загрузить...")
-                with open(self.birthdays_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    print(f"✅ Данные успешно загружены: {list(data.keys()) if data else 'пусто'}")
-                    return data
-            else:
-                print(f"❌ Файл {self.birthdays_file} не существует")
-            # Создаем пустой файл, если он не существует
-            self.save_birthdays({})
-            return {}
-        except Exception as e:
-            print(f"❌ Ошибка загрузки файла дней рождения: {e}")
-            import traceback
-            traceback.print_exc()
-            return {}
-    
-    def save_birthdays(self, birthdays: Dict):
-        """Сохраняет дни рождения в файл"""
-        try:
-            with open(self.birthdays_file, 'w', encoding='utf-8') as f:
-                json.dump(birthdays, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Ошибка сохранения файла дней рождения: {e}")
-    
-    def load_weddings(self) -> Dict:
-        """Загружает свадьбы из файла"""
-        try:
-            if Path(self.weddings_file).exists():
-                with open(self.weddings_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            # Создаем пустой файл, если он не существует
-            self.save_weddings({})
-            return {}
-        except Exception as e:
-            print(f"Ошибка загрузки файла свадеб: {e}")
-            return {}
-    
-    def save_weddings(self, weddings: Dict):
-        """Сохраняет свадьбы в файл"""
-        try:
-            with open(self.weddings_file, 'w', encoding='utf-8') as f:
-                json.dump(weddings, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Ошибка сохранения файла свадеб: {e}")
-    
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /start"""
         welcome_text = """
@@ -173,6 +167,8 @@ class BirthdayBot:
 
 🔸 Другие команды:
 /enable_notifications - Включить автоуведомления
+/notify_mode - Дайджест или отдельные сообщения
+/restore - Снимки данных и восстановление (администратор)
 
 📝 Примеры:
 /add Мария 25.12
@@ -208,19 +204,11 @@ class BirthdayBot:
             if not (1 <= day <= 31 and 1 <= month <= 12):
                 raise ValueError("Некорректная дата")
             
-            birthdays = self.load_birthdays()
-            chat_id = str(update.effective_chat.id)
-            
-            if chat_id not in birthdays:
-                birthdays[chat_id] = {}
-            
-            birthdays[chat_id][name] = {
+            self.storage.add_event(BIRTHDAYS, update.effective_chat.id, name, {
                 'day': day,
                 'month': month,
                 'year': year
-            }
-            
-            self.save_birthdays(birthdays)
+            })
             
             age_info = f" ({datetime.now().year - year} лет)" if year else ""
             await update.message.reply_text(
@@ -265,20 +253,12 @@ class BirthdayBot:
             if not (1 <= day <= 31 and 1 <= month <= 12):
                 raise ValueError("Некорректная дата")
             
-            weddings = self.load_weddings()
-            chat_id = str(update.effective_chat.id)
-            
-            if chat_id not in weddings:
-                weddings[chat_id] = {}
-            
-            weddings[chat_id][names] = {
+            self.storage.add_event(WEDDINGS, update.effective_chat.id, names, {
                 'day': day,
                 'month': month,
                 'year': year,
                 'names': names
-            }
-            
-            self.save_weddings(weddings)
+            })
             
             years_married = datetime.now().year - year
             await update.message.reply_text(
@@ -295,13 +275,9 @@ class BirthdayBot:
     
     async def list_birthdays(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /list для показа всех дней рождения"""
-        birthdays = self.load_birthdays()
-        print(f"📋 Загруженные дни рождения: {birthdays}")
-        
-        chat_id = str(update.effective_chat.id)
-        print(f"🆔 ID чата: {chat_id}")
+        chat_birthdays = self.storage.get_events(BIRTHDAYS, update.effective_chat.id)
         
-        if chat_id not in birthdays or not birthdays[chat_id]:
+        if not chat_birthdays:
             await update.message.reply_text("📝 Список дней рождения пуст!")
             return
         
@@ -309,7 +285,7 @@ class BirthdayBot:
         
         # Сортируем по дате
         sorted_birthdays = sorted(
-            birthdays[chat_id].items(),
+            chat_birthdays.items(),
             key=lambda x: (x[1]['month'], x[1]['day'])
         )
         
@@ -330,10 +306,9 @@ class BirthdayBot:
         if not update.message:
             return
             
-        weddings = self.load_weddings()
-        chat_id = str(update.effective_chat.id)
+        chat_weddings = self.storage.get_events(WEDDINGS, update.effective_chat.id)
         
-        if chat_id not in weddings or not weddings[chat_id]:
+        if not chat_weddings:
             await update.message.reply_text("📝 Список свадеб пуст!")
             return
         
@@ -341,7 +316,7 @@ class BirthdayBot:
         
         # Сортируем по дате
         sorted_weddings = sorted(
-            weddings[chat_id].items(),
+            chat_weddings.items(),
             key=lambda x: (x[1]['month'], x[1]['day'])
         )
         
@@ -357,16 +332,15 @@ class BirthdayBot:
     
     async def delete_birthday(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /delete для удаления дня рождения"""
-        birthdays = self.load_birthdays()
-        chat_id = str(update.effective_chat.id)
+        chat_birthdays = self.storage.get_events(BIRTHDAYS, update.effective_chat.id)
         
-        if chat_id not in birthdays or not birthdays[chat_id]:
+        if not chat_birthdays:
             await update.message.reply_text("📝 Список дней рождения пуст!")
             return
         
         # Создаем клавиатуру с именами
         keyboard = []
-        for name in birthdays[chat_id].keys():
+        for name in chat_birthdays.keys():
             keyboard.append([InlineKeyboardButton(f"❌ {name}", callback_data=f"delete_{name}")])
         
         keyboard.append([InlineKeyboardButton("🚫 Отмена", callback_data="cancel")])
@@ -382,16 +356,15 @@ class BirthdayBot:
         if not update.message:
             return
             
-        weddings = self.load_weddings()
-        chat_id = str(update.effective_chat.id)
+        chat_weddings = self.storage.get_events(WEDDINGS, update.effective_chat.id)
         
-        if chat_id not in weddings or not weddings[chat_id]:
+        if not chat_weddings:
             await update.message.reply_text("📝 Список свадеб пуст!")
             return
         
         # Создаем клавиатуру с именами
         keyboard = []
-        for name in weddings[chat_id].keys():
+        for name in chat_weddings.keys():
             keyboard.append([InlineKeyboardButton(name, callback_data=f"delete_wedding_{name}")])
         
         # Добавляем кнопку отмены
@@ -407,17 +380,13 @@ class BirthdayBot:
     async def today_birthdays(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /today для проверки именинников сегодня"""
         today = datetime.now(self.timezone)
-        birthdays = self.load_birthdays()
-        chat_id = str(update.effective_chat.id)
+        chat_id = update.effective_chat.id
         
-        if chat_id not in birthdays:
+        if not self.storage.count_events(BIRTHDAYS, chat_id):
             await update.message.reply_text("📝 Список дней рождения пуст!")
             return
         
-        today_birthdays = []
-        for name, data in birthdays[chat_id].items():
-            if data['day'] == today.day and data['month'] == today.month:
-                today_birthdays.append(name)
+        today_birthdays = list(self.storage.events_on(BIRTHDAYS, chat_id, today.month, today.day))
         
         if today_birthdays:
             text = "🎉 Сегодня день рождения у:\n\n"
@@ -435,18 +404,16 @@ class BirthdayBot:
             return
             
         today = datetime.now(self.timezone)
-        weddings = self.load_weddings()
-        chat_id = str(update.effective_chat.id)
+        chat_id = update.effective_chat.id
         
-        if chat_id not in weddings:
+        if not self.storage.count_events(WEDDINGS, chat_id):
             await update.message.reply_text("📝 Список свадеб пуст!")
             return
         
         today_weddings = []
-        for name, data in weddings[chat_id].items():
-            if data['day'] == today.day and data['month'] == today.month:
-                years_married = today.year - data['year']
-                today_weddings.append((name, years_married))
+        for name, data in self.storage.events_on(WEDDINGS, chat_id, today.month, today.day).items():
+            years_married = today.year - data['year']
+            today_weddings.append((name, years_married))
         
         if today_weddings:
             text = "💍 Сегодня годовщина свадьбы у:\n\n"
@@ -462,36 +429,19 @@ class BirthdayBot:
     async def upcoming_birthdays(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /upcoming для показа ближайших дней рождения"""
         today = datetime.now(self.timezone)
-        birthdays = self.load_birthdays()
-        chat_id = str(update.effective_chat.id)
+        chat_id = update.effective_chat.id
         
-        if chat_id not in birthdays:
+        if not self.storage.count_events(BIRTHDAYS, chat_id):
             await update.message.reply_text("📝 Список дней рождения пуст!")
             return
         
-        upcoming = []
-        for name, data in birthdays[chat_id].items():
-            # Создаем дату дня рождения в этом году
-            try:
-                birthday_this_year = datetime(today.year, data['month'], data['day'])
-                if birthday_this_year < today:
-                    # Если день рождения уже прошел в этом году, берем следующий год
-                    birthday_this_year = datetime(today.year + 1, data['month'], data['day'])
-                
-                days_until = (birthday_this_year - today).days
-                
-                if 0 <= days_until <= 7:
-                    upcoming.append((name, data, days_until, birthday_this_year))
-            except ValueError:
-                # Обрабатываем случай 29 февраля
-                continue
+        # Уже отсортировано по дням до дня рождения
+        upcoming = self.storage.upcoming_events(BIRTHDAYS, chat_id, today.date(), 7)
         
         if not upcoming:
             await update.message.reply_text("📅 В ближайшую неделю именинников нет!")
             return
         
-        upcoming.sort(key=lambda x: x[2])  # Сортируем по дням до дня рождения
-        
         text = "📅 Ближайшие дни рождения (на неделю):\n\n"
         for name, data, days_until, birthday_date in upcoming:
             if days_until == 0:
@@ -509,39 +459,22 @@ class BirthdayBot:
             return
             
         today = datetime.now(self.timezone)
-        weddings = self.load_weddings()
-        chat_id = str(update.effective_chat.id)
+        chat_id = update.effective_chat.id
         
-        if chat_id not in weddings:
+        if not self.storage.count_events(WEDDINGS, chat_id):
             await update.message.reply_text("📝 Список свадеб пуст!")
             return
         
-        upcoming = []
-        for name, data in weddings[chat_id].items():
-            # Создаем дату годовщины в этом году
-            try:
-                wedding_this_year = datetime(today.year, data['month'], data['day'])
-                if wedding_this_year < today:
-                    # Если годовщина уже прошла в этом году, берем следующий год
-                    wedding_this_year = datetime(today.year + 1, data['month'], data['day'])
-                
-                days_until = (wedding_this_year - today).days
-                years_married = wedding_this_year.year - data['year']
-                
-                if 0 <= days_until <= 7:
-                    upcoming.append((name, data, days_until, wedding_this_year, years_married))
-            except ValueError:
-                # Обрабатываем случай 29 февраля
-                continue
+        # Уже отсортировано по дням до годовщины
+        upcoming = self.storage.upcoming_events(WEDDINGS, chat_id, today.date(), 7)
         
         if not upcoming:
             await update.message.reply_text("📅 В ближайшую неделю годовщин свадеб нет!")
             return
         
-        upcoming.sort(key=lambda x: x[2])  # Сортируем по дням до годовщины
-        
         text = "📅 Ближайшие годовщины свадеб (на неделю):\n\n"
-        for name, data, days_until, wedding_date, years_married in upcoming:
+        for name, data, days_until, wedding_date in upcoming:
+            years_married = wedding_date.year - data['year']
             if days_until == 0:
                 text += f"💍 {name} - СЕГОДНЯ! ({years_married} лет вместе)\n"
             elif days_until == 1:
@@ -561,6 +494,65 @@ class BirthdayBot:
             "Бот будет присылать уведомления о днях рождения каждый день в 00:00 (полночь)."
         )
     
+    async def notify_mode(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Выбор режима уведомлений: дайджест или отдельные сообщения"""
+        chat_id = update.effective_chat.id
+        modes_text = {
+            DIGEST: "📋 дайджест - все поздравления дня одним сообщением",
+            INDIVIDUAL: "✉️ отдельные сообщения - по одному на каждое событие",
+        }
+        
+        if not context.args:
+            await update.message.reply_text(
+                f"🔔 Режим уведомлений: {modes_text[self.notification_modes.get(chat_id)]}\n\n"
+                "Изменить: /notify_mode digest или /notify_mode individual"
+            )
+            return
+        
+        mode = context.args[0].lower()
+        if mode not in NOTIFY_MODES:
+            await update.message.reply_text("❌ Используйте: /notify_mode digest или /notify_mode individual")
+            return
+        
+        self.notification_modes.set(chat_id, mode)
+        await update.message.reply_text(f"✅ Режим уведомлений: {modes_text[mode]}")
+    
+    def is_admin_user(self, user) -> bool:
+        """Проверяет, является ли пользователь администратором"""
+        if not user:
+            return False
+        return user.username == self.admin_username
+    
+    async def restore_snapshot(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /restore: список снимков или восстановление данных из снимка"""
+        if not self.is_admin_user(update.effective_user):
+            await update.message.reply_text(f"❌ Только @{self.admin_username} может восстанавливать данные!")
+            return
+        
+        if not context.args:
+            snapshots = self.snapshots.list()[:10]
+            if not snapshots:
+                await update.message.reply_text("📦 Снимков пока нет.")
+            else:
+                lines = [f"• {manifest['id']} ({manifest['reason']})" for manifest in snapshots]
+                await update.message.reply_text(
+                    "📦 Последние снимки:\n\n" + "\n".join(lines) + "\n\nВосстановить: /restore ID"
+                )
+            return
+        
+        snapshot_id = context.args[0]
+        try:
+            counts = await self.snapshots.restore(snapshot_id)
+            await update.message.reply_text(
+                f"✅ Данные восстановлены из снимка {snapshot_id}: "
+                f"{counts.get(BIRTHDAYS, 0)} дней рождения, {counts.get(WEDDINGS, 0)} свадеб.\n"
+                "Состояние до восстановления сохранено отдельным снимком."
+            )
+        except KeyError:
+            await update.message.reply_text(f"❌ Снимок {snapshot_id} не найден. Список: /restore")
+        except Exception as e:
+            await update.message.reply_text(f"❌ Ошибка восстановления: {e}")
+    
     async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик нажатий на кнопки"""
         query = update.callback_query
@@ -574,219 +566,167 @@ class BirthdayBot:
             if query.data.startswith("delete_wedding_"):
                 name = query.data[14:]  # Убираем "delete_wedding_"
                 
-                weddings = self.load_weddings()
-                chat_id = str(update.effective_chat.id)
-                
-                if chat_id in weddings and name in weddings[chat_id]:
-                    del weddings[chat_id][name]
-                    self.save_weddings(weddings)
+                if self.storage.delete_event(WEDDINGS, update.effective_chat.id, name):
                     await query.edit_message_text(f"✅ Свадьба {name} удалена!")
                 else:
                     await query.edit_message_text("❌ Ошибка при удалении!")
             else:
                 name = query.data[7:]  # Убираем "delete_"
                 
-                birthdays = self.load_birthdays()
-                chat_id = str(update.effective_chat.id)
-                
-                if chat_id in birthdays and name in birthdays[chat_id]:
-                    del birthdays[chat_id][name]
-                    self.save_birthdays(birthdays)
+                if self.storage.delete_event(BIRTHDAYS, update.effective_chat.id, name):
                     await query.edit_message_text(f"✅ День рождения {name} удален!")
                 else:
                     await query.edit_message_text("❌ Ошибка при удалении!")
     
     async def check_and_send_notifications(self):
-        """Проверяет и отправляет уведомления о днях рождения и свадьбах"""
-        if not self.admin_chats:
+        """Отправляет уведомления за сегодня и за пропущенные дни (догоняющий проход)"""
+        if not self.bot:
             return
         
-        today = datetime.now(self.timezone)
-        birthdays = self.load_birthdays()
-        weddings = self.load_weddings()
-        
-        # Создаем экземпляр бота напрямую
-        from telegram import Bot
-        bot = Bot(token=self.bot_token)
-        
-        for chat_id in self.admin_chats:
-            # Проверяем дни рождения
-            chat_birthdays = birthdays.get(str(chat_id), {})
-            
-            today_celebrants = []
-            for name, data in chat_birthdays.items():
-                if data['day'] == today.day and data['month'] == today.month:
-                    today_celebrants.append(name)
-            
-            if today_celebrants:
-                for name in today_celebrants:
-                    congratulation = random.choice(self.congratulations).format(name=name)
-                    try:
-                        await bot.send_message(
-                            chat_id=chat_id,
-                            text=f"🎉 Напоминание о дне рождения!\n\n{congratulation}",
-                            parse_mode="HTML"
-                        )
-                    except Exception as e:
-                        print(f"Ошибка отправки уведомления о дне рождения в чат {chat_id}: {e}")
-            
-            # Проверяем свадьбы
-            chat_weddings = weddings.get(str(chat_id), {})
-            
-            today_wedding_celebrants = []
-            for name, data in chat_weddings.items():
-                if data['day'] == today.day and data['month'] == today.month:
-                    years_married = today.year - data['year']
-                    today_wedding_celebrants.append((name, years_married))
-            
-            if today_wedding_celebrants:
-                for name, years in today_wedding_celebrants:
-                    congratulation = random.choice(self.wedding_congratulations).format(names=name)
-                    try:
-                        await bot.send_message(
-                            chat_id=chat_id,
-                            text=f"💍 Напоминание о годовщине свадьбы!\n\n{congratulation}\n\nСегодня {years} лет вместе! 🎉",
-                            parse_mode="HTML"
-                        )
-                    except Exception as e:
-                        print(f"Ошибка отправки уведомления о свадьбе в чат {chat_id}: {e}")
+        today = datetime.now(self.timezone).date()
+        await deliver_pending(self.notification_state, self.admin_chats, today, self.send_day_notifications,
+                              on_unavailable=self.admin_chats.discard)
     
-    def schedule_notifications(self):
-        """Настраивает расписание для уведомлений"""
-        schedule.every().day.at("00:00").do(
-            lambda: asyncio.run(self.check_and_send_notifications())
-        )
+    async def send_day_notifications(self, chat_id: int, day, delay: int) -> bool:
+        """Отправляет поздравления чата за указанный день; True - все поздравления дня отправлены"""
+        prefix = late_prefix(delay, day)
+        birthdays = self.storage.events_on(BIRTHDAYS, chat_id, day.month, day.day)
+        weddings = self.storage.events_on(WEDDINGS, chat_id, day.month, day.day)
+        if not birthdays and not weddings:
+            return True
+        event_ids = ([NotificationLedger.event_id(BIRTHDAYS, name) for name in birthdays] +
+                     [NotificationLedger.event_id(WEDDINGS, name) for name in weddings])
+        
+        # Используем уже созданного бота и его пул соединений
+        def send(text: str):
+            return self.bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML")
+        
+        if self.notification_modes.get(chat_id) == DIGEST:
+            # Все поздравления дня одним сообщением
+            items = [
+                (NotificationLedger.event_id(BIRTHDAYS, name), random.choice(self.congratulations).format(name=name))
+                for name in birthdays
+            ]
+            for name, data in weddings.items():
+                congratulation = random.choice(self.wedding_congratulations).format(names=name)
+                items.append((NotificationLedger.event_id(WEDDINGS, name),
+                              f"{congratulation}\nСегодня {day.year - data['year']} лет вместе! 🎉"))
+            try:
+                await send_digest(self.notification_ledger, chat_id, day,
+                                  f"{prefix}📅 Праздники {day.strftime('%d.%m.%Y')}:", items, send)
+            except Exception as e:
+                if is_chat_unavailable(e):
+                    # Бот удален из чата или чат не найден - deliver_pending уберет чат из списка
+                    raise ChatUnavailable(chat_id) from e
+                logger.error("Ошибка отправки дайджеста в чат %s: %s", chat_id, e, extra={'chat_id': chat_id})
+            return self.notification_ledger.all_sent(chat_id, event_ids, day)
+        
+        # Проверяем дни рождения
+        for name in birthdays:
+            congratulation = random.choice(self.congratulations).format(name=name)
+            text = f"{prefix}🎉 Напоминание о дне рождения!\n\n{congratulation}"
+            try:
+                # Ledger не даст отправить то же поздравление повторно
+                await self.notification_ledger.send_once(
+                    chat_id, NotificationLedger.event_id(BIRTHDAYS, name), day, lambda: send(text)
+                )
+            except Exception as e:
+                if is_chat_unavailable(e):
+                    raise ChatUnavailable(chat_id) from e
+                logger.error("Ошибка отправки уведомления о дне рождения в чат %s: %s", chat_id, e, extra={'chat_id': chat_id})
+        
+        # Проверяем свадьбы
+        for name, data in weddings.items():
+            years = day.year - data['year']
+            congratulation = random.choice(self.wedding_congratulations).format(names=name)
+            text = f"{prefix}💍 Напоминание о годовщине свадьбы!\n\n{congratulation}\n\nСегодня {years} лет вместе! 🎉"
+            try:
+                await self.notification_ledger.send_once(
+                    chat_id, NotificationLedger.event_id(WEDDINGS, name), day, lambda: send(text)
+                )
+            except Exception as e:
+                if is_chat_unavailable(e):
+                    raise ChatUnavailable(chat_id) from e
+                logger.error("Ошибка отправки уведомления о свадьбе в чат %s: %s", chat_id, e, extra={'chat_id': chat_id})
+        
+        # День обработан, только если все поздравления подтверждены в журнале отправок
+        return self.notification_ledger.all_sent(chat_id, event_ids, day)
     
-    def run_scheduler(self):
-        """Запускает планировщик в отдельном потоке"""
-        while True:
-            schedule.run_pending()
-            time.sleep(60)
+    async def post_init(self, application: Application):
+        """Запускает планировщик уведомлений и снимков в цикле событий приложения"""
+        self.scheduler.start()
+        self.loop_monitor.start()
+        self.snapshots.start()
     
-    def start_scheduler_thread(self):
-        """Запускает планировщик в отдельном потоке"""
-        scheduler_thread = threading.Thread(target=self.run_scheduler, daemon=True)
-        scheduler_thread.start()
+    async def post_shutdown(self, application: Application):
+        """Останавливает планировщик и сохраняет последний снимок при завершении"""
+        await self.scheduler.stop()
+        await self.loop_monitor.stop()
+        await self.snapshots.stop()
     
     async def run_webhook(self):
         """Запускает бота с использованием веб-хуков"""
         if not self.bot_token:
-            print("❌ Ошибка: BOT_TOKEN не найден в переменных окружения!")
-            print("Создайте файл .env и добавьте туда ваш токен бота:")
-            print("BOT_TOKEN=your_bot_token_here")
+            logger.error("❌ Ошибка: BOT_TOKEN не найден в переменных окружения! "
+                         "Создайте файл .env и добавьте туда ваш токен бота: BOT_TOKEN=your_bot_token_here")
             return
         
         if not self.webhook_url:
-            print("❌ Ошибка: WEBHOOK_URL не найден в переменных окружения!")
-            print("Добавьте WEBHOOK_URL в файл .env или в переменные окружения Render:")
-            print("WEBHOOK_URL=https://your-app-name.onrender.com")
+            logger.error("❌ Ошибка: WEBHOOK_URL не найден в переменных окружения! Добавьте WEBHOOK_URL "
+                         "в файл .env или в переменные окружения Render: WEBHOOK_URL=https://your-app-name.onrender.com")
             return
         
-        # Используем только базовые классы без Application.builder()
-        from telegram import Bot, Update
-        from aiohttp import web
-        
-        # Создаем бота напрямую
-        bot = Bot(token=self.bot_token)
-        
-        # Настройка веб-хука
-        webhook_path = "telegram"
-        webhook_url = f"{self.webhook_url}/{webhook_path}"
-        
-        # Выводим отладочную информацию
-        print(f"🔄 Настройка веб-хука: {webhook_url}")
-        print(f"🔄 Порт: {self.port}")
-        
-        # Настраиваем планировщик уведомлений
-        self.schedule_notifications()
-        self.start_scheduler_thread()
-        
-        # Запуск веб-хука
-        print(f"🤖 Бот запущен на веб-хуке: {webhook_url}")
-        print(f"📋 Доступные команды: /start, /add, /list, /delete, /today, /upcoming, /add_wedding, /list_weddings, /delete_wedding, /today_weddings, /upcoming_weddings, /help")
+        # Бот с общим пулом соединений и лимитером; обновления получает веб-хук, а не Updater
+        self.application = (
+            Application.builder()
+            .bot(create_bot(self.bot_token))
+            .updater(None)
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+            .build()
+        )
+        self.bot = self.application.bot
+        
+        # Регистрируем обработчики команд
+        self.application.add_handler(CommandHandler("start", self.start))
+        self.application.add_handler(CommandHandler("help", self.help_command))
+        
+        # Дни рождения
+        self.application.add_handler(CommandHandler("add", self.add_birthday))
+        self.application.add_handler(CommandHandler("list", self.list_birthdays))
+        self.application.add_handler(CommandHandler("delete", self.delete_birthday))
+        self.application.add_handler(CommandHandler("today", self.today_birthdays))
+        self.application.add_handler(CommandHandler("upcoming", self.upcoming_birthdays))
+        
+        # Свадьбы
+        self.application.add_handler(CommandHandler("add_wedding", self.add_wedding))
+        self.application.add_handler(CommandHandler("list_weddings", self.list_weddings))
+        self.application.add_handler(CommandHandler("delete_wedding", self.delete_wedding))
+        self.application.add_handler(CommandHandler("today_weddings", self.today_weddings))
+        self.application.add_handler(CommandHandler("upcoming_weddings", self.upcoming_weddings))
+        
+        # Уведомления
+        self.application.add_handler(CommandHandler("enable_notifications", self.enable_notifications))
+        self.application.add_handler(CommandHandler("notify_mode", self.notify_mode))
+        self.application.add_handler(CommandHandler("restore", self.restore_snapshot))
+        
+        # Кнопки
+        self.application.add_handler(CallbackQueryHandler(self.button_callback))
+        # Замер времени обработчиков (метрики и журнал медленных обработчиков)
+        trace_handlers(self.application)
+        
+        logger.info("🔄 Порт: %s", self.port)
+        logger.info("📋 Доступные команды: /start, /add, /list, /delete, /today, /upcoming, /add_wedding, /list_weddings, /delete_wedding, /today_weddings, /upcoming_weddings, /notify_mode, /restore, /help")
         
         # Явно указываем порт из переменной окружения
         port = int(os.environ.get("PORT", self.port))
-        print(f"🔄 Запуск на порту: {port}")
-        
-        # Устанавливаем веб-хук
-        await bot.set_webhook(url=webhook_url)
-        
-        # Создаем словарь обработчиков команд
-        command_handlers = {
-            'start': self.start,
-            'help': self.help_command,
-            'add': self.add_birthday,
-            'list': self.list_birthdays,
-            'delete': self.delete_birthday,
-            'today': self.today_birthdays,
-            'upcoming': self.upcoming_birthdays,
-            'enable_notifications': self.enable_notifications,
-            'add_wedding': self.add_wedding,
-            'list_weddings': self.list_weddings,
-            'delete_wedding': self.delete_wedding,
-            'today_weddings': self.today_weddings,
-            'upcoming_weddings': self.upcoming_weddings
-        }
-        
-        # Запускаем веб-приложение с aiohttp
-        async def webhook_handler(request):
-            try:
-                # Получаем данные запроса
-                update_data = await request.json()
-                
-                # Создаем объект Update из JSON
-                update = Update.de_json(data=update_data, bot=bot)
-                
-                # Создаем контекст вручную
-                from telegram.ext import CallbackContext
-                context = CallbackContext.from_update(update, bot)
-                
-                # Обрабатываем команды
-                if update.message and update.message.text and update.message.text.startswith('/'):
-                    command = update.message.text.split(' ')[0][1:].split('@')[0]
-                    if command in command_handlers:
-                        await command_handlers[command](update, context)
-                
-                # Обрабатываем callback-запросы
-                if update.callback_query:
-                    await self.button_callback(update, context)
-                
-                # Возвращаем успешный ответ
-                return web.Response()
-            except Exception as e:
-                print(f"❌ Ошибка обработки запроса: {e}")
-                return web.Response(status=500)
-        
-        # Создаем веб-приложение
-        app = web.Application()
-        app.router.add_post(f"/{webhook_path}", webhook_handler)
-        
-        # Создаем обработчик для проверки работоспособности
-        async def health_check(request):
-            return web.Response(text="Бот работает!")
-        
-        # Добавляем маршрут для проверки работоспособности
-        app.router.add_get("/", health_check)
-        
-        try:
-            # Запускаем веб-сервер
-            runner = web.AppRunner(app)
-            await runner.setup()
-            site = web.TCPSite(runner, "0.0.0.0", port)
-            await site.start()
-            print(f"🌐 Веб-сервер запущен на порту {port}")
-            
-            # Держим приложение запущенным
-            while True:
-                await asyncio.sleep(3600)  # Проверка каждый час
-                
-        except Exception as e:
-            print(f"❌ Ошибка: {e}")
-        finally:
-            # Останавливаем приложение при выходе
-            await runner.cleanup()
+        # Обработчикам нужны только сообщения и нажатия кнопок
+        await serve_webhook(self.application, self.webhook_url, port, self.current_dir,
+                            allowed_updates=['message', 'callback_query'])
 
 if __name__ == "__main__":
+    setup_logging()
+    create_env_file()
+    log_environment()
     bot = BirthdayBot()
     asyncio.run(bot.run_webhook()) 
\ No newline at end of file
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Очередь обработки входящих обновлений веб-хука.
+
+Обработчик веб-хука только разбирает обновление, кладет его в очередь
+и сразу отвечает Telegram 200 OK. Обновления обрабатывают WEBHOOK_WORKERS
+асинхронных воркеров. У каждого воркера своя очередь, и все обновления
+одного чата попадают к одному воркеру, поэтому внутри чата порядок
+сохраняется, а разные чаты обрабатываются параллельно.
+
+Если очередь воркера заполнена (WEBHOOK_QUEUE_SIZE обновлений на всех
+воркеров), submit возвращает False и веб-хук отвечает 503 с Retry-After -
+Telegram повторит доставку позже.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, List, Optional
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+UpdateProcessor = Callable[[Update], Awaitable]
+
+
+class UpdateDispatcher:
+    """Пул воркеров с очередями по чатам и ограничением размера очереди"""
+
+    def __init__(self, process: UpdateProcessor, workers: Optional[int] = None,
+                 queue_size: Optional[int] = None):
+        self.process = process
+        self.workers = max(1, workers or int(os.getenv('WEBHOOK_WORKERS', '8')))
+        queue_size = queue_size or int(os.getenv('WEBHOOK_QUEUE_SIZE', '512'))
+        self.queue_size_per_worker = max(1, queue_size // self.workers)
+        # Через сколько секунд Telegram стоит повторить доставку при переполнении
+        self.retry_after = int(os.getenv('WEBHOOK_RETRY_AFTER', '1'))
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self.processed = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def start(self):
+        """Запускает воркеры в текущем цикле событий"""
+        if self._tasks:
+            return
+        self._queues = [asyncio.Queue(maxsize=self.queue_size_per_worker) for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+
+    @staticmethod
+    def shard_key(update: Update) -> int:
+        """Ключ распределения: чат обновления (или пользователь, или само обновление)"""
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+        return update.update_id
+
+    def submit(self, update: Update) -> bool:
+        """Ставит обновление в очередь; False - очередь заполнена"""
+        queue = self._queues[hash(self.shard_key(update)) % self.workers]
+        try:
+            queue.put_nowait(update)
+            return True
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+
+    def pending(self) -> int:
+        """Количество обновлений, ожидающих обработки"""
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            update = await queue.get()
+            try:
+                await self.process(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.exception("❌ Ошибка обработки обновления %s: %s", update.update_id, e,
+                                 extra={'update_id': update.update_id})
+            finally:
+                queue.task_done()
+
+    async def stop(self, timeout: float = 10):
+        """Дожидается обработки очереди (не дольше timeout) и останавливает воркеры"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ Не обработано обновлений при остановке: %s", self.pending())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Веб-хук для Application из python-telegram-bot.
+
+Обновления от Telegram проходят тот же граф обработчиков, что и при
+polling (команды, сообщения, правки, кнопки): веб-хук проверяет повтор
+доставки, ставит обновление в очередь UpdateDispatcher и сразу отвечает
+200 OK, а воркеры вызывают application.process_update. Поэтому любой бот
+на Application можно развернуть на веб-хуке без отдельной маршрутизации.
+
+Чужие запросы отсекаются до разбора: веб-хук регистрируется с
+secret_token, и запрос без правильного заголовка
+X-Telegram-Bot-Api-Secret-Token или с телом больше WEBHOOK_MAX_BODY байт
+отклоняется, не читая тело. Обновления типов, которых нет в
+allowed_updates, подтверждаются без создания Update и обработки.
+
+GET /stats - состояние пула и очереди в JSON, GET /metrics - метрики
+в формате Prometheus (metrics.py).
+
+    application = Application.builder().bot(create_bot(token)).updater(None).build()
+    application.add_handler(CommandHandler('start', start))
+    await serve_webhook(application, webhook_url, port, state_dir)
+"""
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+from typing import FrozenSet, Optional, Sequence, Tuple
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application, CommandHandler
+
+import codec
+import metrics
+from update_dedup import UpdateDeduplicator
+from webhook_queue import UpdateDispatcher
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def update_labels(update: Update, commands: FrozenSet[str]) -> Tuple[str, str]:
+    """Метки метрик обновления: (тип, команда); неизвестные команды - 'other'"""
+    update_type = next((kind for kind in Update.ALL_TYPES if getattr(update, kind, None) is not None), 'unknown')
+    message = update.effective_message
+    text = (message.text or '') if message else ''
+    if not text.startswith('/'):
+        return update_type, ''
+    command = text.split()[0][1:].split('@')[0].lower()
+    return update_type, command if command in commands else 'other'
+
+
+def _register_metrics(bot, dispatcher: UpdateDispatcher, deduplicator: UpdateDeduplicator):
+    """Значения очереди веб-хука и пула соединений, считываемые при запросе /metrics"""
+    metrics.register_callback('webhook_queue_pending', 'Обновления в очереди обработки', dispatcher.pending)
+    metrics.register_callback('webhook_updates_processed_total', 'Обработанные обновления',
+                              lambda: dispatcher.processed, type='counter')
+    metrics.register_callback('webhook_updates_rejected_total', 'Отклоненные обновления (очередь заполнена)',
+                              lambda: dispatcher.rejected, type='counter')
+    metrics.register_callback('webhook_updates_failed_total', 'Обновления, обработка которых упала',
+                              lambda: dispatcher.failed, type='counter')
+    metrics.register_callback('webhook_updates_duplicate_total', 'Повторные доставки обновлений',
+                              lambda: deduplicator.duplicates, type='counter')
+
+    pool_stats = getattr(bot.request, 'pool_stats', None)
+    if pool_stats is not None:
+        metrics.register_callback(
+            'telegram_pool_requests', 'Запросы к Bot API: на соединении (in_use) и в очереди пула (waiting)',
+            lambda: {(state,): pool_stats()[state] for state in ('in_use', 'waiting')}, labels=('state',))
+        metrics.register_callback('telegram_pool_connections_opened_total', 'Открытые TCP-соединения',
+                                  lambda: pool_stats()['connections_opened'], type='counter')
+
+
+def webhook_secret(token: str) -> str:
+    """Секрет веб-хука: WEBHOOK_SECRET или производный от токена (одинаковый у всех экземпляров)"""
+    secret = os.getenv('WEBHOOK_SECRET')
+    if secret:
+        return secret
+    return hashlib.sha256(f"webhook:{token}".encode()).hexdigest()
+
+
+def create_webhook_app(bot, dispatcher: UpdateDispatcher, deduplicator: UpdateDeduplicator, secret: bytes,
+                       max_body: int, wanted: Optional[FrozenSet[str]] = None,
+                       path: str = 'telegram') -> web.Application:
+    """Приложение aiohttp веб-хука: прием обновлений, /stats, /metrics и проверка живости"""
+
+    async def webhook_handler(request):
+        # Проверки до чтения тела: чужой запрос не стоит ни разбора, ни памяти
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, '').encode(), secret):
+            return web.Response(status=403)
+        if request.content_length is not None and request.content_length > max_body:
+            return web.Response(status=413)
+
+        try:
+            update_data = codec.loads(await request.read())
+
+            # Повторная доставка уже принятого обновления - подтверждаем без обработки
+            if deduplicator.seen(update_data['update_id']):
+                return web.Response()
+
+            # Ненужный тип обновления - подтверждаем, не создавая Update
+            if wanted is not None and wanted.isdisjoint(update_data):
+                return web.Response()
+
+            update = Update.de_json(data=update_data, bot=bot)
+        except web.HTTPRequestEntityTooLarge:
+            return web.Response(status=413)
+        except Exception as e:
+            logger.warning("❌ Некорректный запрос веб-хука: %s", e)
+            return web.Response(status=400)
+
+        # Ставим обновление в очередь и сразу отвечаем Telegram
+        if not dispatcher.submit(update):
+            # Очередь заполнена - Telegram повторит доставку позже
+            return web.Response(status=503, headers={'Retry-After': str(dispatcher.retry_after)})
+        deduplicator.add(update.update_id)
+        return web.Response()
+
+    async def health_check(request):
+        return web.Response(text="Бот работает!")
+
+    # Состояние пула соединений и очереди обновлений
+    async def stats(request):
+        pool_stats = getattr(bot.request, 'pool_stats', None)
+        return web.json_response({
+            'pool': pool_stats() if pool_stats else {},
+            'updates': {
+                'pending': dispatcher.pending(),
+                'processed': dispatcher.processed,
+                'rejected': dispatcher.rejected,
+                'failed': dispatcher.failed,
+                'duplicates': deduplicator.duplicates,
+            },
+        })
+
+    async def metrics_handler(request):
+        return web.Response(text=metrics.render(), content_type='text/plain')
+
+    # Тело без Content-Length (chunked) ограничивается при чтении
+    app = web.Application(client_max_size=max_body)
+    app.router.add_post(f"/{path}", webhook_handler)
+    app.router.add_get("/", health_check)
+    app.router.add_get("/stats", stats)
+    app.router.add_get("/metrics", metrics_handler)
+
+    return app
+
+
+async def serve_webhook(application: Application, webhook_url: str, port: int, state_dir: str,
+                        path: str = 'telegram', allowed_updates: Optional[Sequence[str]] = None):
+    """Запускает application на веб-хуке и работает до остановки процесса.
+
+    allowed_updates - типы обновлений, которые нужны обработчикам
+    (например ['message', 'callback_query']); None - все типы.
+    """
+    bot = application.bot
+    secret = webhook_secret(bot.token).encode()
+    max_body = int(os.getenv('WEBHOOK_MAX_BODY', str(256 * 1024)))
+    wanted = frozenset(allowed_updates) if allowed_updates else None
+
+    # Тот же порядок запуска, что у Application.run_webhook
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+
+    url = f"{webhook_url}/{path}"
+    logger.info("🔄 Настройка веб-хука: %s", url)
+    await bot.set_webhook(url=url, secret_token=secret.decode(),
+                          allowed_updates=list(allowed_updates) if allowed_updates else None)
+    await application.start()
+
+    # Обработанные update_id: повторные доставки Telegram не выполняются дважды
+    deduplicator = UpdateDeduplicator(os.path.join(state_dir, 'processed_updates.ring'))
+
+    # Команды обработчиков: метки метрик не растут от произвольного текста
+    commands = frozenset(
+        command for handlers in application.handlers.values() for handler in handlers
+        if isinstance(handler, CommandHandler) for command in handler.commands
+    )
+
+    async def process_update(update: Update):
+        labels = update_labels(update, commands)
+        metrics.UPDATES.inc(*labels)
+        with metrics.UPDATE_SECONDS.time(*labels):
+            await application.process_update(update)
+
+    # Пул воркеров: порядок внутри чата сохраняется, разные чаты - параллельно
+    dispatcher = UpdateDispatcher(process_update)
+    dispatcher.start()
+    _register_metrics(bot, dispatcher, deduplicator)
+
+    app = create_webhook_app(bot, dispatcher, deduplicator, secret, max_body, wanted, path)
+    runner = web.AppRunner(app)
+    try:
+        await runner.setup()
+        site = web.TCPSite(runner, "0.0.0.0", port)
+        await site.start()
+        logger.info("🌐 Веб-сервер запущен на порту %s", port)
+        logger.info("🤖 Бот запущен на веб-хуке: %s", url)
+
+        # Держим приложение запущенным
+        await asyncio.Event().wait()
+    except Exception as e:
+        logger.exception("❌ Ошибка: %s", e)
+    finally:
+        # Сначала дорабатываем принятые обновления, затем останавливаем приложение
+        await dispatcher.stop()
+        deduplicator.close()
+        await runner.cleanup()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)